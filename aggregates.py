@@ -0,0 +1,101 @@
+"""
+Running invoice totals per tenant and per department.
+
+Every invoice write adjusts small aggregate documents in
+``users/<id>/invoice_stats``: one for the whole tenant and one per
+department, each holding the invoice count, the sums of ``final_total``
+and ``gst_amount`` and the same three numbers per ``YYYY-MM`` month of
+``invoice_date``. Dashboards read these instead of counting invoices.
+
+This module only does the arithmetic; the stores apply the deltas in the
+same transaction as the invoice write.
+"""
+import re
+
+FIELDS = ("count", "final_total", "gst_amount")
+
+_MONTH_RE = re.compile(r"^\d{4}-\d{2}")
+
+
+def empty_stats(department_name=None):
+    """Aggregate document with nothing counted yet."""
+    return {"department_name": department_name, **dict.fromkeys(FIELDS, 0), "months": {}}
+
+
+def invoice_month(invoice):
+    """``YYYY-MM`` bucket of an invoice, or None without a valid ``invoice_date``."""
+    date = invoice.get("invoice_date") or ""
+    return date[:7] if _MONTH_RE.match(date) else None
+
+
+def _amount(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def invoice_deltas(old=None, new=None):
+    """
+    Changes to apply when an invoice goes from ``old`` to ``new``.
+
+    Pass ``old=None`` for a create and ``new=None`` for a delete. Returns
+    ``{scope: {bucket: {field: delta}}}`` where ``scope`` is None for the
+    whole tenant or a department name, and ``bucket`` is None for the
+    all-time totals or a month. Buckets that do not change are left out.
+    """
+    deltas = {}
+    for invoice, sign in ((old, -1), (new, 1)):
+        if invoice is None:
+            continue
+        amounts = {
+            "count": 1,
+            "final_total": _amount(invoice.get("final_total")),
+            "gst_amount": _amount(invoice.get("gst_amount")),
+        }
+        month = invoice_month(invoice)
+        scopes = [None, *dict.fromkeys(invoice.get("departments") or [])]
+        for scope in scopes:
+            for bucket in (None, month) if month else (None,):
+                delta = deltas.setdefault(scope, {}).setdefault(bucket, dict.fromkeys(FIELDS, 0))
+                for field in FIELDS:
+                    delta[field] += sign * amounts[field]
+
+    changed = {}
+    for scope, buckets in deltas.items():
+        buckets = {b: d for b, d in buckets.items() if any(d.values())}
+        if buckets:
+            changed[scope] = buckets
+    return changed
+
+
+def merge_deltas(total, deltas):
+    """Add ``invoice_deltas`` output into ``total`` (same shape) in place."""
+    for scope, buckets in deltas.items():
+        for bucket, delta in buckets.items():
+            target = total.setdefault(scope, {}).setdefault(bucket, dict.fromkeys(FIELDS, 0))
+            for field in FIELDS:
+                target[field] += delta[field]
+    return total
+
+
+def apply_deltas(stats, buckets):
+    """Add one scope's ``{bucket: {field: delta}}`` to an aggregate document in place."""
+    for bucket, delta in buckets.items():
+        target = stats if bucket is None else stats["months"].setdefault(bucket, dict.fromkeys(FIELDS, 0))
+        for field in FIELDS:
+            # Money is kept to the paisa so repeated float additions do not drift
+            target[field] = round(target.get(field, 0) + delta[field], 2)
+        if bucket is not None and target["count"] <= 0:
+            del stats["months"][bucket]
+    return stats
+
+
+def summarize(invoices):
+    """Aggregate documents ``{scope: stats}`` rebuilt from scratch."""
+    stats = {}
+    for invoice in invoices:
+        for scope, buckets in invoice_deltas(new=invoice).items():
+            apply_deltas(stats.setdefault(scope, empty_stats(scope)), buckets)
+    stats.setdefault(None, empty_stats())
+    return stats
@@ -1,38 +1,233 @@
 import base64
-from flask import Flask, render_template, request, redirect, url_for, send_file, flash,session
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
+from flask import Flask, render_template, request, redirect, url_for, send_file, flash,session, Response, g
 from datetime import datetime, timedelta
 import io
+import json
+import logging
 import os
-import firebase_admin
-from firebase_admin import credentials, firestore
+import signal
+import time
+import uuid
 from dotenv import load_dotenv
-from werkzeug.security import generate_password_hash, check_password_hash
+import click
+
+import metrics
+from aggregates import summarize
+from blobstore import create_blob_store
+from bulk_export import BATCH_SIZE, PoolRenderer, render_pool, zip_stream
+from exports import INVOICE_EXPORT_FIELDS, csv_stream, invoice_rows, xlsx_stream
+from fanout import gather
+from gst_report import GROUPS, REPORT_FIELDS, GSTReport, financial_year_start, normalize_gstin, valid_gstin
+from imports import ImportFileError, parse_json, parse_upload, validate_invoice
+from instrumentation import InstrumentedStore, begin_request, end_request, request_stats
+from invoice_totals import TOTAL_FIELDS, compute_totals, parse_item, total_mismatches
+from jobs import JobQueue, PermanentJobError, job_handler, start_workers
+from logos import (
+    LogoError, get_logo_assets, load_pdf_variants, prepare_logo, read_upload, save_logo, store_logo, variant_key
+)
+from mailer import create_transport, invoice_message
+from page_cache import COMPRESS_MIN_SIZE, COMPRESSIBLE_TYPES, PageCache, choose_encoding, compress
+from passwords import check_password, hash_password
+from pdf_cache import PDFCache, render_key
+from search import GRAM_LENGTH, MATCH_MODES, client_query, client_search_fields, name_matches, search_term
+from storage import INVOICE_SUMMARY_FIELDS, MAX_IN_FILTER, EmailTaken, create_store
+from tenants import get_tenant_context, invalidate_tenant
 
 # ------------------------
-# Firebase Initialization
+# Load .env file
 # ------------------------
-cred = credentials.Certificate("serviceAccountKey.json")  # <-- Your secure key file
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+load_dotenv()
+
+# ------------------------
+# Datastore Initialization
+# ------------------------
+# DATASTORE=firestore (default, uses serviceAccountKey.json) or DATASTORE=sqlite
+# Wrapped so every route's reads, writes and datastore time are measured.
+# Credentials are read and connections opened on first use, in each process
+db = InstrumentedStore(create_store())
+
+# Logos and rendered PDFs, keyed by content hash (BLOB_STORE_DIR, default ./blob_store)
+blobs = create_blob_store()
+pdf_cache = PDFCache(blobs)
+
+# Background jobs (JOB_QUEUE_PATH, default ./job_queue.db) run by `flask run-worker`,
+# and the mail transport they send invoices with (MAIL_TRANSPORT, default file)
+job_queue = JobQueue()
+mail_transport = create_transport()
+
+# Rendered invoice, dashboard and admin users pages (PAGE_CACHE_SIZE, PAGE_CACHE_TTL),
+# staled by the write routes through page_cache.bump; the version stamps live
+# in the datastore so every worker sees every write
+page_cache = PageCache(db)
 
 # ------------------------
 # Flask App Setup
 # ------------------------
+# The WSGI entry point is the module-level app:
+#
+#     gunicorn app:app --workers 4 --preload
+#
+# The stores above are only configured at import: the datastore client, job
+# queue connection, blob directory and PDF pool are created on first use in
+# each worker, after gunicorn has forked it, so --preload shares the
+# imported code without sharing connections and no credentials are needed
 app = Flask(__name__)
 app.secret_key = "supersecretkey"
 
+ADMIN_EMAIL = os.getenv("ADMIN_EMAIL")     # e.g. admin@gmail.com
+ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
+
+# "pool" renders single invoice PDFs in the bulk export process pool instead
+# of the request thread (the default under asgi.py)
+PDF_RENDER_MODE = os.getenv("PDF_RENDER_MODE", "inline")
+
+# Optional bearer token required by /metrics
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "50"))
+# Invoices read per datastore query by the CSV/XLSX export
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+MAX_PAGE_SIZE = 200
+
+# User fields shown on the admin users page (no password hash or legacy logo blob)
+ADMIN_USER_FIELDS = [
+    "owner_name", "email", "company_name", "company_address",
+    "phone_no", "company_gst", "logo_hash"
+]
 
 # ------------------------
-# Load .env file
+# Request Logging & Metrics
 # ------------------------
-load_dotenv()
-ADMIN_EMAIL = os.getenv("ADMIN_EMAIL")     # e.g. admin@gmail.com
-ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    format="%(asctime)s %(levelname)s %(name)s %(message)s"
+)
+request_log = logging.getLogger("smart_invoice.requests")
+
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16]
+    g.stats_token = begin_request()
+
+
+@app.after_request
+def record_request_metrics(response):
+    stats = request_stats()
+    if stats is None:
+        return response
+
+    route = request.endpoint or "unknown"
+    elapsed = time.perf_counter() - g.request_started
+
+    metrics.HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    metrics.HTTP_LATENCY.observe(elapsed, route=route)
+    metrics.DATASTORE_READS.inc(stats.reads, route=route)
+    metrics.DATASTORE_WRITES.inc(stats.writes, route=route)
+    metrics.DATASTORE_READS_PER_REQUEST.observe(stats.reads, route=route)
+    metrics.DATASTORE_LATENCY.observe(stats.seconds, route=route)
+
+    response.headers["X-Request-ID"] = g.request_id
+    request_log.info(
+        "request_id=%s method=%s route=%s status=%s duration_ms=%.1f "
+        "reads=%d writes=%d datastore_ms=%.1f",
+        g.request_id, request.method, route, response.status_code, elapsed * 1000,
+        stats.reads, stats.writes, stats.seconds * 1000
+    )
+    return response
+
 
+@app.teardown_request
+def end_request_metrics(exc):
+    token = g.pop("stats_token", None)
+    if token is not None:
+        end_request(token)
 
 
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus text exposition of this worker's metrics."""
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return "Unauthorized", 401
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+# ------------------------
+# Page Cache & Compression
+# ------------------------
+# Page cache scopes: everything a tenant owns, one invoice, and the list of users
+def tenant_scope(user_id):
+    return f"tenant:{user_id}"
+
+
+def invoice_scope(doc_id):
+    return f"invoice:{doc_id}"
+
+
+USERS_SCOPE = "users"
+
+
+def cached_page(key, scopes, build):
+    """
+    Serve a page from ``page_cache``, building it on a miss.
+
+    The stamps of ``scopes`` are taken before ``build(depends_on)`` reads
+    anything; it calls ``depends_on(*scopes)`` for scopes it only learns
+    from its reads (an invoice's owner) before reading their data, and gets
+    back their stamps. It returns the page's HTML, or any other response
+    (a redirect), which is returned as is and not cached.
+
+    Builders must not read per-process caches that are older than the
+    page's stamps: the tenant context is passed its ``tenant:`` stamp so a
+    copy cached before another worker's edit is reloaded.
+    """
+    page = page_cache.get(key)
+    metrics.PAGE_CACHE_REQUESTS.inc(route=request.endpoint, result="hit" if page else "miss")
+    if page is None:
+        stamps = page_cache.stamps(scopes)
+
+        def depends_on(*more):
+            missing = [scope for scope in more if scope not in stamps]
+            if missing:
+                stamps.update(page_cache.stamps(missing))
+            return [stamps[scope] for scope in more]
+
+        html = build(depends_on)
+        if not isinstance(html, str):
+            return html
+        page = page_cache.put(key, html, stamps)
+
+    encoding = choose_encoding(request.accept_encodings) if len(page.body) >= COMPRESS_MIN_SIZE else None
+    response = Response(page.encoded(encoding) if encoding else page.body, mimetype="text/html")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    # Each encoding is a different representation, so it gets its own ETag
+    response.set_etag(f"{page.etag}-{encoding}" if encoding else page.etag)
+    response.last_modified = page.last_modified
+    # Pages are per session: browsers may keep them but must revalidate
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@app.after_request
+def compress_response(response):
+    """Gzip (or brotli) text responses the page cache did not already encode."""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(request.accept_encodings)
+    body = response.get_data()
+    if encoding is None or len(body) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(compress(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
 
 @app.route("/", methods=["GET"])
 def index():
@@ -51,37 +246,37 @@ def register():
         password = request.form.get("password")
 
         # -----------------------------
-        # CHECK EMAIL ALREADY EXISTS
+        # VALIDATE LOGO UPLOAD
+        # (stored in the blob store once the user is saved)
         # -----------------------------
-        existing = db.collection("users").where("email", "==", email).stream()
-        if any(existing):
-            flash("Email already registered!", "error")
+        try:
+            logo_bytes = read_upload(request.files.get("logo"))
+            logo = prepare_logo(blobs, logo_bytes) if logo_bytes else None
+        except LogoError as e:
+            flash(str(e), "error")
             return redirect(url_for("register"))
 
-        # -----------------------------
-        # HANDLE LOGO UPLOAD → BASE64
-        # -----------------------------
-        import base64
-
-        logo_file = request.files.get("logo")
-        logo_base64 = None
-
-        if logo_file:
-            logo_base64 = base64.b64encode(logo_file.read()).decode("utf-8")
-
         # -----------------------------
         # SAVE USER TO FIRESTORE
+        # (claims the email index entry in the same transaction)
         # -----------------------------
-        db.collection("users").add({
-            "owner_name": owner_name,
-            "email": email,
-            "company_name": company_name,
-            "company_address": company_address,
-            "phone_no": phone_no,
-            "company_gst": company_gst,
-            "password": generate_password_hash(password),
-            "logo_base64": logo_base64   # <-- STORE BASE64 LOGO
-        })
+        try:
+            db.add_user({
+                "owner_name": owner_name,
+                "email": email,
+                "company_name": company_name,
+                "company_address": company_address,
+                "phone_no": phone_no,
+                "company_gst": company_gst,
+                "password": hash_password(password),
+                "logo_hash": logo[0] if logo else None   # <-- logo itself lives in the blob store
+            })
+        except EmailTaken:
+            flash("Email already registered!", "error")
+            return redirect(url_for("register"))
+        if logo:
+            store_logo(blobs, logo)
+        page_cache.bump(USERS_SCOPE)
 
         flash("Registration successful! Please login.", "success")
         return redirect(url_for("login"))
@@ -109,24 +304,20 @@ def login():
         # ----------------------------------------
         # USER LOGIN CHECK (FIRESTORE)
         # ----------------------------------------
-        user_docs = db.collection("users").where("email", "==", email).stream()
-        user = None
-        for doc in user_docs:
-            user = doc.to_dict()
-            user["id"] = doc.id
+        user = db.find_user_by_email(email, fields=["password", "owner_name"])
 
         if not user:
             flash("Email not found!", "error")
             return redirect(url_for("login"))
 
         # Check user password (hashed)
-        if not check_password_hash(user["password"], password):
+        if not check_password(user["password"], password):
             flash("Incorrect Password!", "error")
             return redirect(url_for("login"))
 
         # Save user session
         session["role"] = "user"
-        session["user_id"] = user["id"]
+        session["user_id"] = user["user_id"]
         session["owner_name"] = user["owner_name"]
 
         flash("User login successful!", "success")
@@ -141,6 +332,90 @@ def logout():
     return redirect(url_for("login"))
 
 
+# ------------------------
+# Cursor Pagination
+# ------------------------
+def encode_cursor(invoice):
+    """Opaque page token for the (created_by, doc_id) position of an invoice."""
+    raw = json.dumps([invoice.get("created_by"), invoice["doc_id"]])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        created_by, doc_id = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except (ValueError, TypeError):
+        return None
+    return created_by, doc_id
+
+
+def match_mode(value):
+    """Search mode from a request argument (see ``search.MATCH_MODES``); substring by default."""
+    return value if value in MATCH_MODES else "contains"
+
+
+def customer_filter(text, mode):
+    """
+    ``(client_search, check)`` for a customer search box.
+
+    ``client_search`` is the indexed filter for the store (None without a
+    term) and ``check(invoice)`` confirms its candidates, or is None when
+    the index match is already exact.
+    """
+    term = search_term(text)
+    if mode == "contains" and 0 < len(term) < GRAM_LENGTH:
+        # Too short for the gram index: check every invoice for the substring
+        return None, lambda inv: name_matches(inv.get("client_name"), term, mode)
+    query = client_query(term, mode)
+    if query is None or query.exact:
+        return query, None
+    return query, lambda inv: name_matches(inv.get("client_name"), term, mode)
+
+
+def fetch_invoice_page(page_size, after=None, before=None, created_by_in=None, keep=None,
+                       client_search=None):
+    """
+    Read one page of invoices ordered by (created_by, doc_id).
+
+    Reads ``page_size + 1`` rows per round trip; the extra row tells us whether
+    another page exists. ``keep`` filters rows that cannot be pushed into the
+    query, in which case further batches are read until the page is full.
+    Returns ``(invoices, has_prev, has_next)``.
+    """
+    backwards = before is not None
+    cursor = before if backwards else after
+    rows = []
+
+    while len(rows) <= page_size:
+        if backwards:
+            batch = db.page_invoices(page_size + 1, end_before=cursor, created_by_in=created_by_in,
+                                     client_search=client_search, fields=INVOICE_SUMMARY_FIELDS)
+        else:
+            batch = db.page_invoices(page_size + 1, start_after=cursor, created_by_in=created_by_in,
+                                     client_search=client_search, fields=INVOICE_SUMMARY_FIELDS)
+        if not batch:
+            break
+
+        matches = [inv for inv in batch if keep is None or keep(inv)]
+        if backwards:
+            rows = matches + rows
+            first = batch[0]
+        else:
+            rows = rows + matches
+            first = batch[-1]
+        cursor = (first.get("created_by"), first["doc_id"])
+
+        if len(batch) <= page_size:
+            break
+
+    more = len(rows) > page_size
+    if backwards:
+        return rows[-page_size:], more, True
+    return rows[:page_size], after is not None, more
+
+
 @app.route("/admin/dashboard", methods=["GET"])
 def admin_dashboard():
     if session.get("role") != "admin":
@@ -150,50 +425,86 @@ def admin_dashboard():
     # Filters
     filter_company = request.args.get("company", "").strip().lower()
     filter_customer = request.args.get("customer", "").strip().lower()
+    match = match_mode(request.args.get("match"))
 
-    # Fetch all users (companies)
-    user_docs = db.collection("users").stream()
-    companies = {doc.id: doc.to_dict() for doc in user_docs}
-
-    # Fetch all invoices
-    invoice_docs = db.collection("invoices").stream()
-    all_invoices = []
+    # Paging
+    try:
+        page_size = int(request.args.get("page_size", ADMIN_PAGE_SIZE))
+    except ValueError:
+        page_size = ADMIN_PAGE_SIZE
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    after = decode_cursor(request.args.get("after"))
+    before = decode_cursor(request.args.get("before"))
+
+    # Customer filter → indexed token query, plus a check for fuzzy candidates
+    client_search, check_customer = customer_filter(filter_customer, match)
+
+    # Company filter → restrict to matching company ids
+    created_by_in = None
+    company_ids = None
+    if filter_company:
+        company_term = search_term(filter_company)
+        company_ids = {
+            user["user_id"] for user in db.list_users(fields=["company_name"])
+            if name_matches(user.get("company_name"), company_term, match)
+        }
+        # Firestore cannot combine "in" with array_contains_any
+        if len(company_ids) <= MAX_IN_FILTER and not isinstance(getattr(client_search, "value", None), list):
+            created_by_in = sorted(company_ids)
 
-    for doc in invoice_docs:
-        data = doc.to_dict()
-        data["doc_id"] = doc.id
-        all_invoices.append(data)
+    def keep(inv):
+        if company_ids is not None and inv.get("created_by") not in company_ids:
+            return False
+        if check_customer is not None and not check_customer(inv):
+            return False
+        return True
 
-    # Apply Filters
-    if filter_company:
-        all_invoices = [
-            inv for inv in all_invoices
-            if companies.get(inv.get("created_by"), {})
-                .get("company_name", "").lower().startswith(filter_company)
-        ]
+    # Filters that could not be pushed into the query run on each batch
+    needs_keep = check_customer is not None or (company_ids is not None and created_by_in is None)
 
-    if filter_customer:
-        all_invoices = [
-            inv for inv in all_invoices
-            if inv.get("client_name", "").lower().startswith(filter_customer)
-        ]
+    if company_ids is not None and not company_ids:
+        page, has_prev, has_next = [], False, False
+    else:
+        page, has_prev, has_next = fetch_invoice_page(
+            page_size,
+            after=after,
+            before=before,
+            created_by_in=created_by_in,
+            keep=keep if needs_keep else None,
+            client_search=client_search,
+        )
+
+    # Fetch only the companies shown on this page
+    page_company_ids = {inv.get("created_by") for inv in page}
+    companies, company_stats = gather(
+        lambda: db.get_users(page_company_ids, fields=["company_name", "owner_name"]),
+        lambda: db.get_invoice_stats(page_company_ids),
+    )
 
-    # Group invoices company-wise
+    # Group invoices company-wise (page is already ordered by created_by)
     grouped_data = {}
-    for comp_id, comp in companies.items():
-        grouped_data[comp_id] = {
-            "company_name": comp.get("company_name", "(No Name)"),
-            "sub_company": comp.get("owner_name", ""),
-            "invoices": [
-                inv for inv in all_invoices if inv.get("created_by") == comp_id
-            ]
-        }
+    for inv in page:
+        comp_id = inv.get("created_by")
+        group = grouped_data.get(comp_id)
+        if group is None:
+            comp = companies.get(comp_id, {})
+            group = grouped_data[comp_id] = {
+                "company_name": comp.get("company_name", "(No Name)"),
+                "sub_company": comp.get("owner_name", ""),
+                "stats": company_stats.get(comp_id),
+                "invoices": []
+            }
+        group["invoices"].append(inv)
 
     return render_template(
         "admin_dashboard.html",
         grouped_data=grouped_data,
         filter_company=filter_company,
-        filter_customer=filter_customer
+        filter_customer=filter_customer,
+        match=match,
+        page_size=page_size,
+        prev_token=encode_cursor(page[0]) if page and has_prev else None,
+        next_token=encode_cursor(page[-1]) if page and has_next else None
     )
 
 @app.route("/admin/users")
@@ -202,15 +513,12 @@ def admin_users():
         flash("Unauthorized Access!", "error")
         return redirect(url_for("login"))
 
-    # Fetch all users
-    user_docs = db.collection("users").stream()
-    users = []
-    for doc in user_docs:
-        data = doc.to_dict()
-        data["user_id"] = doc.id
-        users.append(data)
+    def build(depends_on):
+        # Fetch all users
+        users = db.list_users(fields=ADMIN_USER_FIELDS)
+        return render_template("admin_users.html", users=users)
 
-    return render_template("admin_users.html", users=users)
+    return cached_page(("admin_users",), [USERS_SCOPE], build)
 
 
 @app.route("/admin/update_user/<string:user_id>", methods=["POST"])
@@ -227,13 +535,13 @@ def admin_update_user(user_id):
     phone_no = request.form.get("phone_no")
     company_gst = request.form.get("company_gst")
 
-    # Handle logo upload
-    import base64
-    logo_file = request.files.get("logo")
-    logo_base64 = None
-
-    if logo_file and logo_file.filename != "":
-        logo_base64 = base64.b64encode(logo_file.read()).decode("utf-8")
+    # Validate a logo upload; it is stored once the update is accepted
+    try:
+        logo_bytes = read_upload(request.files.get("logo"))
+        logo = prepare_logo(blobs, logo_bytes) if logo_bytes else None
+    except LogoError as e:
+        flash(str(e), "error")
+        return redirect(url_for("admin_users"))
 
     update_data = {
         "owner_name": owner_name,
@@ -245,15 +553,34 @@ def admin_update_user(user_id):
     }
 
     # update only if new logo uploaded
-    if logo_base64:
-        update_data["logo_base64"] = logo_base64
+    if logo:
+        update_data["logo_hash"] = logo[0]
 
-    db.collection("users").document(user_id).update(update_data)
+    try:
+        db.update_user(user_id, update_data)
+    except EmailTaken:
+        flash("Email already belongs to another user!", "error")
+        return redirect(url_for("admin_users"))
+    if logo:
+        store_logo(blobs, logo)
+    invalidate_tenant(user_id)
+    pdf_cache.invalidate_user(user_id)
+    page_cache.bump(tenant_scope(user_id), USERS_SCOPE)
 
     flash("User profile updated successfully!", "success")
     return redirect(url_for("admin_users"))
 
 
+def parse_date_arg(value):
+    """Return ``value`` if it is a ``YYYY-MM-DD`` date, else an empty string."""
+    value = (value or "").strip()
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        return ""
+    return value
+
+
 @app.route("/user/dashboard", methods=["GET", "POST"])
 def user_dashboard():
     if session.get("role") != "user":
@@ -261,91 +588,60 @@ def user_dashboard():
         return redirect(url_for("login"))
 
     user_id = session.get("user_id")
+    return cached_page(("user_dashboard", user_id, request.query_string), [tenant_scope(user_id)],
+                       lambda depends_on: build_user_dashboard(user_id, depends_on))
 
+
+def build_user_dashboard(user_id, depends_on):
     # -------------------------
     # FETCH FILTER INPUTS
     # -------------------------
     customer_name = request.args.get("customer_name", "").strip().lower()
-    from_date = request.args.get("from_date", "")
-    to_date = request.args.get("to_date", "")
+    match = match_mode(request.args.get("match"))
+    from_date = parse_date_arg(request.args.get("from_date", ""))
+    to_date = parse_date_arg(request.args.get("to_date", ""))
+    client_search, check_customer = customer_filter(customer_name, match)
 
     # -------------------------
-    # BASE QUERY
-    # -------------------------
-    invoice_query = db.collection("invoices").where("created_by", "==", user_id)
-
+    # FETCH IN PARALLEL:
+    # departments (with id), filtered invoices (customer index +
+    # invoice_date range) and the maintained aggregates
     # -------------------------
-    # FILTER BY CUSTOMER NAME
-    # -------------------------
-    if customer_name:
-        all_docs = invoice_query.stream()
-        invoice_list = []
-        for doc in all_docs:
-            data = doc.to_dict()
-            if customer_name in data.get("client_name", "").lower():
-                data["doc_id"] = doc.id
-                invoice_list.append(data)
-    else:
-        invoice_list = []
-        for doc in invoice_query.stream():
-            data = doc.to_dict()
-            data["doc_id"] = doc.id
-            invoice_list.append(data)
-
-    # -------------------------
-    # FILTER BY DATE RANGE
-    # -------------------------
-    def date_in_range(inv_date):
-        if not inv_date:
-            return False
-
-        try:
-            dt = datetime.strptime(inv_date, "%Y-%m-%d")
-        except:
-            return False
-
-        if from_date:
-            f_dt = datetime.strptime(from_date, "%Y-%m-%d")
-            if dt < f_dt:
-                return False
-
-        if to_date:
-            t_dt = datetime.strptime(to_date, "%Y-%m-%d")
-            if dt > t_dt:
-                return False
-
-        return True
-
-    if from_date or to_date:
-        invoice_list = [inv for inv in invoice_list if date_in_range(inv.get("invoice_date"))]
-
-    # -------------------------
-    # DEPARTMENTS (WITH ID)
-    # -------------------------
-    dep_docs = db.collection("users").document(user_id).collection("departments").stream()
-
-    departments = []
-    for d in dep_docs:
-        data = d.to_dict()
-        data["dep_id"] = d.id            # IMPORTANT
-        departments.append(data)
+    tenant_version, = depends_on(tenant_scope(user_id))
+    context, invoice_list, invoice_stats = gather(
+        lambda: get_tenant_context(db, user_id, version=tenant_version),
+        lambda: list(db.list_invoices(
+            created_by=user_id,
+            from_date=from_date or None,
+            to_date=to_date or None,
+            client_search=client_search,
+            fields=INVOICE_SUMMARY_FIELDS,
+        )),
+        lambda: db.list_invoice_stats(user_id),
+    )
+    if check_customer is not None:
+        invoice_list = [inv for inv in invoice_list if check_customer(inv)]
+    departments = context.departments if context else []   # each carries "dep_id"
 
     total_departments = len(departments)
-    total_invoices = len(invoice_list)
+    total_invoices = invoice_stats[None]["count"]
 
     # -------------------------
     # RETURN PAGE
     # -------------------------
-    return render_template(
+    html = render_template(
         "user_dashboard.html",
         invoices=invoice_list,
         departments=departments,  # FIXED
         total_departments=total_departments,
         total_invoices=total_invoices,
+        invoice_stats=invoice_stats,
         customer_name=customer_name,
+        match=match,
         from_date=from_date,
         to_date=to_date
     )
+    return html
 
 
 @app.route("/create_department", methods=["GET", "POST"])
@@ -362,12 +658,14 @@ def create_department():
         sub_company_name = request.form.get("sub_company_name")
 
         # Save department inside user's department collection
-        db.collection("users").document(user_id).collection("departments").add({
+        db.add_department(user_id, {
             "department_name": department_name,
             "sub_company_name": sub_company_name,
             "created_at": datetime.now(),
             "created_by": user_id
         })
+        invalidate_tenant(user_id)
+        page_cache.bump(tenant_scope(user_id))
 
         flash("Department Created Successfully!", "success")
         return redirect(url_for("user_dashboard"))
@@ -378,6 +676,22 @@ def create_department():
 
 
 
+def form_invoice_totals(taxes):
+    """Line items of the posted invoice form with server-computed totals, or None if invalid."""
+    try:
+        items = [
+            parse_item(name, quantity, unit_price)
+            for name, quantity, unit_price in zip(
+                request.form.getlist("item_name[]"),
+                request.form.getlist("quantity[]"),
+                request.form.getlist("unit_price[]"),
+            )
+        ]
+        return compute_totals(items, taxes)
+    except (ValueError, KeyError):
+        return None
+
+
 @app.route("/create_invoice", methods=["GET", "POST"])
 def create_invoice():
     if "user_id" not in session:
@@ -397,30 +711,34 @@ def create_invoice():
         client_po = request.form.get("client_po")
         client_address = request.form.get("client_address")
         client_phone = request.form.get("client_phone")
+        client_gstin = normalize_gstin(request.form.get("client_gstin"))
 
         departments = request.form.getlist("departments")
         taxes = request.form.getlist("taxes")
         notes = request.form.get("notes")
 
-        item_names = request.form.getlist("item_name[]")
-        quantities = request.form.getlist("quantity[]")
-        unit_prices = request.form.getlist("unit_price[]")
-        totals = request.form.getlist("total[]")
-
-        line_items = []
-        for i in range(len(item_names)):
-            line_items.append({
-                "item_name": item_names[i],
-                "quantity": int(quantities[i]),
-                "unit_price": float(unit_prices[i]),
-                "total": float(totals[i])
-            })
+        # Totals posted by the form are a preview; recompute them here
+        totals = form_invoice_totals(taxes)
+        if totals is None:
+            flash("Invalid line items or taxes.", "error")
+            return redirect(url_for("create_invoice"))
+        if client_gstin and not valid_gstin(client_gstin):
+            flash("Invalid client GSTIN.", "error")
+            return redirect(url_for("create_invoice"))
+
+        context = get_tenant_context(db, user_id)
+        if context is None:
+            flash("Please login first!", "error")
+            return redirect(url_for("login"))
 
-        subtotal = float(request.form.get("subtotal"))
-        gst_amount = float(request.form.get("gst_amount"))
-        final_total = float(request.form.get("final_total"))
+        # The number shown on the form is a preview; the serial is reserved
+        # only now, so abandoned forms leave no gaps in the series
+        if departments:
+            prefix = invoice_prefix(context.profile.get("company_name", ""), departments[0])
+            serial = db.allocate_invoice_serial(user_id, prefix, seed=lambda: highest_serial(user_id, prefix))
+            invoice_number = format_invoice_no(prefix, serial)
 
-        db.collection("invoices").add({
+        db.add_invoice({
             "invoice_no": invoice_number,
             "invoice_date": invoice_date,
             "due_date": due_date,
@@ -428,25 +746,26 @@ def create_invoice():
             "client_email": client_email,
             "client_po": client_po,
             "client_phone": client_phone,
+            "client_gstin": client_gstin,
             "client_address": client_address,
             "departments": departments,
             "taxes": taxes,
             "notes": notes,
-            "items": line_items,
-            "subtotal": subtotal,
-            "gst_amount": gst_amount,
-            "final_total": final_total,
+            **totals,
+            "company": company_snapshot(context, departments),
             "created_by": user_id,
-            "created_at": datetime.now()
+            "created_at": datetime.now(),
+            **client_search_fields(client_name)
         })
+        page_cache.bump(tenant_scope(user_id))
 
         flash("Invoice Created Successfully!", "success")
         return redirect(url_for("user_dashboard"))
 
     # ------------------------- GET (LOAD PAGE) -------------------------
 
-    dep_docs = db.collection("users").document(user_id).collection("departments").stream()
-    dynamic_departments = [doc.to_dict().get("department_name") for doc in dep_docs]
+    context = get_tenant_context(db, user_id)
+    dynamic_departments = [dep.get("department_name") for dep in (context.departments if context else [])]
 
     # When loading page, invoice_no is blank → user must select department first
     return render_template(
@@ -456,6 +775,29 @@ def create_invoice():
     )
 
 
+def parse_serial(invoice_no):
+    """Trailing serial of an invoice number ("ACM-SAL-1042" → 1042), or None."""
+    tail = (invoice_no or "").rsplit("-", 1)[-1]
+    return int(tail) if tail.isdigit() else None
+
+
+def serial_prefix(invoice_no):
+    """Prefix of an invoice number ("ACM-SAL-1042" → "ACM-SAL"), or None without a serial."""
+    if parse_serial(invoice_no) is None or "-" not in invoice_no:
+        return None
+    return invoice_no.rsplit("-", 1)[0]
+
+
+def highest_serial(user_id, prefix):
+    """Highest serial used so far under (user, prefix); scans their invoices."""
+    serials = [
+        parse_serial(inv.get("invoice_no"))
+        for inv in db.list_invoices(created_by=user_id, fields=["invoice_no"])
+        if serial_prefix(inv.get("invoice_no")) == prefix
+    ]
+    return max(serials, default=0)
+
+
 @app.route("/generate_invoice_no", methods=["POST"])
 def generate_invoice_no():
     if "user_id" not in session:
@@ -469,90 +811,162 @@ def generate_invoice_no():
         return {"error": "No department selected"}, 400
 
     # Fetch user details
-    user_data = db.collection("users").document(user_id).get().to_dict()
-    company_name = user_data.get("company_name", "")
-    company_prefix = company_name.replace(" ", "")[:3].upper()
+    context = get_tenant_context(db, user_id)
+    if context is None:
+        return {"error": "Unauthorized"}, 401
+    company_name = context.profile.get("company_name", "")
 
-    # Department prefix
-    dep_prefix = selected_dep.replace(" ", "")[:3].upper()
+    # Preview the next serial of the (user, prefix) counter without
+    # reserving it: create_invoice allocates the number when the invoice is
+    # saved. Counters missing because the backfill has not run are seeded
+    # from history once, which reserves nothing.
+    prefix = invoice_prefix(company_name, selected_dep)
+    last = db.get_invoice_serial(user_id, prefix)
+    if last is None:
+        last = highest_serial(user_id, prefix)
+        db.raise_invoice_serial(user_id, prefix, last)
 
-    # Fetch all invoices for this user
-    invoice_docs = db.collection("invoices") \
-        .where("created_by", "==", user_id) \
-        .stream()
+    return {"invoice_no": format_invoice_no(prefix, last + 1)}, 200
 
-    last_serial = 0
 
-    for doc in invoice_docs:
-        inv = doc.to_dict()
-        if selected_dep in inv.get("departments", []):
-            try:
-                serial = int(inv["invoice_no"][-3:])
-                if serial > last_serial:
-                    last_serial = serial
-            except:
-                pass
+def invoice_prefix(company_name, department):
+    """"Acme Traders", "Sales" → "ACM-SAL"; numbers with one prefix share one counter."""
+    company_prefix = company_name.replace(" ", "")[:3].upper()
+    dep_prefix = department.replace(" ", "")[:3].upper()
+    return f"{company_prefix}-{dep_prefix}"
+
 
-    new_serial = str(last_serial + 1).zfill(3)
+def format_invoice_no(prefix, serial):
+    """"ACM-SAL", 7 → "ACM-SAL-007"."""
+    return f"{prefix}-{str(serial).zfill(3)}"
 
-    invoice_no = f"{company_prefix}-{dep_prefix}-{new_serial}"
 
-    return {"invoice_no": invoice_no}, 200
+# ------------------------
+# Bulk Invoice Import
+# ------------------------
+@app.route("/invoices/import", methods=["POST"])
+def import_invoices():
+    """
+    Create many invoices from a JSON body or an uploaded CSV/JSON ``file``.
+
+    Every row is validated before anything is written; with ``dry_run=1``
+    nothing is. Invoices without an ``invoice_no`` are numbered from one
+    block reserved per number prefix. Returns a JSON report with the new ids
+    and the errors of each rejected row.
+    """
+    if session.get("role") != "user":
+        return {"error": "Unauthorized"}, 401
+    user_id = session["user_id"]
+
+    upload = request.files.get("file")
+    try:
+        if upload and upload.filename:
+            rows = parse_upload(upload.read(), upload.filename, upload.mimetype)
+        elif request.is_json:
+            rows = parse_json(request.get_data(as_text=True))
+        else:
+            return {"error": "Send a JSON body or a CSV/JSON file."}, 400
+    except ImportFileError as e:
+        return {"error": str(e)}, 400
+
+    context = get_tenant_context(db, user_id)
+    if context is None:
+        return {"error": "Unauthorized"}, 401
+    departments = {dep.get("department_name") for dep in context.departments}
+
+    # One pass over the rows; numbers already used (and the highest serial
+    # per prefix among them) are read once
+    used_numbers = set()
+    highest = {}
+
+    def note_serial(invoice):
+        prefix = serial_prefix(invoice.get("invoice_no"))
+        if prefix is not None:
+            highest[prefix] = max(highest.get(prefix, 0), parse_serial(invoice["invoice_no"]))
+
+    for inv in db.list_invoices(created_by=user_id, fields=["invoice_no"]):
+        used_numbers.add(inv.get("invoice_no"))
+        note_serial(inv)
+
+    errors = []
+    valid = []
+    for row, raw in rows:
+        invoice, row_errors = validate_invoice(raw, departments)
+        if invoice and invoice["invoice_no"]:
+            if invoice["invoice_no"] in used_numbers:
+                row_errors = [f"invoice_no {invoice['invoice_no']!r} is already used"]
+            else:
+                note_serial(invoice)
+            used_numbers.add(invoice["invoice_no"])
+        if row_errors:
+            errors.append({"row": row, "invoice_no": raw.get("invoice_no") or None, "errors": row_errors})
+        else:
+            valid.append((row, invoice))
+
+    if request.values.get("dry_run") == "1" or not valid:
+        return {"created": 0, "valid": len(valid), "errors": errors}, 200 if not errors else 422
+
+    # Keep counters above the serials in use, explicit rows of this file
+    # included, so the block reserved below cannot reuse one of them
+    for prefix, serial in highest.items():
+        db.raise_invoice_serial(user_id, prefix, serial)
+
+    # Number the rest from one reserved block per prefix
+    unnumbered = {}
+    company_name = context.profile.get("company_name", "")
+    for _, invoice in valid:
+        if not invoice["invoice_no"]:
+            unnumbered.setdefault(invoice_prefix(company_name, invoice["departments"][0]), []).append(invoice)
+    for prefix, invoices in unnumbered.items():
+        first = db.allocate_invoice_serial(user_id, prefix, count=len(invoices))
+        for serial, invoice in enumerate(invoices, start=first):
+            invoice["invoice_no"] = format_invoice_no(prefix, serial)
+
+    created_at = datetime.now()
+    ids = db.add_invoices([
+        {**invoice, "company": company_snapshot(context, invoice["departments"]),
+         "created_by": user_id, "created_at": created_at}
+        for _, invoice in valid
+    ])
+    page_cache.bump(tenant_scope(user_id))
+
+    created = []
+    for (row, invoice), doc_id in zip(valid, ids):
+        if doc_id:
+            created.append({"row": row, "invoice_no": invoice["invoice_no"], "doc_id": doc_id})
+        else:
+            errors.append({"row": row, "invoice_no": invoice["invoice_no"],
+                           "errors": ["not saved, the write failed; import this row again"]})
+    errors.sort(key=lambda e: e["row"])
+
+    return {"created": len(created), "invoices": created, "errors": errors}, 200 if not errors else 207
 
 
 @app.route("/invoice/<doc_id>")
 def view_invoice(doc_id):
+    return cached_page(("view_invoice", doc_id), [invoice_scope(doc_id)],
+                       lambda depends_on: build_invoice_page(doc_id, depends_on))
+
+
+def build_invoice_page(doc_id, depends_on):
     # Fetch invoice
-    doc = db.collection("invoices").document(doc_id).get()
-    if not doc.exists:
+    invoice = db.get_invoice(doc_id)
+    if invoice is None:
         flash("Invoice not found!", "error")
         return redirect(url_for("user_dashboard"))
-
-    invoice = doc.to_dict()
-    invoice["doc_id"] = doc.id
+    # The owner's profile and departments fill in a missing company snapshot
+    tenant_version, = depends_on(tenant_scope(invoice.get("created_by")))
 
     # Ensure items list exists
     if "items" not in invoice or not isinstance(invoice["items"], list):
         invoice["items"] = []
 
-    # Fetch logged-in user details (company info)
-    user_id = invoice.get("created_by")
-    user_doc = db.collection("users").document(user_id).get()
-
-    if user_doc.exists:
-        user_data = user_doc.to_dict()
-    else:
-        user_data = {}
-
-    # ---------------------------
-    # DETERMINE SUB-COMPANY
-    # ---------------------------
-    selected_departments = invoice.get("departments", [])
-    sub_company_name = None
-
-    dep_docs = db.collection("users").document(user_id).collection("departments").stream()
-    for dep in dep_docs:
-        dep_data = dep.to_dict()
-        if dep_data.get("department_name") in selected_departments:
-            sub_company_name = dep_data.get("sub_company_name")
-            break
-
-    # If no sub-company → fallback to main company
-    final_company_name = (
-        sub_company_name if sub_company_name else user_data.get("company_name", "Company")
-    )
-
     # ---------------------------
     # PREPARE COMPANY INFO
     # ---------------------------
-    company = {
-        "company_name": final_company_name,
-        "owner_name": user_data.get("owner_name", ""),
-        "address": user_data.get("company_address", ""),
-        "gst_no": user_data.get("company_gst", ""),
-        "email": user_data.get("email", ""),
-        "phone_no": user_data.get("phone_no", "Not Provided")
-    }
+    company, _ = invoice_company(invoice, tenant_version)
+    company = company or resolve_company({}, {}, invoice)
+    company["phone_no"] = company.get("phone_no") or "Not Provided"
 
     return render_template("view_invoice.html", invoice=invoice, company=company)
 @app.route("/invoice/<string:doc_id>/edit", methods=["GET", "POST"])
@@ -563,15 +977,12 @@ def edit_invoice(doc_id):
 
     user_id = session["user_id"]
 
-    doc_ref = db.collection("invoices").document(doc_id)
-    invoice_doc = doc_ref.get()
+    old_invoice = db.get_invoice(doc_id)
 
-    if not invoice_doc.exists:
+    if old_invoice is None:
         flash("Invoice not found!", "error")
         return redirect(url_for("user_dashboard"))
 
-    old_invoice = invoice_doc.to_dict()
-
     # ---------------- POST: SAVE UPDATED DATA ----------------
     if request.method == "POST":
 
@@ -584,44 +995,42 @@ def edit_invoice(doc_id):
             "client_email": request.form.get("client_email"),
             "client_po": request.form.get("client_po"),
             "client_phone": request.form.get("client_phone"),
+            "client_gstin": normalize_gstin(request.form.get("client_gstin")),
             "client_address": request.form.get("client_address"),
 
             "departments": request.form.getlist("departments"),
             "taxes": request.form.getlist("taxes"),
             "notes": request.form.get("notes"),
 
-            "subtotal": float(request.form.get("subtotal")),
-            "gst_amount": float(request.form.get("gst_amount")),
-            "final_total": float(request.form.get("final_total")),
-            "updated_at": datetime.now()
+            "updated_at": datetime.now(),
+            **client_search_fields(request.form.get("client_name"))
         }
 
-        # ---------------- LINE ITEMS ----------------
-        item_names = request.form.getlist("item_name[]")
-        quantities = request.form.getlist("quantity[]")
-        unit_prices = request.form.getlist("unit_price[]")
-        totals = request.form.getlist("total[]")
-
-        line_items = []
-        for i in range(len(item_names)):
-            line_items.append({
-                "item_name": item_names[i],
-                "quantity": int(quantities[i]),
-                "unit_price": float(unit_prices[i]),
-                "total": float(totals[i])
-            })
+        # ---------------- LINE ITEMS & TOTALS ----------------
+        totals = form_invoice_totals(updated_data["taxes"])
+        if totals is None:
+            flash("Invalid line items or taxes.", "error")
+            return redirect(url_for("edit_invoice", doc_id=doc_id))
+        if updated_data["client_gstin"] and not valid_gstin(updated_data["client_gstin"]):
+            flash("Invalid client GSTIN.", "error")
+            return redirect(url_for("edit_invoice", doc_id=doc_id))
+        updated_data.update(totals)
 
-        updated_data["items"] = line_items
+        context = get_tenant_context(db, old_invoice.get("created_by"))
+        if context is not None:
+            updated_data["company"] = company_snapshot(context, updated_data["departments"])
 
-        doc_ref.update(updated_data)
+        db.update_invoice(doc_id, updated_data)
+        pdf_cache.invalidate_invoice(old_invoice.get("created_by"), doc_id)
+        page_cache.bump(invoice_scope(doc_id), tenant_scope(old_invoice.get("created_by")))
 
         flash("Invoice Updated Successfully!", "success")
         return redirect(url_for("user_dashboard"))
 
     # ---------------- GET REQUEST ----------------
     # Fetch departments
-    dep_docs = db.collection("users").document(user_id).collection("departments").stream()
-    dynamic_departments = [d.to_dict().get("department_name") for d in dep_docs]
+    context = get_tenant_context(db, user_id)
+    dynamic_departments = [d.get("department_name") for d in (context.departments if context else [])]
 
     return render_template(
         "edit_invoice.html",
@@ -639,7 +1048,9 @@ def delete_invoice(doc_id):
         return redirect(url_for("login"))
 
     try:
-        db.collection("invoices").document(doc_id).delete()
+        db.delete_invoice(doc_id)
+        pdf_cache.invalidate_invoice(session["user_id"], doc_id)
+        page_cache.bump(invoice_scope(doc_id), tenant_scope(session["user_id"]))
         flash("Invoice deleted successfully!", "success")
     except:
         flash("Failed to delete invoice!", "error")
@@ -655,7 +1066,9 @@ def delete_department(dep_id):
     user_id = session["user_id"]
 
     try:
-        db.collection("users").document(user_id).collection("departments").document(dep_id).delete()
+        db.delete_department(user_id, dep_id)
+        invalidate_tenant(user_id)
+        page_cache.bump(tenant_scope(user_id))
         flash("Department deleted successfully!", "success")
     except:
         flash("Failed to delete department!", "error")
@@ -667,204 +1080,586 @@ def delete_department(dep_id):
 
 
 
+def company_logo(digest):
+    """Cached header/watermark images for a logo hash, or None."""
+    if not digest:
+        return None
+    return get_logo_assets(digest, lambda: load_pdf_variants(blobs, digest))
+
+
+@app.route("/logo/<string:digest>")
+def logo(digest):
+    """A stored logo variant (``?variant=thumb|header``, default header)."""
+    variant = request.args.get("variant", "header")
+    if variant not in ("thumb", "header") or not digest.isalnum():
+        return "Not found", 404
+
+    data = blobs.get(variant_key(digest, variant))
+    if data is None:
+        return "Not found", 404
+
+    response = Response(data, mimetype="image/png")
+    # Content-addressed: the bytes behind this URL never change
+    response.set_etag(f"{digest}-{variant}")
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+
+def resolve_company(user, sub_companies, invoice):
+    """
+    Company details printed on an invoice.
+
+    ``sub_companies`` maps department names to sub-company names (see
+    ``TenantContext``). The tenant's first department that is on the
+    invoice picks the sub-company; without one the main company name is used.
+    """
+    selected_departments = invoice.get("departments") or []
+    sub_company_name = next(
+        (sub for name, sub in sub_companies.items() if name in selected_departments), None
+    )
+
+    return {
+        "company_name": sub_company_name or user.get("company_name", "Company"),
+        "owner_name": user.get("owner_name", ""),
+        "address": user.get("company_address", ""),
+        "gst_no": user.get("company_gst", ""),
+        "email": user.get("email", ""),
+        "phone_no": user.get("phone_no", "")
+    }
+
+
+def company_snapshot(context, departments):
+    """
+    Company details and logo stored on an invoice when it is written.
+
+    Views and PDFs print the snapshot, so an invoice keeps the header it
+    was issued with after the profile or departments change, and needs
+    no department lookup to render.
+    """
+    company = resolve_company(context.profile, context.sub_companies, {"departments": departments})
+    return {**company, "logo_hash": context.profile.get("logo_hash")}
+
+
+def invoice_company(invoice, tenant_version=None):
+    """
+    ``(company, logo_hash)`` an invoice is printed with.
+
+    Invoices written before snapshots existed (see ``backfill-company-snapshots``)
+    are resolved from the owner's current profile, no older than
+    ``tenant_version`` when given; ``(None, None)`` if the owner no longer
+    exists.
+    """
+    snapshot = invoice.get("company")
+    if snapshot:
+        company = {k: v for k, v in snapshot.items() if k != "logo_hash"}
+        return company, snapshot.get("logo_hash")
+
+    context = get_tenant_context(db, invoice.get("created_by"), version=tenant_version)
+    if context is None:
+        return None, None
+    return resolve_company(context.profile, context.sub_companies, invoice), context.profile.get("logo_hash")
+
+
+def invoice_pdf(invoice, company, logo_hash, key, route):
+    """PDF bytes of an invoice from the cache, rendering and caching them on a miss."""
+    user_id = invoice.get("created_by")
+    pdf_bytes = pdf_cache.get(user_id, invoice["doc_id"], key)
+    if pdf_bytes is None:
+        started = time.perf_counter()
+        pdf_bytes = render_pdf(invoice, company, logo_hash)
+        metrics.PDF_RENDER_LATENCY.observe(time.perf_counter() - started, route=route)
+        pdf_cache.put(user_id, invoice["doc_id"], key, pdf_bytes)
+    return pdf_bytes
+
+
+def render_pdf(invoice, company, logo_hash):
+    """Render one invoice PDF here or, with PDF_RENDER_MODE=pool, in a worker process."""
+    # ReportLab is imported on the first render, not at startup
+    from pdf_render import render_batch, render_invoice_pdf
+
+    if PDF_RENDER_MODE != "pool":
+        return render_invoice_pdf(invoice, company, company_logo(logo_hash))
+
+    # The worker reads the logo from the blob store itself on its first miss
+    [(_, pdf_bytes)] = render_pool().submit(
+        render_batch, [(None, invoice, company)], logo_hash
+    ).result()
+    return pdf_bytes
+
+
 @app.route("/invoice/<string:doc_id>/download_pdf")
 def download_invoice_pdf(doc_id):
-    from reportlab.platypus import Table, TableStyle
-    from reportlab.lib import colors
-    from reportlab.lib.utils import ImageReader
-    import base64
-
-    # ---------- GENERIC WRAP ----------
-    def wrap_text(canvas_obj, text, x, y, max_width, font="Helvetica", font_size=11, line_height=14, center=False):
-        canvas_obj.setFont(font, font_size)
-        words = text.split()
-        line = ""
-        for word in words:
-            test = (line + " " + word).strip()
-            if canvas_obj.stringWidth(test, font, font_size) <= max_width:
-                line = test
-            else:
-                if center:
-                    canvas_obj.drawCentredString(x, y, line)
-                else:
-                    canvas_obj.drawString(x, y, line)
-                y -= line_height
-                line = word
-
-        if line:
-            if center:
-                canvas_obj.drawCentredString(x, y, line)
-            else:
-                canvas_obj.drawString(x, y, line)
-        return y
-
     # ---------- FETCH ----------
-    doc_ref = db.collection("invoices").document(doc_id).get()
-    if not doc_ref.exists:
+    invoice = db.get_invoice(doc_id)
+    if invoice is None:
         return "Invoice not found", 404
 
-    invoice = doc_ref.to_dict()
     user_id = invoice.get("created_by")
-    user = db.collection("users").document(user_id).get().to_dict()
+    company, logo_hash = invoice_company(invoice)
+    if company is None:
+        return "Invoice not found", 404
 
-    # *************** UPDATED COMPANY NAME ***************
-    selected_departments = invoice.get("departments", [])
-    sub_company_name = None
+    # ---------- CACHE / CONDITIONAL GET ----------
+    etag = render_key(invoice, company, logo_hash)
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        pdf_bytes = pdf_cache.get(user_id, doc_id, etag)
+        if pdf_bytes is None and request.args.get("async") == "1":
+            # Render on a job worker; the client polls and downloads again
+            return queue_job("render_invoice_pdf", {"doc_id": doc_id}, user_id)
+        if pdf_bytes is None:
+            pdf_bytes = invoice_pdf(invoice, company, logo_hash, etag, route="download_invoice_pdf")
 
-    dep_docs = db.collection("users").document(user_id).collection("departments").stream()
-    for dep in dep_docs:
-        dep_data = dep.to_dict()
-        if dep_data.get("department_name") in selected_departments:
-            sub_company_name = dep_data.get("sub_company_name")
-            break
+        response = send_file(
+            io.BytesIO(pdf_bytes),
+            as_attachment=True,
+            download_name=f"{invoice.get('invoice_no')}.pdf",
+            mimetype="application/pdf"
+        )
+
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
-    # FIXED: fallback variable was wrong before
-    final_company_name = (
-        sub_company_name if sub_company_name else user.get("company_name", "Company")
-    )
-    # ****************************************************
-
-    company_address = user.get("company_address", "")
-    company_email = user.get("email", "")
-    company_phone = user.get("phone_no", "")
-    owner_name = user.get("owner_name", "")
-    company_gst = user.get("company_gst", "")
-    logo_base64 = user.get("logo_base64")
-
-    # ---------- PDF SETUP ----------
-    pdf_buffer = io.BytesIO()
-    c = canvas.Canvas(pdf_buffer, pagesize=A4)
-    width, height = A4
-
-    # ---------- WATERMARK ----------
-    if logo_base64:
-        try:
-            img = ImageReader(io.BytesIO(base64.b64decode(logo_base64)))
-            c.saveState()
-            c.setFillAlpha(0.06)
-            c.drawImage(img, (width - 280) / 2, (height - 280) / 2, width=280, height=280, mask="auto")
-            c.restoreState()
-        except:
-            pass
-
-    # ---------- LOGO ON TOP ----------
-    if logo_base64:
-        try:
-            c.drawImage(ImageReader(io.BytesIO(base64.b64decode(logo_base64))),
-                        width / 2 - 40, height - 110,
-                        width=80, height=80,
-                        preserveAspectRatio=True, mask="auto")
-        except:
-            pass
-
-    # ---------- COMPANY NAME ----------
-    y_name = height - 145
-
-    # FIXED: previously used undefined variable company_name
-    y_name = wrap_text(c, final_company_name, width / 2, y_name,
-                       max_width=350, font="Helvetica-Bold",
-                       font_size=18, center=True, line_height=22)
-
-    # ---------- COMPANY ADDRESS ----------
-    y_name = wrap_text(c, company_address, width / 2, y_name - 15,
-                       max_width=380, font="Helvetica", font_size=11, center=True)
-
-    c.drawCentredString(width / 2, y_name - 15, f"Email: {company_email} | Phone: {company_phone}")
-
-    # ---------- INVOICE DETAILS ----------
-    y = height - 240
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(60, y, "Invoice Details:")
-    c.setFont("Helvetica", 11)
-    c.drawString(60, y - 20, f"Invoice No: {invoice.get('invoice_no')}")
-    c.drawString(60, y - 35, f"Invoice Date: {invoice.get('invoice_date')}")
-    c.drawString(60, y - 50, f"Due Date: {invoice.get('due_date')}")
-    c.drawString(60, y - 65, f"GSTIN: {company_gst}")
-
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(390, y - 60, "Customer Details:")
-
-    c.setFont("Helvetica", 11)
-    start_y = y - 75
-
-    wrapped_end_y = wrap_text(
-        c,
-        "Name: " + (invoice.get("client_name") or ""),
-        390,
-        start_y,
-        max_width=160,
-        font="Helvetica",
-        font_size=11
-    )
 
-    email_y = wrapped_end_y - 15
-    phone_y = email_y - 15
-    phone_p = phone_y - 15
-    address_y = phone_p - 15
-    
-    c.drawString(390, email_y, f"Email: {invoice.get('client_email')}")
-    c.drawString(390, phone_p, f"Phone: {invoice.get('client_phone')}")
-    c.drawString(390, phone_y, f"Purchase-order: {invoice.get('client_po')}")
-
-    wrap_text(
-        c,
-        "Address: " + (invoice.get("client_address") or ""),
-        390,
-        address_y,
-        max_width=160,
-        font="Helvetica",
-        font_size=11
+
+
+# ------------------------
+# Background Jobs
+# ------------------------
+def job_owner_allowed(owner):
+    return session.get("role") == "admin" or (owner is not None and session.get("user_id") == owner)
+
+
+def queue_job(kind, payload, owner):
+    """Enqueue a job for ``owner`` and answer 202 with where to poll it."""
+    job_id = job_queue.enqueue(kind, payload, owner=owner)
+    status_url = url_for("job_status", job_id=job_id)
+    response = app.response_class(
+        json.dumps({"job_id": job_id, "status": "queued", "status_url": status_url}),
+        status=202, mimetype="application/json"
     )
+    response.headers["Location"] = status_url
+    return response
+
+
+def load_job_invoice(payload):
+    invoice = db.get_invoice(payload["doc_id"])
+    if invoice is None:
+        raise PermanentJobError(f"Invoice {payload['doc_id']} not found")
+    company, logo_hash = invoice_company(invoice)
+    if company is None:
+        raise PermanentJobError(f"Owner of invoice {payload['doc_id']} not found")
+    return invoice, company, logo_hash
+
+
+@job_handler("render_invoice_pdf")
+def render_invoice_pdf_job(payload):
+    invoice, company, logo_hash = load_job_invoice(payload)
+    invoice_pdf(invoice, company, logo_hash, render_key(invoice, company, logo_hash), route="job")
+    return {"download_url": f"/invoice/{invoice['doc_id']}/download_pdf"}
+
+
+@job_handler("email_invoice")
+def email_invoice_job(payload):
+    invoice, company, logo_hash = load_job_invoice(payload)
+    pdf_bytes = invoice_pdf(invoice, company, logo_hash, render_key(invoice, company, logo_hash), route="job")
+    mail_transport.send(invoice_message(payload["to"], invoice, company, pdf_bytes))
+    return {"to": payload["to"]}
+
+
+@app.route("/invoice/<string:doc_id>/email", methods=["POST"])
+def email_invoice(doc_id):
+    """Queue an email of the invoice PDF to ``to`` (default: the client's address)."""
+    invoice = db.get_invoice(doc_id)
+    if invoice is None or not job_owner_allowed(invoice.get("created_by")):
+        return {"error": "Invoice not found"}, 404
+
+    to = (request.values.get("to") or invoice.get("client_email") or "").strip()
+    wants_json = request.accept_mimetypes.best == "application/json"
+    if "@" not in to:
+        if wants_json:
+            return {"error": "No valid email address"}, 400
+        flash("The invoice has no valid client email.", "error")
+        return redirect(url_for("view_invoice", doc_id=doc_id))
+
+    response = queue_job("email_invoice", {"doc_id": doc_id, "to": to}, invoice.get("created_by"))
+    if wants_json:
+        return response
+    flash(f"Invoice will be emailed to {to}.", "success")
+    return redirect(url_for("view_invoice", doc_id=doc_id))
+
+
+@app.route("/jobs/<string:job_id>")
+def job_status(job_id):
+    """Status of a background job queued by the current user."""
+    job = job_queue.get(job_id)
+    if job is None or not job_owner_allowed(job["owner"]):
+        return {"error": "Job not found"}, 404
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "error": job["error"],
+        "result": job["result"],
+    }
 
-    # ---------- TABLE ----------
-    data = [["Item/Service", "Qty", "Unit Price", "Total"]]
 
-    for item in invoice.get("items", []):
-        data.append([
-            item.get("item_name", ""),
-            item.get("quantity", ""),
-            f"{item.get('unit_price', 0):.2f}",
-            f"{item.get('total', 0):.2f}"
-        ])
+# ------------------------
+# Bulk PDF Export
+# ------------------------
+def invoice_pdf_files(user_ids, from_date=None, to_date=None, department=None):
+    """
+    Yield ``(file name, pdf bytes)`` for every matching invoice.
+
+    Invoices are printed with their company snapshot; each logo is read
+    from the blob store at most once. Cached renders are yielded
+    directly; misses are rendered on the process pool in batches of one
+    logo and written back to the PDF cache.
+    """
+    renderer = PoolRenderer()
+    used_names = set()
+    logos = {}
+
+    def file_name(invoice):
+        name = (invoice.get("invoice_no") or invoice["doc_id"]).replace("/", "-")
+        if name in used_names:
+            name = f"{name}_{invoice['doc_id']}"
+        used_names.add(name)
+        return f"{name}.pdf"
+
+    def collect(results):
+        for (name, user_id, doc_id, key), pdf_bytes in results:
+            pdf_cache.put(user_id, doc_id, key, pdf_bytes)
+            yield name, pdf_bytes
+
+    def submit(digest, batch):
+        # A logo is only read once something printed with it is rendered
+        if digest and digest not in logos:
+            logos[digest] = load_pdf_variants(blobs, digest)
+        return collect(renderer.submit(batch, digest, logos.get(digest)))
+
+    for user_id in user_ids:
+        batches = {}    # logo hash → pending render jobs
+        invoices = db.list_invoices(
+            created_by=user_id, from_date=from_date, to_date=to_date, department=department
+        )
+        for invoice in invoices:
+            company, digest = invoice_company(invoice)
+            if company is None:
+                continue
+            key = render_key(invoice, company, digest)
+            name = file_name(invoice)
+
+            pdf_bytes = pdf_cache.get(user_id, invoice["doc_id"], key)
+            if pdf_bytes is not None:
+                yield name, pdf_bytes
+                continue
+
+            batch = batches.setdefault(digest, [])
+            batch.append(((name, user_id, invoice["doc_id"], key), invoice, company))
+            if len(batch) == BATCH_SIZE:
+                yield from submit(digest, batches.pop(digest))
+
+        for digest, batch in batches.items():
+            yield from submit(digest, batch)
+
+    yield from collect(renderer.finish())
+
+
+@app.route("/invoices/export_pdfs")
+def export_invoice_pdfs():
+    """ZIP of invoice PDFs filtered by user (admin only), date range and department."""
+    role = session.get("role")
+    if role == "user":
+        user_ids = [session["user_id"]]
+    elif role == "admin":
+        user_id = request.args.get("user_id", "").strip()
+        user_ids = [user_id] if user_id else [u["user_id"] for u in db.list_users(fields=["company_name"])]
+    else:
+        flash("Unauthorized Access!", "error")
+        return redirect(url_for("login"))
 
-    table = Table(data, colWidths=[220, 70, 120, 120])
-    table.setStyle(TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
-        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-        ("ALIGN", (1, 1), (-1, -1), "CENTER"),
-    ]))
+    files = invoice_pdf_files(
+        user_ids,
+        from_date=parse_date_arg(request.args.get("from_date")) or None,
+        to_date=parse_date_arg(request.args.get("to_date")) or None,
+        department=request.args.get("department", "").strip() or None,
+    )
 
-    y_table = y - 180
-    table.wrapOn(c, width, height)
-    table.drawOn(c, 40, y_table - len(data) * 20)
+    return Response(
+        zip_stream(files),
+        mimetype="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="invoices.zip"'}
+    )
 
-    y_tot = y_table - len(data) * 20 - 40
 
-    c.drawRightString(450, y_tot, "Subtotal:")
-    c.drawRightString(550, y_tot, f"Rs. {invoice.get('subtotal', 0):.2f}")
+# ------------------------
+# CSV / XLSX Export
+# ------------------------
+EXPORT_FORMATS = {
+    "csv": (csv_stream, "text/csv; charset=utf-8"),
+    "xlsx": (xlsx_stream, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+
+def export_invoices_iter(user_ids, fields, check=None, **filters):
+    """Invoices of each user in turn, read in ``EXPORT_BATCH_SIZE`` pages."""
+    for user_id in user_ids:
+        invoices = db.list_invoices(
+            created_by=user_id, fields=fields, batch_size=EXPORT_BATCH_SIZE, **filters
+        )
+        yield from (inv for inv in invoices if check is None or check(inv))
+
+
+@app.route("/invoices/export")
+def export_invoices():
+    """
+    Invoices as CSV or XLSX, one row per invoice or, with ``items=1``, per
+    line item. Takes the dashboard filters: customer (with ``match``) and
+    date range, plus company name or ``user_id`` for admins. Rows are streamed while
+    the invoices are paged through, so the size of the export is unbounded.
+    """
+    role = session.get("role")
+    match = match_mode(request.args.get("match"))
+    if role == "user":
+        user_id = session["user_id"]
+        context = get_tenant_context(db, user_id)
+        company_names = {user_id: context.profile.get("company_name", "") if context else ""}
+    elif role == "admin":
+        company_term = search_term(request.args.get("company", ""))
+        filter_user = request.args.get("user_id", "").strip()
+        company_names = {
+            user["user_id"]: user.get("company_name", "")
+            for user in db.list_users(fields=["company_name"])
+            if (not filter_user or user["user_id"] == filter_user)
+            and (not company_term or name_matches(user.get("company_name"), company_term, match))
+        }
+    else:
+        flash("Unauthorized Access!", "error")
+        return redirect(url_for("login"))
 
-    c.drawRightString(450, y_tot - 18, "GST:")
-    c.drawRightString(550, y_tot - 18, f"Rs. {invoice.get('gst_amount', 0):.2f}")
+    export_format = request.args.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        export_format = "csv"
+    stream, mimetype = EXPORT_FORMATS[export_format]
+    with_items = request.args.get("items") == "1"
+
+    customer = request.args.get("customer", request.args.get("customer_name", ""))
+    client_search, check_customer = customer_filter(customer, match)
+    invoices = export_invoices_iter(
+        sorted(company_names),
+        INVOICE_EXPORT_FIELDS + (["items"] if with_items else []),
+        check=check_customer,
+        from_date=parse_date_arg(request.args.get("from_date")) or None,
+        to_date=parse_date_arg(request.args.get("to_date")) or None,
+        client_search=client_search,
+    )
 
-    c.setFont("Helvetica-Bold", 12)
-    c.drawRightString(450, y_tot - 38, "Final Total:")
-    c.drawRightString(550, y_tot - 38, f"Rs. {invoice.get('final_total', 0):.2f}")
+    file_name = f"invoice_items.{export_format}" if with_items else f"invoices.{export_format}"
+    return Response(
+        stream(invoice_rows(invoices, company_names, with_items)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'}
+    )
 
-    c.setFont("Helvetica-Oblique", 11)
-    c.drawRightString(550, y_tot - 85, "Signature & Stamp")
-    c.drawRightString(550, y_tot - 100, owner_name)
 
-    c.save()
-    pdf_buffer.seek(0)
+@app.route("/reports/gst")
+def gst_report():
+    """
+    GST summary of a tenant's invoices from ``from_date`` to ``to_date``
+    (default: the financial year to date) per tax rate, ``group`` (month or
+    quarter), department and client GSTIN. HTML, or JSON with
+    ``format=json``; admins choose the tenant with ``user_id`` (the admin
+    users page links each one). Invoices are read in ``EXPORT_BATCH_SIZE``
+    pages and aggregated as they arrive.
+    """
+    role = session.get("role")
+    if role == "user":
+        user_id = session["user_id"]
+    elif role == "admin" and request.args.get("user_id", "").strip():
+        user_id = request.args["user_id"].strip()
+    elif role == "admin":
+        if request.args.get("format") == "json":
+            return {"error": "user_id is required"}, 400
+        return redirect(url_for("admin_users"))
+    else:
+        flash("Unauthorized Access!", "error")
+        return redirect(url_for("login"))
 
-    return send_file(
-        pdf_buffer,
-        as_attachment=True,
-        download_name=f"{invoice.get('invoice_no')}.pdf",
-        mimetype="application/pdf"
+    context = get_tenant_context(db, user_id)
+    if context is None:
+        if request.args.get("format") == "json":
+            return {"error": "Unknown user"}, 404
+        flash("User not found!", "error")
+        return redirect(url_for("login"))
+
+    today = datetime.now().date()
+    from_date = parse_date_arg(request.args.get("from_date")) or financial_year_start(today).isoformat()
+    to_date = parse_date_arg(request.args.get("to_date")) or today.isoformat()
+    report = GSTReport(request.args.get("group", "month")).add_all(
+        export_invoices_iter([user_id], REPORT_FIELDS, from_date=from_date, to_date=to_date)
     )
 
+    data = {
+        "user_id": user_id,
+        "company_name": context.profile.get("company_name", ""),
+        "company_gst": context.profile.get("company_gst", ""),
+        "from_date": from_date,
+        "to_date": to_date,
+        **report.as_dict(),
+    }
+    if request.args.get("format") == "json":
+        return data
+    return render_template("gst_report.html", report=data, groups=GROUPS, role=role)
+
 
+# ------------------------
+# Maintenance Commands
+# ------------------------
+@app.cli.command("backfill-search")
+def backfill_search():
+    """Add client search fields to invoices written before they existed."""
+    updated = 0
+    for inv in db.list_invoices(fields=["client_name", *client_search_fields("")]):
+        fields = client_search_fields(inv.get("client_name"))
+        if all(inv.get(k) == v for k, v in fields.items()):
+            continue
+        db.update_invoice(inv["doc_id"], fields)
+        updated += 1
+    print(f"Updated {updated} invoices.")
+
+
+@app.cli.command("backfill-company-snapshots")
+def backfill_company_snapshots():
+    """Store the company snapshot on invoices written before snapshots existed."""
+    updated = 0
+    for inv in db.list_invoices(fields=["created_by", "departments", "company"]):
+        if inv.get("company"):
+            continue
+        context = get_tenant_context(db, inv.get("created_by"))
+        if context is None:
+            continue
+        db.update_invoice(inv["doc_id"], {"company": company_snapshot(context, inv.get("departments") or [])})
+        page_cache.bump(invoice_scope(inv["doc_id"]))
+        updated += 1
+    print(f"Updated {updated} invoices.")
+
+
+@app.cli.command("migrate-logos")
+def migrate_logos():
+    """Move base64 logos out of user documents into the blob store."""
+    moved = failed = 0
+    for user in db.list_users(fields=["logo_base64"]):
+        logo_base64 = user.get("logo_base64")
+        if not logo_base64:
+            continue
+        try:
+            digest = save_logo(blobs, base64.b64decode(logo_base64))
+        except (LogoError, ValueError) as e:
+            failed += 1
+            print(f"User {user['user_id']}: {e}")
+            continue
+        db.update_user(user["user_id"], {"logo_hash": digest, "logo_base64": None})
+        invalidate_tenant(user["user_id"])
+        pdf_cache.invalidate_user(user["user_id"])
+        page_cache.bump(tenant_scope(user["user_id"]), USERS_SCOPE)
+        moved += 1
+    print(f"Moved {moved} logos, {failed} failed.")
+
+
+@app.cli.command("rebuild-invoice-stats")
+@click.option("--user", "user_id", help="Only rebuild this user's aggregates.")
+def rebuild_invoice_stats(user_id):
+    """Recompute invoice aggregates from the invoices themselves."""
+    user_ids = [user_id] if user_id else [u["user_id"] for u in db.list_users(fields=["company_name"])]
+    for uid in user_ids:
+        invoices = db.list_invoices(
+            created_by=uid, fields=["final_total", "gst_amount", "invoice_date", "departments"]
+        )
+        stats = summarize(invoices)
+        db.replace_invoice_stats(uid, stats)
+        print(f"{uid}: {stats[None]['count']} invoices, {len(stats) - 1} departments")
+
+
+@app.cli.command("backfill-email-index")
+def backfill_email_index():
+    """Add login email index entries for users registered before it existed."""
+    indexed = conflicts = 0
+    for user in db.list_users(fields=["email"]):
+        if not user.get("email"):
+            continue
+        if db.index_user_email(user["user_id"], user["email"]):
+            indexed += 1
+        else:
+            conflicts += 1
+            print(f"Email {user['email']} of user {user['user_id']} belongs to another user.")
+    print(f"Indexed {indexed} users, {conflicts} conflicts.")
+
+
+@app.cli.command("revalidate-invoice-totals")
+@click.option("--fix", is_flag=True, help="Store the recomputed totals on mismatching invoices.")
+def revalidate_invoice_totals(fix):
+    """Recompute every invoice's totals and report the ones that differ."""
+    checked = mismatched = failed = 0
+    fields = ["invoice_no", "created_by", "items", "taxes", *TOTAL_FIELDS]
+    for inv in db.list_invoices(fields=fields, batch_size=EXPORT_BATCH_SIZE):
+        checked += 1
+        try:
+            mismatches = total_mismatches(inv)
+        except (ValueError, KeyError) as e:
+            failed += 1
+            print(f"{inv['doc_id']} {inv.get('invoice_no')}: cannot recompute ({e})")
+            continue
+        if not mismatches:
+            continue
+        mismatched += 1
+        for field, stored, expected in mismatches:
+            print(f"{inv['doc_id']} {inv.get('invoice_no')}: {field} stored {stored}, expected {expected}")
+        if fix:
+            db.update_invoice(inv["doc_id"], compute_totals(inv["items"], inv.get("taxes") or []))
+            pdf_cache.invalidate_invoice(inv.get("created_by"), inv["doc_id"])
+            page_cache.bump(invoice_scope(inv["doc_id"]), tenant_scope(inv.get("created_by")))
+
+    action = "fixed" if fix else "mismatched"
+    print(f"Checked {checked} invoices: {mismatched} {action}, {failed} could not be recomputed.")
+
+
+@app.cli.command("backfill-invoice-counters")
+def backfill_invoice_counters():
+    """Seed invoice number counters from the invoices already stored."""
+    highest = {}
+    for inv in db.list_invoices(fields=["invoice_no", "created_by"]):
+        prefix = serial_prefix(inv.get("invoice_no"))
+        if prefix is None:
+            continue
+        key = (inv.get("created_by"), prefix)
+        highest[key] = max(highest.get(key, 0), parse_serial(inv["invoice_no"]))
+
+    for (user_id, prefix), serial in highest.items():
+        db.raise_invoice_serial(user_id, prefix, serial)
+    print(f"Seeded {len(highest)} counters.")
+
+
+@app.cli.command("run-worker")
+@click.option("--processes", default=1, show_default=True, help="Worker processes to start.")
+def run_worker_command(processes):
+    """Run background jobs (PDF rendering, invoice emails) until interrupted."""
+    workers, stop = start_workers(__name__, processes)
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    print(f"Started {processes} job workers.")
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for worker in workers:
+            worker.join()
 
 
 # ------------------------
@@ -0,0 +1,23 @@
+"""
+ASGI entry point.
+
+    uvicorn asgi:application --workers 4
+
+Flask stays a WSGI app; uvicorn's WSGI adapter runs each request on one of
+``ASGI_THREADS`` threads per worker, so many slow, I/O-bound requests can
+be in flight at once while the event loop only moves bytes. Within a
+request, independent datastore reads already run concurrently
+(``fanout.gather``), and single PDF renders go to the process pool so
+CPU-bound layout work does not hold the GIL for every other request.
+"""
+import os
+
+from uvicorn.middleware.wsgi import WSGIMiddleware
+
+os.environ.setdefault("PDF_RENDER_MODE", "pool")
+
+from app import app  # noqa: E402
+
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", "64"))
+
+application = WSGIMiddleware(app, workers=ASGI_THREADS)
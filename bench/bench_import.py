@@ -0,0 +1,82 @@
+"""
+Benchmark app startup: importing ``app`` and serving the first request.
+
+Each run is a fresh interpreter, like a gunicorn worker boot or an
+autoscaled cold start. Reports the time to import the app, the time to
+answer the first request after that and the whole process lifetime, plus
+which heavy libraries the import pulled in (none should be: they load on
+first use). The import uses the Firestore backend with credentials that
+do not exist, to check that the app imports without them.
+
+    python bench/bench_import.py
+    python bench/bench_import.py --runs 20 -o import.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Libraries that should only load when a route needs them
+HEAVY_MODULES = ["firebase_admin", "google.cloud.firestore", "grpc", "reportlab", "PIL"]
+
+CHILD = """
+import json, sys, time
+t0 = time.perf_counter()
+import app
+imported = time.perf_counter()
+heavy = [m for m in {heavy!r} if m in sys.modules]
+app.app.test_client().get("/login")
+served = time.perf_counter()
+print(json.dumps({{"import_ms": (imported - t0) * 1000, "first_request_ms": (served - imported) * 1000,
+                  "heavy_modules": heavy}}))
+"""
+
+
+def run_once():
+    env = {
+        **os.environ,
+        "DATASTORE": "firestore",
+        "FIREBASE_CREDENTIALS": os.path.join(ROOT, "bench", "missing-credentials.json"),
+        "LOG_LEVEL": "WARNING",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    }
+    t0 = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD.format(heavy=HEAVY_MODULES)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - t0) * 1000
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10, help="fresh interpreters to time")
+    parser.add_argument("-o", "--output", default="bench_import.json", help="JSON results file")
+    args = parser.parse_args(argv)
+
+    run_once()  # warm-up: fills the bytecode and OS file caches
+    runs = [run_once() for _ in range(args.runs)]
+
+    results = {"runs": args.runs, "heavy_modules": runs[-1]["heavy_modules"]}
+    print(f"{'phase':<22}{'p50 ms':>10}{'min ms':>10}{'max ms':>10}")
+    for phase in ("import_ms", "first_request_ms", "process_ms"):
+        samples = sorted(r[phase] for r in runs)
+        results[phase] = {"p50": statistics.median(samples), "min": samples[0], "max": samples[-1]}
+        r = results[phase]
+        print(f"{phase[:-3]:<22}{r['p50']:>10.2f}{r['min']:>10.2f}{r['max']:>10.2f}")
+    print(f"heavy modules loaded by the import: {', '.join(results['heavy_modules']) or 'none'}")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nSaved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
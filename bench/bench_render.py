@@ -0,0 +1,96 @@
+"""
+Benchmark PDF rendering on its own, outside any request.
+
+Renders invoices of growing length with and without a logo and reports
+latency percentiles and output size, saved as JSON.
+
+    python bench/bench_render.py
+    python bench/bench_render.py --items 5,50,500 --runs 20 -o render.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from logos import build_logo_assets, logo_variants  # noqa: E402
+from pdf_render import render_invoice_pdf  # noqa: E402
+
+COMPANY = {
+    "company_name": "Bench Company Pvt Ltd",
+    "owner_name": "Bench Owner",
+    "address": "12 Long Industrial Estate Road, Near The Old Market, Test City 400001",
+    "gst_no": "27AAAAA0000A1Z5",
+    "email": "owner@bench.local",
+    "phone_no": "9999999999",
+}
+
+
+def make_invoice(item_count):
+    items = [
+        {"item_name": f"Professional services line {n}", "quantity": n % 9 + 1,
+         "unit_price": 250.0, "total": 250.0 * (n % 9 + 1)}
+        for n in range(item_count)
+    ]
+    subtotal = sum(item["total"] for item in items)
+    return {
+        "invoice_no": "BEN-SAL-001",
+        "invoice_date": "2025-04-01",
+        "due_date": "2025-04-30",
+        "client_name": "Acme Traders",
+        "client_email": "accounts@acme.local",
+        "client_po": "PO-1",
+        "client_phone": "8888888888",
+        "client_address": "1 Client Road, Client City",
+        "items": items,
+        "subtotal": subtotal,
+        "gst_amount": round(subtotal * 0.18, 2),
+        "final_total": round(subtotal * 1.18, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", default="1,10,50,200", help="comma separated line item counts")
+    parser.add_argument("--runs", type=int, default=20, help="renders per case")
+    parser.add_argument("-o", "--output", default="bench_render.json", help="JSON results file")
+    args = parser.parse_args(argv)
+
+    with open(os.path.join(ROOT, "static", "company_logo.jpg"), "rb") as f:
+        variants = logo_variants(f.read())
+    logo = build_logo_assets((variants["header"], variants["watermark"]))
+
+    results = {}
+    print(f"{'case':<22}{'p50 ms':>10}{'p90 ms':>10}{'max ms':>10}{'KB':>10}")
+    for count in [int(c) for c in args.items.split(",") if c]:
+        invoice = make_invoice(count)
+        for with_logo in (False, True):
+            render_invoice_pdf(invoice, COMPANY, logo if with_logo else None)  # warm-up
+            samples = []
+            for _ in range(args.runs):
+                t0 = time.perf_counter()
+                pdf = render_invoice_pdf(invoice, COMPANY, logo if with_logo else None)
+                samples.append((time.perf_counter() - t0) * 1000)
+            samples.sort()
+            case = f"{count} items" + (" + logo" if with_logo else "")
+            results[case] = {
+                "runs": args.runs,
+                "p50_ms": statistics.median(samples),
+                "p90_ms": samples[int(0.9 * (len(samples) - 1))],
+                "max_ms": samples[-1],
+                "pdf_bytes": len(pdf),
+            }
+            r = results[case]
+            print(f"{case:<22}{r['p50_ms']:>10.2f}{r['p90_ms']:>10.2f}{r['max_ms']:>10.2f}{r['pdf_bytes'] / 1024:>10.1f}")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nSaved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+Benchmark the request hot paths against a seeded local datastore.
+
+Runs the Flask test client against a fresh in-memory SQLite store for each
+data size and reports latency percentiles, throughput and datastore
+reads/writes per request. Results are printed and saved as JSON so runs
+can be compared before a deploy. Routes marked * called store methods
+whose cost is an estimate (see ``instrumentation.ESTIMATED``).
+
+    python bench/bench_routes.py
+    python bench/bench_routes.py --sizes 10,100,1000,10000,100000 --requests 50
+    python bench/bench_routes.py --routes user_dashboard,view_invoice -o before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ["DATASTORE"] = "sqlite"
+os.environ["SQLITE_PATH"] = ":memory:"
+os.environ.setdefault("ADMIN_EMAIL", "admin@bench.local")
+os.environ.setdefault("ADMIN_PASSWORD", "bench-admin")
+os.environ.setdefault("BLOB_STORE_DIR", tempfile.mkdtemp(prefix="bench-blobs-"))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import app as app_module  # noqa: E402
+from instrumentation import ESTIMATED, InstrumentedStore  # noqa: E402
+from invoice_totals import compute_totals  # noqa: E402
+from logos import save_logo  # noqa: E402
+from page_cache import PageCache  # noqa: E402
+from search import client_search_fields  # noqa: E402
+from passwords import hash_password  # noqa: E402
+from storage import SQLiteStore  # noqa: E402
+
+ROUTES = [
+    "login",
+    "user_dashboard",
+    "user_dashboard_cached",
+    "admin_dashboard",
+    "generate_invoice_no",
+    "view_invoice",
+    "view_invoice_cached",
+    "download_invoice_pdf",
+    "download_invoice_pdf_cached",
+]
+
+TENANTS = 5
+DEPARTMENTS = ["Sales", "Services", "Support"]
+CLIENTS = ["Acme Traders", "Globex", "Initech Pvt Ltd", "Umbrella Corp", "Stark Industries"]
+PASSWORD = "bench-password"
+
+
+# ------------------------
+# Seeding
+# ------------------------
+def seed(store, invoice_count, rng):
+    """Fill ``store`` with TENANTS users and ``invoice_count`` invoices spread across them."""
+    with open(os.path.join(ROOT, "static", "company_logo.jpg"), "rb") as f:
+        logo = save_logo(app_module.blobs, f.read())
+
+    password_hash = hash_password(PASSWORD)
+    users = []
+    for t in range(TENANTS):
+        user_id = store.add_user({
+            "owner_name": f"Owner {t}",
+            "email": f"tenant{t}@bench.local",
+            "company_name": f"Tenant {t} Company",
+            "company_address": f"{t} Bench Street, Test City",
+            "phone_no": "9999999999",
+            "company_gst": f"27AAAAA{t:04d}A1Z5",
+            "password": password_hash,
+            "logo_hash": logo,
+        })
+        for dep in DEPARTMENTS:
+            store.add_department(user_id, {
+                "department_name": dep,
+                "sub_company_name": f"Tenant {t} {dep}",
+                "created_at": datetime.now(),
+                "created_by": user_id,
+            })
+        users.append(user_id)
+
+    for i in range(invoice_count):
+        user_id = users[i % TENANTS]
+        dep = DEPARTMENTS[i % len(DEPARTMENTS)]
+        client = CLIENTS[i % len(CLIENTS)]
+        items = [
+            {"item_name": f"Service line {n}", "quantity": n + 1, "unit_price": 100.0}
+            for n in range(rng.randint(1, 8))
+        ]
+        store.add_invoice({
+            "invoice_no": f"TEN-{dep[:3].upper()}-{i + 1:03d}",
+            "invoice_date": f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+            "due_date": "2025-12-31",
+            "client_name": client,
+            "client_email": "client@bench.local",
+            "client_po": f"PO-{i}",
+            "client_phone": "8888888888",
+            "client_address": "1 Client Road",
+            "departments": [dep],
+            "taxes": ["cgst", "sgst"],
+            "notes": "",
+            **compute_totals(items, ["cgst", "sgst"]),
+            "created_by": user_id,
+            "created_at": datetime.now(),
+            **client_search_fields(client),
+        })
+    return users
+
+
+# ------------------------
+# Measurement
+# ------------------------
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(name, requests, do_request, store):
+    latencies, reads, writes, estimated = [], [], [], 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        before = store.stats.snapshot()
+        t0 = time.perf_counter()
+        response = do_request()
+        latencies.append((time.perf_counter() - t0) * 1000)
+        after = store.stats.snapshot()
+        if response.status_code >= 400:
+            raise RuntimeError(f"{name} returned HTTP {response.status_code}")
+        response.close()
+        reads.append(after["reads"] - before["reads"])
+        writes.append(after["writes"] - before["writes"])
+        estimated += after["estimated"] - before["estimated"]
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "mean_ms": statistics.fmean(latencies),
+        "p50_ms": percentile(latencies, 50),
+        "p90_ms": percentile(latencies, 90),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": max(latencies),
+        "throughput_rps": requests / elapsed if elapsed else None,
+        "reads_per_request": statistics.fmean(reads),
+        "writes_per_request": statistics.fmean(writes),
+        "estimated_calls": estimated,
+    }
+
+
+def bench_size(invoice_count, requests, routes, rng):
+    store = InstrumentedStore(SQLiteStore(":memory:"))
+    users = seed(store, invoice_count, rng)
+    app_module.db = store
+    app_module.page_cache = PageCache(store)
+    app = app_module.app
+    app.config["TESTING"] = True
+
+    user_id = users[0]
+    user_invoices = [inv["doc_id"] for inv in store.list_invoices(created_by=user_id)]
+
+    user_client = app.test_client()
+    user_client.post("/login", data={"email": "tenant0@bench.local", "password": PASSWORD}).close()
+    admin_client = app.test_client()
+    admin_client.post("/login", data={
+        "email": os.environ["ADMIN_EMAIL"], "password": os.environ["ADMIN_PASSWORD"]
+    }).close()
+    anon_client = app.test_client()
+
+    def random_invoice():
+        return rng.choice(user_invoices) if user_invoices else "missing"
+
+    # The plain page routes clear the page cache first, so they measure the
+    # queries and rendering; the _cached variants measure page cache hits
+    def dashboard_cold():
+        app_module.page_cache.clear()
+        return user_client.get("/user/dashboard")
+
+    def view_cold():
+        app_module.page_cache.clear()
+        return user_client.get(f"/invoice/{random_invoice()}")
+
+    def download_cold():
+        app_module.pdf_cache.invalidate_user(user_id)
+        return user_client.get(f"/invoice/{random_invoice()}/download_pdf")
+
+    requests_by_route = {
+        "login": lambda: anon_client.post("/login", data={"email": "tenant0@bench.local", "password": PASSWORD}),
+        "user_dashboard": dashboard_cold,
+        "user_dashboard_cached": lambda: user_client.get("/user/dashboard"),
+        "admin_dashboard": lambda: admin_client.get("/admin/dashboard"),
+        "generate_invoice_no": lambda: user_client.post("/generate_invoice_no", json={"department": "Sales"}),
+        "view_invoice": view_cold,
+        "view_invoice_cached": lambda: user_client.get(f"/invoice/{user_invoices[0]}"),
+        "download_invoice_pdf": download_cold,
+        "download_invoice_pdf_cached": lambda: user_client.get(f"/invoice/{user_invoices[0]}/download_pdf"),
+    }
+
+    results = {}
+    for name in routes:
+        if not user_invoices and name in ("view_invoice", "view_invoice_cached",
+                                          "download_invoice_pdf", "download_invoice_pdf_cached"):
+            continue
+        # one warm-up request so first-use costs (template compile, logo decode) are not sampled
+        requests_by_route[name]().close()
+        results[name] = measure(name, requests, requests_by_route[name], store)
+    return results
+
+
+def print_table(size, results):
+    print(f"\n== {size} invoices ==")
+    print(f"{'route':<30}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'req/s':>10}{'reads':>10}{'writes':>8}")
+    for name, r in results.items():
+        label = f"{name} *" if r["estimated_calls"] else name
+        print(f"{label:<30}{r['p50_ms']:>10.2f}{r['p90_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+              f"{r['throughput_rps']:>10.1f}{r['reads_per_request']:>10.1f}{r['writes_per_request']:>8.1f}")
+    if any(r["estimated_calls"] for r in results.values()):
+        print(f"* reads/writes include estimated costs of: {', '.join(ESTIMATED)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000,10000",
+                        help="comma separated invoice counts (default: %(default)s)")
+    parser.add_argument("--requests", type=int, default=30, help="requests per route and size")
+    parser.add_argument("--routes", default=",".join(ROUTES), help="comma separated routes to run")
+    parser.add_argument("--seed", type=int, default=1234, help="random seed")
+    parser.add_argument("-o", "--output", default="bench_results.json", help="JSON results file")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    routes = [r for r in args.routes.split(",") if r]
+    unknown = set(routes) - set(ROUTES)
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(sorted(unknown))}")
+
+    rng = random.Random(args.seed)
+    report = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "requests_per_route": args.requests,
+        "tenants": TENANTS,
+        "estimated_costs": list(ESTIMATED),
+        "results": {},
+    }
+    for size in sizes:
+        results = bench_size(size, args.requests, routes, rng)
+        report["results"][str(size)] = results
+        print_table(size, results)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Binary blob storage for rendered and uploaded files.
+
+Keys are slash-separated paths such as ``pdf/<user_id>/<doc_id>/<hash>.pdf``.
+``LocalBlobStore`` keeps them under a directory on local disk; another
+backend (GCS, S3, ...) only needs to implement the same four methods.
+"""
+import os
+import re
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+
+_KEY_RE = re.compile(r"^[A-Za-z0-9_.\-]+(/[A-Za-z0-9_.\-]+)*$")
+
+
+def check_key(key):
+    if not _KEY_RE.match(key) or ".." in key.split("/"):
+        raise ValueError(f"Invalid blob key: {key!r}")
+    return key
+
+
+class BlobStore(ABC):
+    @abstractmethod
+    def get(self, key):
+        """Return the blob bytes or None."""
+
+    @abstractmethod
+    def put(self, key, data):
+        """Store ``data`` under ``key``, replacing any previous blob."""
+
+    @abstractmethod
+    def delete(self, key):
+        """Remove one blob if present."""
+
+    @abstractmethod
+    def delete_prefix(self, prefix):
+        """Remove every blob whose key starts with ``prefix/``."""
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root):
+        # Directories are created by the first put, so importing the app
+        # writes nothing to disk
+        self.root = os.path.abspath(root)
+
+    def _path(self, key):
+        return os.path.join(self.root, *check_key(key).split("/"))
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file first so readers never see a partial blob
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def delete_prefix(self, prefix):
+        shutil.rmtree(self._path(prefix), ignore_errors=True)
+
+
+def create_blob_store(root=None):
+    """Local blob store under ``root`` or the ``BLOB_STORE_DIR`` env var."""
+    return LocalBlobStore(root or os.getenv("BLOB_STORE_DIR", "blob_store"))
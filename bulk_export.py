@@ -0,0 +1,99 @@
+"""
+Bulk invoice PDF export.
+
+Cache misses are rendered in batches on a process pool so throughput
+scales with CPU cores, and results are written into a ZIP that is streamed
+to the client as it is built, so memory stays bounded by the number of
+batches in flight rather than the number of invoices.
+"""
+import io
+import multiprocessing
+import os
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "0")) or os.cpu_count() or 1
+
+# Invoices per task sent to a worker; all invoices in a batch share one tenant
+BATCH_SIZE = int(os.getenv("PDF_BATCH_SIZE", "20"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def render_pool():
+    """Process pool shared by every export, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: workers must not inherit datastore clients or request threads
+            _pool = ProcessPoolExecutor(PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+class PoolRenderer:
+    """Feeds render batches to the pool, keeping at most ``max_in_flight`` queued."""
+
+    def __init__(self, max_in_flight=None):
+        self.pool = render_pool()
+        self.max_in_flight = max_in_flight or PDF_WORKERS * 2
+        self.pending = deque()
+
+    def submit(self, jobs, logo_hash=None, logo_variants=None):
+        """Queue one batch; yields finished ``(tag, pdf_bytes)`` once the window is full."""
+        from pdf_render import render_batch
+
+        self.pending.append(self.pool.submit(render_batch, jobs, logo_hash, logo_variants))
+        while len(self.pending) > self.max_in_flight:
+            yield from self.pending.popleft().result()
+
+    def finish(self):
+        """Yield the results of every batch still in flight."""
+        while self.pending:
+            yield from self.pending.popleft().result()
+
+
+class _Sink(io.RawIOBase):
+    """Write-only stream whose contents are handed out chunk by chunk."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def zip_stream(files, compression=zipfile.ZIP_STORED):
+    """
+    Yield a ZIP archive of ``(name, data)`` pairs as it is written.
+
+    ``data`` is bytes or an iterable of byte chunks; chunked members are
+    compressed and sent as they are produced. The default stores members
+    as-is since PDFs are already compressed.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=compression) as archive:
+        for name, data in files:
+            if isinstance(data, bytes):
+                archive.writestr(name, data)
+                yield sink.drain()
+                continue
+            with archive.open(name, "w", force_zip64=True) as member:
+                for chunk in data:
+                    member.write(chunk)
+                    out = sink.drain()
+                    if out:
+                        yield out
+            yield sink.drain()
+    yield sink.drain()
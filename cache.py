@@ -0,0 +1,78 @@
+"""
+Small in-process caches shared by the app's hot paths.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe mapping that evicts the least recently used entry past ``maxsize``."""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+
+class TTLCache:
+    """``LRUCache`` whose entries also expire ``ttl`` seconds after they were set."""
+
+    def __init__(self, maxsize=128, ttl=60.0, clock=time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._lru = LRUCache(maxsize)
+
+    def get(self, key, default=None):
+        entry = self._lru.get(key)
+        if entry is None:
+            return default
+        expires, value = entry
+        if expires <= self._clock():
+            self._lru.pop(key)
+            return default
+        return value
+
+    def set(self, key, value):
+        self._lru.set(key, (self._clock() + self.ttl, value))
+
+    def pop(self, key, default=None):
+        entry = self._lru.pop(key)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self._lru.clear()
+
+    def __len__(self):
+        return len(self._lru)
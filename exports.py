@@ -0,0 +1,160 @@
+"""
+Streaming CSV and XLSX writers for invoice exports.
+
+Both take an iterable of rows and yield encoded chunks, so a response can
+be sent while the datastore is still being paged through and memory does
+not grow with the number of rows. XLSX is written directly as a minimal
+OOXML package (one sheet, inline strings) through ``zip_stream``; no
+spreadsheet library is needed.
+"""
+import csv
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from bulk_export import zip_stream
+
+# Bytes buffered before a chunk is yielded
+CHUNK_SIZE = 64 * 1024
+
+INVOICE_COLUMNS = [
+    ("Invoice No", "invoice_no"),
+    ("Invoice Date", "invoice_date"),
+    ("Due Date", "due_date"),
+    ("Company", "company_name"),
+    ("Client", "client_name"),
+    ("Client Email", "client_email"),
+    ("Client Phone", "client_phone"),
+    ("Client GSTIN", "client_gstin"),
+    ("Client PO", "client_po"),
+    ("Departments", "departments"),
+    ("Taxes", "taxes"),
+    ("Subtotal", "subtotal"),
+    ("GST", "gst_amount"),
+    ("Total", "final_total"),
+]
+
+ITEM_COLUMNS = [
+    ("Item", "item_name"),
+    ("Quantity", "quantity"),
+    ("Unit Price", "unit_price"),
+    ("Line Total", "total"),
+]
+
+# Invoice fields read for an export (company_name comes from the user)
+INVOICE_EXPORT_FIELDS = [key for _, key in INVOICE_COLUMNS if key != "company_name"] + ["created_by"]
+
+
+def _cell(value):
+    if isinstance(value, (list, tuple)):
+        return "; ".join(str(v) for v in value)
+    return "" if value is None else value
+
+
+def invoice_rows(invoices, company_names, with_items=False):
+    """
+    Header row, then one row per invoice or, ``with_items``, per line item.
+
+    ``company_names`` maps ``created_by`` to the company shown in each row.
+    Invoices without line items still get one row in item mode.
+    """
+    columns = INVOICE_COLUMNS + (ITEM_COLUMNS if with_items else [])
+    yield [title for title, _ in columns]
+
+    for invoice in invoices:
+        row = [_cell(invoice.get(key)) for _, key in INVOICE_COLUMNS]
+        row[3] = company_names.get(invoice.get("created_by"), "")
+        if not with_items:
+            yield row
+            continue
+        for item in invoice.get("items") or [{}]:
+            yield row + [_cell(item.get(key)) for _, key in ITEM_COLUMNS]
+
+
+# ------------------------
+# CSV
+# ------------------------
+def _csv_safe(value):
+    # Keep spreadsheet apps from evaluating user-entered text as a formula
+    if isinstance(value, str) and value[:1] in ("=", "+", "-", "@", "\t", "\r"):
+        return "'" + value
+    return value
+
+
+def csv_stream(rows):
+    """Yield UTF-8 CSV (with BOM, so Excel detects the encoding) in chunks."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("﻿")
+    for row in rows:
+        writer.writerow([_csv_safe(v) for v in row])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+# ------------------------
+# XLSX
+# ------------------------
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_CONTENT_TYPES = b"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+</Types>"""
+
+_ROOT_RELS = b"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+_WORKBOOK = b"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="Invoices" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+_WORKBOOK_RELS = b"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+</Relationships>"""
+
+
+def _xlsx_cell(value):
+    if isinstance(value, bool):
+        value = str(value)
+    if isinstance(value, (int, float)):
+        return f"<c><v>{value!r}</v></c>"
+    text = escape(_XML_INVALID.sub("", str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _sheet_xml(rows):
+    parts = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+             '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>']
+    size = len(parts[0])
+    for row in rows:
+        xml = "<row>" + "".join(_xlsx_cell(v) for v in row) + "</row>"
+        parts.append(xml)
+        size += len(xml)
+        if size >= CHUNK_SIZE:
+            yield "".join(parts).encode("utf-8")
+            parts, size = [], 0
+    parts.append("</sheetData></worksheet>")
+    yield "".join(parts).encode("utf-8")
+
+
+def xlsx_stream(rows):
+    """Yield a single-sheet XLSX workbook of ``rows``."""
+    return zip_stream([
+        ("[Content_Types].xml", _CONTENT_TYPES),
+        ("_rels/.rels", _ROOT_RELS),
+        ("xl/workbook.xml", _WORKBOOK),
+        ("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS),
+        ("xl/worksheets/sheet1.xml", _sheet_xml(rows)),
+    ], compression=zipfile.ZIP_DEFLATED)
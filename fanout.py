@@ -0,0 +1,50 @@
+"""
+Run independent datastore calls of one request at the same time.
+
+The Firestore client is synchronous and each call is a network round trip,
+so a page that needs a profile, its departments and some aggregates waits
+for the sum of three latencies. ``gather`` sends such calls to a shared
+thread pool and waits for all of them, so the page waits for the slowest.
+
+Calls run in a copy of the caller's context, so per-request datastore
+accounting (``instrumentation.request_stats``) still sees them.
+"""
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+IO_WORKERS = int(os.getenv("IO_WORKERS", "16"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def io_pool():
+    """The shared I/O pool, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="fanout")
+        return _pool
+
+
+def gather(*calls):
+    """
+    Run zero-argument callables concurrently and return their results in order.
+
+    The first call runs on the calling thread; the others must not wait on
+    this pool themselves, so a call that may ``gather`` again goes first.
+    If any call raises, the exception propagates after every call has
+    finished.
+    """
+    if len(calls) < 2:
+        return [call() for call in calls]
+
+    pool = io_pool()
+    futures = [pool.submit(contextvars.copy_context().run, call) for call in calls[1:]]
+    try:
+        first = calls[0]()
+    finally:
+        wait(futures)
+    return [first, *(f.result() for f in futures)]
@@ -0,0 +1,168 @@
+"""
+GST summaries for filing: taxable value and tax per rate, per period,
+per department and per client GSTIN.
+
+``GSTReport`` takes invoices one at a time, so a route can feed it from
+a paged datastore scan and years of invoices are never held in memory;
+only one running bucket per rate, period, department and client is kept.
+Amounts are summed as ``Decimal`` to the paisa.
+
+An invoice's rate is the sum of its taxes' rates (CGST 9% + SGST 9% is
+the 18% slab). Tax amounts come from the stored ``tax_breakdown``;
+invoices written before it existed have it recomputed from ``subtotal``.
+An invoice with several departments counts in full under each, like the
+dashboard aggregates. Clients with a GSTIN get a row each (B2B); the
+rest are summed in one unregistered row (B2C).
+
+Periods are calendar months (``2025-04``) or financial-year quarters
+(``FY2025-26 Q1`` is April to June 2025).
+"""
+import re
+from datetime import date
+from decimal import Decimal
+
+from aggregates import invoice_month
+from invoice_totals import TAX_RATES, money
+
+GROUPS = ("month", "quarter")
+
+# Invoice fields the report reads
+REPORT_FIELDS = [
+    "invoice_date", "departments", "taxes", "tax_breakdown", "subtotal",
+    "final_total", "client_name", "client_gstin",
+]
+
+# 2-digit state code, PAN, entity number, "Z", check character
+_GSTIN_RE = re.compile(r"^\d{2}[A-Z]{5}\d{4}[A-Z][1-9A-Z]Z[0-9A-Z]$")
+
+
+def normalize_gstin(value):
+    """``value`` stripped and upper-cased ("" when empty)."""
+    return re.sub(r"\s+", "", str(value or "")).upper()
+
+
+def valid_gstin(value):
+    return bool(_GSTIN_RE.match(value or ""))
+
+
+def financial_year_start(day):
+    """April 1st of the financial year ``day`` falls in."""
+    return date(day.year if day.month >= 4 else day.year - 1, 4, 1)
+
+
+def period_of(month, group):
+    """Period label of a ``YYYY-MM`` month for ``group`` ("month" or "quarter")."""
+    if group == "month":
+        return month
+    year, number = int(month[:4]), int(month[5:7])
+    start = year if number >= 4 else year - 1
+    return f"FY{start}-{(start + 1) % 100:02d} Q{(number - 4) % 12 // 3 + 1}"
+
+
+def _rate_label(rate):
+    return f"{rate.normalize():f}"
+
+
+class Bucket:
+    """Running totals of the invoices added to one report row."""
+
+    __slots__ = ("invoices", "taxable_value", "taxes", "total")
+
+    def __init__(self):
+        self.invoices = 0
+        self.taxable_value = Decimal(0)
+        self.taxes = dict.fromkeys(TAX_RATES, Decimal(0))
+        self.total = Decimal(0)
+
+    def add(self, taxable_value, taxes, total):
+        self.invoices += 1
+        self.taxable_value += taxable_value
+        for tax, amount in taxes.items():
+            self.taxes[tax] = self.taxes.get(tax, Decimal(0)) + amount
+        self.total += total
+
+    def as_dict(self):
+        return {
+            "invoices": self.invoices,
+            "taxable_value": float(self.taxable_value),
+            **{tax: float(amount) for tax, amount in self.taxes.items()},
+            "tax": float(sum(self.taxes.values(), Decimal(0))),
+            "total": float(self.total),
+        }
+
+
+def _tax_amounts(invoice, taxable_value):
+    """``{tax: Decimal}`` charged on an invoice; raises ``ValueError``/``KeyError``."""
+    taxes = list(dict.fromkeys(invoice.get("taxes") or []))
+    breakdown = invoice.get("tax_breakdown")
+    if isinstance(breakdown, dict) and set(breakdown) == set(taxes):
+        return {tax: money(amount) for tax, amount in breakdown.items()}
+    return {tax: money(taxable_value * TAX_RATES[tax] / 100) for tax in taxes}
+
+
+class GSTReport:
+    def __init__(self, group="month"):
+        self.group = group if group in GROUPS else "month"
+        self.totals = Bucket()
+        self.rates = {}
+        self.periods = {}        # period → (Bucket, {rate: Bucket})
+        self.departments = {}
+        self.clients = {}        # GSTIN ("" for unregistered) → (client name, Bucket)
+        self.skipped = 0
+
+    def add(self, invoice):
+        """Count one invoice; invoices whose amounts cannot be read are skipped."""
+        try:
+            taxable_value = money(invoice.get("subtotal") or 0)
+            taxes = _tax_amounts(invoice, taxable_value)
+            rate = sum((TAX_RATES[tax] for tax in taxes), Decimal(0))
+            total = money(invoice.get("final_total") or 0)
+        except (ValueError, KeyError):
+            self.skipped += 1
+            return
+        amounts = (taxable_value, taxes, total)
+
+        self.totals.add(*amounts)
+        self.rates.setdefault(rate, Bucket()).add(*amounts)
+
+        month = invoice_month(invoice)
+        if month:
+            period, period_rates = self.periods.setdefault(period_of(month, self.group), (Bucket(), {}))
+            period.add(*amounts)
+            period_rates.setdefault(rate, Bucket()).add(*amounts)
+
+        for department in dict.fromkeys(invoice.get("departments") or []):
+            self.departments.setdefault(department, Bucket()).add(*amounts)
+
+        gstin = normalize_gstin(invoice.get("client_gstin"))
+        name = (invoice.get("client_name") or "") if gstin else "Unregistered (B2C)"
+        self.clients.setdefault(gstin, (name, Bucket()))[1].add(*amounts)
+
+    def add_all(self, invoices):
+        for invoice in invoices:
+            self.add(invoice)
+        return self
+
+    def as_dict(self):
+        """The report as JSON-serializable rows, each list in a stable order."""
+        def rate_rows(rates):
+            return [{"rate": _rate_label(rate), **bucket.as_dict()} for rate, bucket in sorted(rates.items())]
+
+        return {
+            "group": self.group,
+            "taxes": list(TAX_RATES),
+            "totals": self.totals.as_dict(),
+            "rates": rate_rows(self.rates),
+            "periods": [
+                {"period": period, **bucket.as_dict(), "rates": rate_rows(rates)}
+                for period, (bucket, rates) in sorted(self.periods.items())
+            ],
+            "departments": [
+                {"department": name, **bucket.as_dict()} for name, bucket in sorted(self.departments.items())
+            ],
+            "clients": [
+                {"gstin": gstin or None, "client_name": name, **bucket.as_dict()}
+                for gstin, (name, bucket) in sorted(self.clients.items(), key=lambda kv: (not kv[0], kv[0]))
+            ],
+            "skipped": self.skipped,
+        }
@@ -0,0 +1,178 @@
+"""
+Bulk invoice import: parse JSON or CSV and validate every row in one pass.
+
+JSON is a list of invoice objects (or ``{"invoices": [...]}``) shaped like
+the ones ``create_invoice`` stores, with ``items`` as a list of
+``{item_name, quantity, unit_price}``. CSV has one line item per row;
+rows with the same ``invoice_ref`` (or, without that column, the same
+``invoice_no``) form one invoice, and list fields (``departments``,
+``taxes``) are separated by ``;``. Column names may also be the titles
+of the export (``Invoice No``, ``Unit Price``...), so an item export can
+be imported again.
+
+Line, GST and final totals are recomputed by ``invoice_totals`` like
+on every other invoice write; totals in the file are ignored.
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime
+
+from exports import INVOICE_COLUMNS, ITEM_COLUMNS
+from gst_report import normalize_gstin, valid_gstin
+from invoice_totals import TAX_RATES, compute_totals, parse_item
+from search import client_search_fields
+
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", "20000"))
+
+_INVOICE_FIELDS = [
+    "invoice_no", "invoice_date", "due_date", "client_name", "client_email",
+    "client_po", "client_phone", "client_gstin", "client_address", "departments", "taxes", "notes",
+]
+
+# Export titles accepted as CSV column names
+_COLUMN_ALIASES = {title.lower(): key for title, key in INVOICE_COLUMNS + ITEM_COLUMNS}
+
+
+class ImportFileError(ValueError):
+    """The upload could not be read at all (as opposed to per-row errors)."""
+
+
+def _split(value):
+    if isinstance(value, (list, tuple)):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [part.strip() for part in str(value or "").split(";") if part.strip()]
+
+
+def _date(value):
+    value = str(value or "").strip()
+    datetime.strptime(value, "%Y-%m-%d")
+    return value
+
+
+# ------------------------
+# Parsing
+# ------------------------
+def parse_json(text):
+    """``[(row number, raw invoice)]`` from a JSON document."""
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise ImportFileError(f"Invalid JSON: {e}") from e
+    if isinstance(data, dict):
+        data = data.get("invoices")
+    if not isinstance(data, list):
+        raise ImportFileError("Expected a list of invoices.")
+    if len(data) > IMPORT_MAX_ROWS:
+        raise ImportFileError(f"At most {IMPORT_MAX_ROWS} invoices per import.")
+    return [(n, raw if isinstance(raw, dict) else {}) for n, raw in enumerate(data, start=1)]
+
+
+def parse_csv(text):
+    """``[(first line number, raw invoice)]`` from CSV, grouping line items."""
+    reader = csv.DictReader(io.StringIO(text.lstrip("﻿")))
+    if not reader.fieldnames:
+        raise ImportFileError("The CSV file is empty.")
+    columns = {name: _COLUMN_ALIASES.get(name.strip().lower(), name.strip().lower())
+               for name in reader.fieldnames if name}
+    group_by = "invoice_ref" if "invoice_ref" in columns.values() else "invoice_no"
+
+    invoices = {}
+    rows = []
+    for row in reader:
+        row = {columns[k]: (v or "").strip() for k, v in row.items() if k in columns}
+        if len(rows) >= IMPORT_MAX_ROWS:
+            raise ImportFileError(f"At most {IMPORT_MAX_ROWS} rows per import.")
+        line = reader.line_num
+        item = {key: row.get(key) for key in ("item_name", "quantity", "unit_price")}
+
+        key = row.get(group_by)
+        raw = invoices.get(key) if key else None
+        if raw is None:
+            raw = {field: row.get(field) for field in _INVOICE_FIELDS}
+            raw["items"] = []
+            rows.append((line, raw))
+            if key:
+                invoices[key] = raw
+        if any(item.values()):
+            raw["items"].append(item)
+    return rows
+
+
+def parse_upload(data, file_name="", content_type=""):
+    """Rows of an uploaded JSON or CSV file (by extension, then content type)."""
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        raise ImportFileError("The file must be UTF-8 encoded.") from e
+    if file_name.lower().endswith(".json") or "json" in (content_type or ""):
+        return parse_json(text)
+    return parse_csv(text)
+
+
+# ------------------------
+# Validation
+# ------------------------
+def validate_invoice(raw, departments):
+    """
+    Return ``(invoice, errors)`` for one raw row.
+
+    ``departments`` are the tenant's department names. ``invoice`` is None
+    when there are errors; otherwise it is ready to store apart from
+    ``created_by``, ``created_at`` and a missing ``invoice_no``.
+    """
+    errors = []
+    invoice = {field: str(raw.get(field) or "").strip() for field in _INVOICE_FIELDS}
+
+    if not invoice["client_name"]:
+        errors.append("client_name is required")
+    try:
+        invoice["invoice_date"] = _date(invoice["invoice_date"])
+    except ValueError:
+        errors.append("invoice_date must be YYYY-MM-DD")
+    if invoice["due_date"]:
+        try:
+            invoice["due_date"] = _date(invoice["due_date"])
+        except ValueError:
+            errors.append("due_date must be YYYY-MM-DD")
+
+    invoice["client_gstin"] = normalize_gstin(invoice["client_gstin"])
+    if invoice["client_gstin"] and not valid_gstin(invoice["client_gstin"]):
+        errors.append("client_gstin is not a valid GSTIN")
+
+    invoice["departments"] = _split(raw.get("departments"))
+    if not invoice["departments"]:
+        errors.append("at least one department is required")
+    for name in invoice["departments"]:
+        if name not in departments:
+            errors.append(f"unknown department {name!r}")
+
+    invoice["taxes"] = [t.lower() for t in _split(raw.get("taxes"))]
+    for tax in invoice["taxes"]:
+        if tax not in TAX_RATES:
+            errors.append(f"unknown tax {tax!r}")
+
+    items = []
+    raw_items = raw.get("items") if isinstance(raw.get("items"), list) else []
+    if not raw_items:
+        errors.append("at least one line item is required")
+    for n, item in enumerate(raw_items, start=1):
+        item = item if isinstance(item, dict) else {}
+        try:
+            item = parse_item(str(item.get("item_name") or ""), item.get("quantity"), item.get("unit_price"))
+        except ValueError:
+            errors.append(f"item {n}: quantity must be a whole number and unit_price a number")
+            continue
+        if not item["item_name"]:
+            errors.append(f"item {n}: item_name is required")
+        if item["quantity"] <= 0 or item["unit_price"] < 0:
+            errors.append(f"item {n}: quantity must be positive and unit_price not negative")
+        items.append(item)
+
+    if errors:
+        return None, errors
+
+    invoice.update(compute_totals(items, invoice["taxes"]))
+    invoice.update(client_search_fields(invoice["client_name"]))
+    return invoice, []
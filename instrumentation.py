@@ -0,0 +1,179 @@
+"""
+Datastore read/write/latency accounting.
+
+``InstrumentedStore`` wraps any ``storage.Store`` and counts document reads
+and writes the way Firestore bills them: one read per document returned
+(a query that returns nothing still costs one read), one write per
+created, updated or deleted document. Time spent inside the store,
+including iterating streamed query results, is added up as well.
+
+The proxy sees only arguments and results, not the documents a store
+method touched. Where those determine the cost (an email lookup that
+missed, the aggregates an invoice creates) it is counted exactly; the
+methods in ``ESTIMATED`` depend on stored data it cannot see, such as the
+departments of the invoice being updated, and are charged a typical cost;
+``StoreStats.estimated`` counts those calls so reports can flag them.
+
+Every operation is recorded in the wrapper's process-wide ``stats`` and,
+between ``begin_request()`` and ``end_request()``, in a per-request
+``StoreStats`` so each route can report what it cost.
+"""
+import threading
+import time
+from contextvars import ContextVar
+from types import GeneratorType
+
+from aggregates import invoice_deltas
+from storage import write_chunks
+
+# Store methods that write exactly one document
+_WRITES = {"update_user", "add_department", "delete_department"}
+
+# (reads, writes) of the email index and the transactions that read before
+# they write, from a call's (args, result)
+_COSTS = {
+    # the index, then the user it points to or the query for unindexed users
+    "find_user_by_email": lambda args, result: (2, 0),
+    # the user, plus a checked and created email index entry
+    "add_user": lambda args, result: (1, 2) if args[0].get("email") else (0, 1),
+    # False: owned by another user, nothing written
+    "index_user_email": lambda args, result: (1, 1) if result else (1, 0),
+    "allocate_invoice_serial": lambda args, result: (1, 1),
+    "raise_invoice_serial": lambda args, result: (1, 1),
+    # the invoice, plus the tenant aggregate and each department's
+    "add_invoice": lambda args, result: (0, 1 + len(invoice_deltas(new=args[0]))),
+    "update_invoice": lambda args, result: (1, 3),
+    "delete_invoice": lambda args, result: (1, 3),
+}
+
+# Costs above that depend on documents the proxy does not see, charged as
+# typical: a user found by the fallback query is indexed on the way, an
+# index entry already owned by the same user is not rewritten, a counter
+# already past the serial is not raised, and invoice updates and deletes
+# adjust the aggregates of the stored invoice's departments (one assumed).
+# Reported next to the measured counts.
+ESTIMATED = ("find_user_by_email", "index_user_email", "raise_invoice_serial", "update_invoice",
+             "delete_invoice")
+
+# Bulk writes: one write per created document, plus each aggregate document
+# once per committed batch (see ``_bulk_writes``)
+_BULK_WRITES = {"add_invoices"}
+
+# Keyed reads and writes of one document per distinct key in the first argument
+_PER_KEY_READS = {"get_versions"}
+_PER_KEY_WRITES = {"bump_versions"}
+
+_request_stats = ContextVar("request_stats", default=None)
+
+
+class StoreStats:
+    """Running totals of datastore operations."""
+
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+        self.calls = 0
+        self.estimated = 0
+        self.seconds = 0.0
+
+    def snapshot(self):
+        return {"reads": self.reads, "writes": self.writes, "calls": self.calls,
+                "estimated": self.estimated, "seconds": self.seconds}
+
+
+def begin_request():
+    """Start collecting datastore stats for the current request; returns a token."""
+    return _request_stats.set(StoreStats())
+
+
+def request_stats():
+    """Stats of the current request, or None outside ``begin_request``."""
+    return _request_stats.get()
+
+
+def end_request(token):
+    _request_stats.reset(token)
+
+
+def _count_reads(name, result):
+    if name in ("get_users", "get_invoice_stats", "list_invoice_stats"):
+        return len(result)
+    if isinstance(result, list):
+        return max(len(result), 1)
+    return 1
+
+
+def _bulk_writes(invoices, ids):
+    """Writes of an ``add_invoices`` call: the invoices and aggregates of each committed batch."""
+    writes = 0
+    for chunk, deltas in write_chunks(invoices):
+        if ids[chunk[0][0]]:
+            writes += len(chunk) + sum(len(change) for change in deltas.values())
+    return writes
+
+
+class InstrumentedStore:
+    """Proxy around a store that records reads, writes and time in ``stats``."""
+
+    def __init__(self, store, stats=None):
+        self._store = store
+        self._lock = threading.Lock()
+        self.stats = stats or StoreStats()
+
+    def _record(self, reads=0, writes=0, seconds=0.0, scoped=None, estimated=False):
+        with self._lock:
+            for stats in (self.stats, scoped):
+                if stats is not None:
+                    stats.calls += 1
+                    stats.estimated += estimated
+                    stats.reads += reads
+                    stats.writes += writes
+                    stats.seconds += seconds
+
+    def _counted(self, rows, scoped):
+        count = 0
+        seconds = 0.0
+        try:
+            while True:
+                t0 = time.perf_counter()
+                try:
+                    row = next(rows)
+                except StopIteration:
+                    return
+                finally:
+                    seconds += time.perf_counter() - t0
+                count += 1
+                yield row
+        finally:
+            self._record(reads=max(count, 1), seconds=seconds, scoped=scoped)
+
+    def __getattr__(self, name):
+        attr = getattr(self._store, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            scoped = _request_stats.get()
+            t0 = time.perf_counter()
+            result = attr(*args, **kwargs)
+            seconds = time.perf_counter() - t0
+
+            if isinstance(result, GeneratorType):
+                return self._counted(result, scoped)
+            if name in _BULK_WRITES:
+                self._record(writes=_bulk_writes(args[0], result), seconds=seconds, scoped=scoped)
+            elif name in _PER_KEY_READS:
+                self._record(reads=len(set(args[0])), seconds=seconds, scoped=scoped)
+            elif name in _PER_KEY_WRITES:
+                self._record(writes=len(set(args[0])), seconds=seconds, scoped=scoped)
+            elif name in _WRITES:
+                self._record(writes=1, seconds=seconds, scoped=scoped)
+            elif name in _COSTS:
+                reads, writes = _COSTS[name](args, result)
+                self._record(reads=reads, writes=writes, seconds=seconds, scoped=scoped,
+                             estimated=name in ESTIMATED)
+            else:
+                self._record(reads=_count_reads(name, result), seconds=seconds, scoped=scoped)
+            return result
+
+        return call
@@ -0,0 +1,90 @@
+"""
+Invoice totals computed on the server with exact decimal arithmetic.
+
+The invoice forms compute line totals, GST and the final total in the
+browser; those numbers are only a preview. Every write recomputes them
+here from the line items and ``taxes`` with ``Decimal``, rounding each
+line and each tax to the paisa (half up), so stored totals always add up
+and do not depend on binary floating point.
+
+Amounts are stored as floats (Firestore has no decimal type), but only
+after rounding, so they read back as the exact paisa values.
+"""
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+PAISA = Decimal("0.01")
+
+# Percent of the subtotal charged for each tax the invoice form offers
+TAX_RATES = {"cgst": Decimal("9"), "sgst": Decimal("9")}
+
+# Stored fields recomputed from the items and taxes
+TOTAL_FIELDS = ("subtotal", "tax_breakdown", "gst_amount", "final_total")
+
+
+def money(value):
+    """``value`` as a ``Decimal`` rounded to the paisa; raises ``ValueError``."""
+    try:
+        amount = Decimal(str(value).strip())
+    except (InvalidOperation, TypeError) as e:
+        raise ValueError(f"not an amount: {value!r}") from e
+    if not amount.is_finite():
+        raise ValueError(f"not an amount: {value!r}")
+    return amount.quantize(PAISA, rounding=ROUND_HALF_UP)
+
+
+def parse_item(item_name, quantity, unit_price):
+    """A line item from form or import values; raises ``ValueError``."""
+    return {
+        "item_name": (item_name or "").strip(),
+        "quantity": int(str(quantity).strip()),
+        "unit_price": float(money(unit_price)),
+    }
+
+
+def compute_totals(items, taxes):
+    """
+    Line totals and invoice totals for ``items`` and ``taxes``.
+
+    Returns ``{"items", "subtotal", "tax_breakdown", "gst_amount",
+    "final_total"}`` ready to merge into the invoice. Unknown tax names
+    raise ``KeyError``.
+    """
+    rates = [(tax, TAX_RATES[tax]) for tax in dict.fromkeys(taxes or [])]
+    line_totals = [
+        (Decimal(item["quantity"]) * money(item["unit_price"])).quantize(PAISA, rounding=ROUND_HALF_UP)
+        for item in items
+    ]
+    subtotal = sum(line_totals, Decimal(0))
+    breakdown = {
+        tax: (subtotal * rate / 100).quantize(PAISA, rounding=ROUND_HALF_UP) for tax, rate in rates
+    }
+    gst_amount = sum(breakdown.values(), Decimal(0))
+
+    return {
+        "items": [{**item, "total": float(total)} for item, total in zip(items, line_totals)],
+        "subtotal": float(subtotal),
+        "tax_breakdown": {tax: float(amount) for tax, amount in breakdown.items()},
+        "gst_amount": float(gst_amount),
+        "final_total": float(subtotal + gst_amount),
+    }
+
+
+def total_mismatches(invoice):
+    """
+    ``[(field, stored, expected)]`` where a stored invoice disagrees with
+    its recomputed totals by at least a paisa (``tax_breakdown`` must
+    match exactly once present). Raises ``ValueError`` / ``KeyError`` on
+    items or taxes that cannot be computed.
+    """
+    expected = compute_totals(invoice.get("items") or [], invoice.get("taxes") or [])
+
+    mismatches = []
+    for n, (stored, item) in enumerate(zip(invoice.get("items") or [], expected["items"])):
+        if abs(money(stored.get("total") or 0) - money(item["total"])) >= PAISA:
+            mismatches.append((f"items[{n}].total", stored.get("total"), item["total"]))
+    for field in ("subtotal", "gst_amount", "final_total"):
+        if abs(money(invoice.get(field) or 0) - money(expected[field])) >= PAISA:
+            mismatches.append((field, invoice.get(field), expected[field]))
+    if "tax_breakdown" in invoice and invoice["tax_breakdown"] != expected["tax_breakdown"]:
+        mismatches.append(("tax_breakdown", invoice["tax_breakdown"], expected["tax_breakdown"]))
+    return mismatches
@@ -0,0 +1,239 @@
+"""
+Durable background jobs on a local SQLite queue.
+
+Web requests ``enqueue`` a job and return at once; worker processes
+started with ``flask run-worker`` claim jobs, run the handler registered
+for their kind and record the result. The queue is one SQLite file
+(``JOB_QUEUE_PATH``, default ``job_queue.db``) shared by the web and
+worker processes on a host.
+
+A job that raises is retried with exponential backoff up to
+``max_attempts`` times; ``PermanentJobError`` fails it at once. A job
+whose worker died is claimed again after ``JOB_TIMEOUT`` seconds, so
+handlers must be safe to run twice; that counts as an attempt, and a job
+that has used them all (one that keeps crashing its worker) fails instead.
+
+Job states: ``queued`` → ``running`` → ``done`` or ``failed``.
+"""
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from lazy import ProcessLocal
+
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "job_queue.db")
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "5"))
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "300"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+
+log = logging.getLogger(__name__)
+
+# kind → handler(payload) returning a JSON-serializable result
+HANDLERS = {}
+
+
+class PermanentJobError(Exception):
+    """The job cannot succeed; do not retry it."""
+
+
+def job_handler(kind):
+    """Register the decorated function as the handler for ``kind``."""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+class JobQueue:
+    def __init__(self, path=None, clock=time.time):
+        self.path = path or JOB_QUEUE_PATH
+        self.clock = clock
+        self._lock = threading.RLock()
+        # Opened on first use in each process; web and worker processes
+        # never share a connection
+        self._conns = ProcessLocal(self._connect)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                owner TEXT,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                run_after REAL NOT NULL,
+                claimed_at REAL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (status, run_after);
+        """)
+        return conn
+
+    @property
+    def _conn(self):
+        return self._conns.get()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def enqueue(self, kind, payload, owner=None, max_attempts=None):
+        """Queue a job and return its id."""
+        job_id = uuid.uuid4().hex
+        now = self.clock()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, owner, payload, status, max_attempts, run_after,"
+                " created_at, updated_at) VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, kind, owner, json.dumps(payload), max_attempts or JOB_MAX_ATTEMPTS, now, now, now),
+            )
+        return job_id
+
+    def get(self, job_id):
+        """The job as a dict, or None."""
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            columns = [c[0] for c in cursor.description]
+        if row is None:
+            return None
+        job = dict(zip(columns, row))
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def claim(self):
+        """Mark the oldest runnable job as running and return it, or None."""
+        now = self.clock()
+        with self._transaction():
+            while True:
+                row = self._conn.execute(
+                    "SELECT id, status, attempts, max_attempts FROM jobs"
+                    " WHERE (status = 'queued' AND run_after <= ?)"
+                    " OR (status = 'running' AND claimed_at <= ?) ORDER BY run_after LIMIT 1",
+                    (now, now - JOB_TIMEOUT),
+                ).fetchone()
+                if row is None:
+                    return None
+                job_id, status, attempts, max_attempts = row
+                if status == "queued" or attempts < max_attempts:
+                    break
+                # Timed out on its last attempt: its worker died or hung
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                    (f"Worker did not finish attempt {attempts} within {JOB_TIMEOUT:g}s", now, job_id),
+                )
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, claimed_at = ?,"
+                " updated_at = ? WHERE id = ?",
+                (now, now, job_id),
+            )
+        return self.get(job_id)
+
+    def complete(self, job_id, result=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, updated_at = ? WHERE id = ?",
+                (json.dumps(result), self.clock(), job_id),
+            )
+
+    def fail(self, job_id, error, permanent=False):
+        """Record a failed attempt; requeue with backoff unless out of attempts."""
+        now = self.clock()
+        with self._transaction():
+            row = self._conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return
+            attempts, max_attempts = row
+            if permanent or attempts >= max_attempts:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                    (error, now, job_id),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'queued', error = ?, run_after = ?, updated_at = ?"
+                    " WHERE id = ?",
+                    (error, now + JOB_RETRY_DELAY * 2 ** (attempts - 1), now, job_id),
+                )
+
+
+def run_job(queue, job):
+    """Run one claimed job and record its outcome."""
+    handler = HANDLERS.get(job["kind"])
+    if handler is None:
+        queue.fail(job["id"], f"No handler for {job['kind']!r}", permanent=True)
+        return
+    try:
+        result = handler(job["payload"])
+    except PermanentJobError as e:
+        log.warning("Job %s (%s) failed: %s", job["id"], job["kind"], e)
+        queue.fail(job["id"], str(e), permanent=True)
+    except Exception as e:
+        log.exception("Job %s (%s) attempt %d failed", job["id"], job["kind"], job["attempts"])
+        queue.fail(job["id"], f"{type(e).__name__}: {e}")
+    else:
+        queue.complete(job["id"], result)
+
+
+def run_worker(queue, stop=None, poll_interval=None):
+    """Claim and run jobs until ``stop`` (a ``threading``/``multiprocessing`` Event) is set."""
+    poll_interval = JOB_POLL_INTERVAL if poll_interval is None else poll_interval
+    while stop is None or not stop.is_set():
+        job = queue.claim()
+        if job is None:
+            if stop is None:
+                time.sleep(poll_interval)
+            else:
+                stop.wait(poll_interval)
+            continue
+        run_job(queue, job)
+
+
+def _worker_process(module, stop):
+    # Shutdown signals are handled by the parent, which sets ``stop``; the
+    # worker finishes its current job and exits
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    # Importing the app module registers its handlers and builds its stores
+    importlib.import_module(module)
+    run_worker(JobQueue(), stop)
+
+
+def start_workers(module, processes):
+    """
+    Start ``processes`` worker processes that import ``module`` (which
+    registers the handlers) and run jobs. Returns ``(processes, stop)``.
+    """
+    context = multiprocessing.get_context("spawn")
+    stop = context.Event()
+    workers = [context.Process(target=_worker_process, args=(module, stop), name=f"job-worker-{n}")
+               for n in range(processes)]
+    for worker in workers:
+        worker.start()
+    return workers, stop
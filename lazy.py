@@ -0,0 +1,45 @@
+"""
+Values created on first use, once per process.
+
+Connections must not be shared across ``fork``: the Firestore client's
+gRPC channels and SQLite handles break when a forked child reuses them,
+and gunicorn forks its workers from a master that may already have
+imported the app (``--preload``). ``ProcessLocal`` builds its value the
+first time it is needed in each process, so importing the app opens
+nothing (and needs no credentials) and every worker gets its own.
+"""
+import os
+import threading
+import weakref
+
+_instances = weakref.WeakSet()
+
+
+class ProcessLocal:
+    """``get()`` returns ``factory()``, called once per process on first use."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._pid = None
+        self._value = None
+        _instances.add(self)
+
+    def get(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._value = self._factory()
+                    self._pid = os.getpid()
+        return self._value
+
+
+def _after_fork():
+    # A lock held by another thread at fork time would never be released
+    # in the child, where that thread does not exist
+    for instance in list(_instances):
+        instance._lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
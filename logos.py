@@ -0,0 +1,189 @@
+"""
+Company logos: validated at upload, stored in the blob store as PNG variants.
+
+An upload is checked against size limits, decoded once and written as
+
+    logos/<hash>/original      the uploaded bytes
+    logos/<hash>/thumb.png     ≤96px, for listings
+    logos/<hash>/header.png    ≤320px, the PDF header and the web view
+    logos/<hash>/watermark.png ≤600px, alpha already faded for the watermark
+
+where ``<hash>`` is the sha256 of the uploaded bytes. User documents only
+keep that hash (``logo_hash``). Content-addressed keys never change, so the
+variants can be served with long-lived caching and shared between tenants
+that upload the same file.
+
+Turning the PNGs into ReportLab images still costs more than drawing
+them, so prepared ``LogoAssets`` are kept in an LRU cache keyed by hash.
+Pillow and ReportLab are imported on first use, not when the app starts.
+"""
+import hashlib
+import io
+import os
+from collections import namedtuple
+
+from cache import LRUCache
+
+LOGO_CACHE_SIZE = int(os.getenv("LOGO_CACHE_SIZE", "128"))
+
+# Upload limits
+LOGO_MAX_BYTES = int(os.getenv("LOGO_MAX_BYTES", str(2 * 1024 * 1024)))
+LOGO_MAX_PIXELS = 25_000_000
+
+# Pixel bounds of the stored variants. The header is drawn in an 80pt box
+# and the watermark in a 280pt box, so these keep ~300 dpi and ~150 dpi.
+VARIANTS = {
+    "thumb": 96,
+    "header": 320,
+    "watermark": 600,
+}
+
+# Opacity of the centred watermark, baked into its alpha channel.
+WATERMARK_ALPHA = 0.06
+
+LogoAssets = namedtuple("LogoAssets", ["header", "watermark"])
+
+_cache = LRUCache(LOGO_CACHE_SIZE)
+_MISSING = object()
+
+
+class LogoError(ValueError):
+    """The upload is not an acceptable logo image."""
+
+
+def logo_hash(image_bytes):
+    """Content hash of an uploaded logo, stored on the user document."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def variant_key(digest, variant):
+    return f"logos/{digest}/{variant}.png"
+
+
+# ------------------------
+# Upload
+# ------------------------
+def logo_variants(image_bytes):
+    """Return ``{variant: png_bytes}`` for an upload; raises ``LogoError``."""
+    from PIL import Image
+
+    if len(image_bytes) > LOGO_MAX_BYTES:
+        raise LogoError(f"Logo must be at most {LOGO_MAX_BYTES // 1024} KB.")
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise LogoError("Logo must be a PNG, JPEG or other image file.") from e
+    if image.width * image.height > LOGO_MAX_PIXELS:
+        raise LogoError("Logo dimensions are too large.")
+    try:
+        image = image.convert("RGBA")
+    except (OSError, ValueError) as e:
+        raise LogoError("Logo image could not be decoded.") from e
+
+    variants = {}
+    for name, size in VARIANTS.items():
+        variant = image.copy()
+        variant.thumbnail((size, size))
+        if name == "watermark":
+            variant.putalpha(variant.getchannel("A").point(lambda a: int(a * WATERMARK_ALPHA)))
+        out = io.BytesIO()
+        variant.save(out, format="PNG", optimize=True)
+        variants[name] = out.getvalue()
+    return variants
+
+
+def prepare_logo(blobs, image_bytes):
+    """
+    Validate an upload and build its variants without storing anything.
+
+    Returns ``(digest, writes)`` for ``store_logo``; ``writes`` is empty
+    when the logo is stored already. Routes that can still reject the
+    request (an email already taken) store the logo only once it is
+    accepted, so rejected requests leave no blobs behind.
+    """
+    digest = logo_hash(image_bytes)
+    if blobs.get(variant_key(digest, "header")) is not None:
+        return digest, {}
+
+    variants = logo_variants(image_bytes)
+    writes = {f"logos/{digest}/original": image_bytes}
+    writes.update((variant_key(digest, name), data) for name, data in variants.items())
+    return digest, writes
+
+
+def store_logo(blobs, prepared):
+    """Write a ``prepare_logo`` result and return the logo's hash."""
+    digest, writes = prepared
+    for key, data in writes.items():
+        blobs.put(key, data)
+    return digest
+
+
+def save_logo(blobs, image_bytes):
+    """Validate an upload, store it with its variants and return its hash."""
+    return store_logo(blobs, prepare_logo(blobs, image_bytes))
+
+
+def read_upload(file_storage):
+    """Bytes of an optional uploaded file, or None; raises ``LogoError`` past the limit."""
+    if not file_storage or file_storage.filename == "":
+        return None
+    data = file_storage.read(LOGO_MAX_BYTES + 1)
+    if len(data) > LOGO_MAX_BYTES:
+        raise LogoError(f"Logo must be at most {LOGO_MAX_BYTES // 1024} KB.")
+    return data or None
+
+
+# ------------------------
+# PDF assets
+# ------------------------
+def load_pdf_variants(blobs, digest):
+    """``(header_png, watermark_png)`` of a stored logo, or None if missing."""
+    header = blobs.get(variant_key(digest, "header"))
+    watermark = blobs.get(variant_key(digest, "watermark"))
+    if header is None or watermark is None:
+        return None
+    return header, watermark
+
+
+def _reader(png_bytes):
+    from reportlab.lib.utils import ImageReader
+
+    reader = ImageReader(io.BytesIO(png_bytes))
+    # Decode pixel data now so cached readers are read-only when shared
+    # between request threads.
+    reader.getRGBData()
+    if getattr(reader, "_dataA", None) is not None:
+        reader._dataA.getRGBData()
+    return reader
+
+
+def build_logo_assets(variants):
+    """``LogoAssets`` from ``(header_png, watermark_png)``, or None if they do not decode."""
+    header, watermark = variants
+    try:
+        return LogoAssets(header=_reader(header), watermark=_reader(watermark))
+    except (OSError, ValueError):
+        return None
+
+
+def get_logo_assets(digest, load_variants):
+    """
+    Cached ``LogoAssets`` for a logo hash, or None if it is missing.
+
+    ``load_variants`` returns ``(header_png, watermark_png)`` or None and is
+    only called on a cache miss, so the blob store is not read while the
+    assets are cached.
+    """
+    assets = _cache.get(digest, _MISSING)
+    if assets is not _MISSING:
+        return assets
+
+    variants = load_variants()
+    if variants is None:
+        # Not stored (yet); do not remember the miss
+        return None
+    assets = build_logo_assets(variants)
+
+    _cache.set(digest, assets)
+    return assets
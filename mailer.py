@@ -0,0 +1,92 @@
+"""
+Outgoing mail through a pluggable transport.
+
+``MAIL_TRANSPORT=smtp`` sends through ``SMTP_HOST``:``SMTP_PORT`` (with
+``SMTP_STARTTLS`` and ``SMTP_USER``/``SMTP_PASSWORD`` when set); pointed
+at a local debugging SMTP server it prints instead of delivering.
+``MAIL_TRANSPORT=file`` (the default) writes each message as an ``.eml``
+file under ``MAIL_DIR``, for development and tests.
+"""
+import os
+import smtplib
+import tempfile
+import uuid
+from abc import ABC, abstractmethod
+from email.message import EmailMessage
+
+MAIL_FROM = os.getenv("MAIL_FROM", "invoices@localhost")
+
+
+class MailTransport(ABC):
+    @abstractmethod
+    def send(self, message):
+        """Deliver an ``email.message.EmailMessage``."""
+
+
+class SMTPTransport(MailTransport):
+    def __init__(self, host, port=25, user=None, password=None, starttls=False, timeout=30):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def send(self, message):
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password or "")
+            smtp.send_message(message)
+
+
+class FileTransport(MailTransport):
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+
+    def send(self, message):
+        os.makedirs(self.directory, exist_ok=True)
+        # Write to a temp file first so readers never see a partial message
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(message.as_bytes())
+            os.replace(tmp, os.path.join(self.directory, f"{uuid.uuid4().hex}.eml"))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def create_transport(kind=None):
+    """Transport selected by ``kind`` or the ``MAIL_TRANSPORT`` env var."""
+    kind = (kind or os.getenv("MAIL_TRANSPORT", "file")).lower()
+    if kind == "smtp":
+        return SMTPTransport(
+            os.getenv("SMTP_HOST", "localhost"),
+            int(os.getenv("SMTP_PORT", "25")),
+            user=os.getenv("SMTP_USER"),
+            password=os.getenv("SMTP_PASSWORD"),
+            starttls=os.getenv("SMTP_STARTTLS", "").lower() in ("1", "true", "yes"),
+        )
+    if kind == "file":
+        return FileTransport(os.getenv("MAIL_DIR", "outbox"))
+    raise ValueError(f"Unknown MAIL_TRANSPORT: {kind!r}")
+
+
+def invoice_message(to, invoice, company, pdf_bytes, sender=None):
+    """Email to a client with the invoice PDF attached."""
+    invoice_no = invoice.get("invoice_no") or invoice.get("doc_id")
+    message = EmailMessage()
+    message["From"] = sender or MAIL_FROM
+    message["To"] = to
+    message["Subject"] = f"Invoice {invoice_no} from {company.get('company_name', '')}".strip()
+    message.set_content(
+        f"Dear {invoice.get('client_name') or 'customer'},\n\n"
+        f"Please find attached invoice {invoice_no} for "
+        f"₹{float(invoice.get('final_total') or 0):.2f}.\n\n"
+        f"Regards,\n{company.get('company_name', '')}\n"
+    )
+    message.add_attachment(pdf_bytes, maintype="application", subtype="pdf",
+                           filename=f"{str(invoice_no).replace('/', '-')}.pdf")
+    return message
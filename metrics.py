@@ -0,0 +1,131 @@
+"""
+Minimal Prometheus-style metrics.
+
+Counters and histograms with labels, rendered in the Prometheus text
+exposition format by ``REGISTRY.render()``. Values are per process; with
+several gunicorn workers each one exposes its own series.
+"""
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + body + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            for bound, count in zip(self.buckets, counts):
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(bound))])} {count}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {counts[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP requests handled.", ["route", "method", "status"]
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time to build a response.", ["route"]
+)
+DATASTORE_READS = REGISTRY.counter(
+    "datastore_reads_total", "Datastore documents read.", ["route"]
+)
+DATASTORE_WRITES = REGISTRY.counter(
+    "datastore_writes_total", "Datastore documents written.", ["route"]
+)
+DATASTORE_READS_PER_REQUEST = REGISTRY.histogram(
+    "datastore_reads_per_request", "Datastore documents read by one request.", ["route"],
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 10000)
+)
+DATASTORE_LATENCY = REGISTRY.histogram(
+    "datastore_request_seconds", "Time one request spent waiting on the datastore.", ["route"]
+)
+PDF_RENDER_LATENCY = REGISTRY.histogram(
+    "pdf_render_seconds", "Time to render one invoice PDF.", ["route"]
+)
+PAGE_CACHE_REQUESTS = REGISTRY.counter(
+    "page_cache_requests_total", "Cached HTML page lookups by result (hit, miss).", ["route", "result"]
+)
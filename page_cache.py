@@ -0,0 +1,118 @@
+"""
+Rendered HTML pages cached per tenant, with conditional GET and compression.
+
+``view_invoice``, the user dashboard and the admin users page render the
+same template from the same data until one of their inputs is written.
+Each cached page records the *scopes* it was built from (``tenant:<id>``
+for a tenant's invoices, departments and profile, ``invoice:<id>`` for one
+invoice, ``users`` for the user list) and the version stamp of each scope
+when its reads began. Write routes ``bump`` the scopes they change.
+
+The stamps are documents in the shared datastore (``Store.get_versions``
+and ``bump_versions``), so a write on one worker process or host stales
+the pages cached by every other: a hit costs one keyed read per scope
+instead of the page's queries and rendering. ``PAGE_CACHE_TTL`` only
+bounds how long an unused page stays in memory.
+
+A cached page carries a strong ETag (a hash of the HTML) and Last-Modified
+(the newest bump of its scopes), and keeps its gzip and, when the
+``brotli`` package is installed, brotli encodings, so a repeat view is a
+304 or a precompressed body with no rendering.
+"""
+import gzip
+import hashlib
+import os
+import threading
+import time
+
+from cache import TTLCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "1024"))
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "60"))
+
+# Responses smaller than this are sent uncompressed
+COMPRESS_MIN_SIZE = 1024
+
+# Compressed types, in Content-Type main-type form
+COMPRESSIBLE_TYPES = {"text/html", "text/css", "text/plain", "text/javascript",
+                      "application/javascript", "application/json"}
+
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def compress(body, encoding):
+    """``body`` (bytes) in ``encoding`` ("gzip" or "br")."""
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def choose_encoding(accept_encodings):
+    """Best encoding we can produce for a request's ``Accept-Encoding``, or None."""
+    for encoding in ENCODINGS:
+        if accept_encodings[encoding]:
+            return encoding
+    return None
+
+
+class CachedPage:
+    """One rendered page; encoded bodies are built on first request."""
+
+    def __init__(self, html, stamps, last_modified):
+        self.body = html.encode("utf-8")
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        self.stamps = stamps
+        self.last_modified = last_modified
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    @property
+    def scopes(self):
+        return list(self.stamps)
+
+    def encoded(self, encoding):
+        with self._lock:
+            if encoding not in self._encoded:
+                self._encoded[encoding] = compress(self.body, encoding)
+            return self._encoded[encoding]
+
+
+class PageCache:
+    def __init__(self, store, maxsize=None, ttl=None, clock=time.time):
+        self.store = store
+        self._pages = TTLCache(maxsize or PAGE_CACHE_SIZE, PAGE_CACHE_TTL if ttl is None else ttl)
+        self._clock = clock
+
+    def stamps(self, scopes):
+        """Current ``{scope: (version, updated_at)}``; take them before the page's reads."""
+        current = self.store.get_versions(scopes)
+        return {scope: tuple(current.get(scope, (0, None))) for scope in scopes}
+
+    def bump(self, *scopes):
+        """Mark ``scopes`` as changed, staling every page built from them in every process."""
+        self.store.bump_versions(scopes)
+
+    def get(self, key):
+        """The cached page for ``key`` if none of its scopes changed since, else None."""
+        page = self._pages.get(key)
+        if page is None:
+            return None
+        if self.stamps(page.scopes) != page.stamps:
+            self._pages.pop(key)
+            return None
+        return page
+
+    def put(self, key, html, stamps):
+        """Cache ``html`` built at ``stamps``; returns the ``CachedPage``."""
+        last_modified = max((t for _, t in stamps.values() if t is not None), default=self._clock())
+        page = CachedPage(html, dict(stamps), last_modified)
+        self._pages.set(key, page)
+        return page
+
+    def clear(self):
+        self._pages.clear()
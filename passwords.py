@@ -0,0 +1,41 @@
+"""
+Password hashing off the request thread.
+
+Hashing a password is deliberately slow (tens of milliseconds of CPU). It
+runs on a small bounded thread pool: hashlib releases the GIL while it
+works, so other requests on the same worker keep being served, and a
+burst of logins queues for ``PASSWORD_WORKERS`` slots instead of taking
+every core.
+
+``PASSWORD_HASH_METHOD`` is passed to werkzeug's ``generate_password_hash``
+(e.g. ``scrypt:32768:8:1`` or ``pbkdf2:sha256:600000``). Existing hashes
+keep verifying after it changes since each one records its own method.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "2"))
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def hash_pool():
+    """The shared hashing pool, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="password")
+        return _pool
+
+
+def hash_password(password):
+    return hash_pool().submit(generate_password_hash, password, PASSWORD_HASH_METHOD).result()
+
+
+def check_password(password_hash, password):
+    return hash_pool().submit(check_password_hash, password_hash, password).result()
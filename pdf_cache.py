@@ -0,0 +1,42 @@
+"""
+Content-addressed cache of rendered invoice PDFs.
+
+The cache key is a hash of everything that ends up on the page (invoice,
+resolved company details, logo hash and the layout version), so any change
+to the inputs produces a new key and the key doubles as the HTTP ETag.
+Entries are stored as ``pdf/<user_id>/<doc_id>/<key>.pdf`` so the write
+routes can drop one invoice or a whole tenant at once.
+"""
+import hashlib
+import json
+
+# Bump whenever the PDF layout changes so cached renders are not reused
+RENDER_VERSION = "2"
+
+
+def render_key(invoice, company, logo_hash):
+    payload = json.dumps(
+        {"v": RENDER_VERSION, "invoice": invoice, "company": company, "logo": logo_hash},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PDFCache:
+    def __init__(self, blobs):
+        self.blobs = blobs
+
+    def get(self, user_id, doc_id, key):
+        return self.blobs.get(f"pdf/{user_id}/{doc_id}/{key}.pdf")
+
+    def put(self, user_id, doc_id, key, pdf_bytes):
+        # Only the latest render of an invoice is worth keeping
+        self.invalidate_invoice(user_id, doc_id)
+        self.blobs.put(f"pdf/{user_id}/{doc_id}/{key}.pdf", pdf_bytes)
+
+    def invalidate_invoice(self, user_id, doc_id):
+        self.blobs.delete_prefix(f"pdf/{user_id}/{doc_id}")
+
+    def invalidate_user(self, user_id):
+        self.blobs.delete_prefix(f"pdf/{user_id}")
@@ -0,0 +1,242 @@
+"""
+Invoice PDF rendering engine.
+
+Pure functions of plain invoice/company data, so they can run inside a
+request, in a batch job or in a worker process. The layout is built from
+platypus flowables: long item lists flow onto further pages with the table
+header repeated, and totals/signature are kept together.
+
+``InvoiceTemplate`` holds everything that does not depend on the invoice
+(page geometry, paragraph styles, table styles). It is built once and
+shared by every render.
+"""
+import io
+from xml.sax.saxutils import escape
+
+from reportlab import rl_config
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.platypus import (
+    KeepTogether, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+)
+
+from blobstore import create_blob_store
+from logos import get_logo_assets, load_pdf_variants
+
+# Write binary (Flate-only) streams. ASCII85 armouring is done in pure Python
+# when reportlab's C accelerator is missing and dominated render time.
+rl_config.useA85 = 0
+
+
+def _money(value):
+    try:
+        return f"{float(value or 0):.2f}"
+    except (TypeError, ValueError):
+        return "0.00"
+
+
+def _text(value):
+    """Escape a field for use inside a Paragraph."""
+    return escape("" if value is None else str(value))
+
+
+class InvoiceTemplate:
+    """Page geometry, fonts and table styles for one invoice layout."""
+
+    def __init__(self, pagesize=A4, margin=32, currency="Rs."):
+        self.pagesize = pagesize
+        self.margin = margin
+        self.currency = currency
+
+        self.logo_size = 80
+        self.watermark_size = 280
+
+        self.company_style = ParagraphStyle(
+            "company", fontName="Helvetica-Bold", fontSize=18, leading=22, alignment=TA_CENTER
+        )
+        self.address_style = ParagraphStyle(
+            "address", fontName="Helvetica", fontSize=11, leading=14, alignment=TA_CENTER
+        )
+        self.heading_style = ParagraphStyle(
+            "heading", fontName="Helvetica-Bold", fontSize=12, leading=18
+        )
+        self.body_style = ParagraphStyle(
+            "body", fontName="Helvetica", fontSize=11, leading=15
+        )
+        self.cell_style = ParagraphStyle(
+            "cell", fontName="Helvetica", fontSize=10, leading=12
+        )
+        self.signature_style = ParagraphStyle(
+            "signature", fontName="Helvetica-Oblique", fontSize=11, leading=15, alignment=TA_RIGHT
+        )
+
+        self.details_widths = [330, 200]
+        self.details_style = TableStyle([
+            ("VALIGN", (0, 0), (-1, -1), "TOP"),
+            ("LEFTPADDING", (0, 0), (-1, -1), 0),
+            ("RIGHTPADDING", (0, 0), (-1, -1), 0),
+        ])
+
+        self.item_widths = [220, 70, 120, 120]
+        self.items_style = TableStyle([
+            ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+            ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+            ("ALIGN", (1, 1), (-1, -1), "CENTER"),
+            ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ])
+
+        self.totals_widths = [110, 110]
+        self.totals_style = TableStyle([
+            ("ALIGN", (0, 0), (-1, -1), "RIGHT"),
+            ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
+            ("FONTSIZE", (0, 0), (-1, -1), 11),
+            ("FONTNAME", (0, -1), (-1, -1), "Helvetica-Bold"),
+            ("FONTSIZE", (0, -1), (-1, -1), 12),
+        ])
+
+    # ---------- page decoration ----------
+    def draw_page(self, canvas, doc, logo):
+        width, height = self.pagesize
+        canvas.saveState()
+        if logo:
+            size = self.watermark_size
+            canvas.drawImage(logo.watermark, (width - size) / 2, (height - size) / 2,
+                             width=size, height=size, mask="auto")
+        canvas.setFont("Helvetica", 9)
+        canvas.setFillColor(colors.grey)
+        canvas.drawRightString(width - self.margin, self.margin / 2, f"Page {doc.page}")
+        canvas.restoreState()
+
+    def draw_first_page(self, canvas, doc, logo):
+        self.draw_page(canvas, doc, logo)
+        if logo:
+            width, height = self.pagesize
+            size = self.logo_size
+            canvas.drawImage(logo.header, (width - size) / 2, height - self.margin - size,
+                             width=size, height=size, preserveAspectRatio=True, mask="auto")
+
+    # ---------- flowables ----------
+    def header(self, company, logo):
+        story = []
+        if logo:
+            story.append(Spacer(1, self.logo_size + 20))
+        story += [
+            Paragraph(_text(company["company_name"]), self.company_style),
+            Spacer(1, 6),
+            Paragraph(_text(company["address"]), self.address_style),
+            Paragraph(
+                f"Email: {_text(company['email'])} | Phone: {_text(company['phone_no'])}",
+                self.address_style
+            ),
+            Spacer(1, 24),
+        ]
+        return story
+
+    def details(self, invoice, company):
+        body = self.body_style
+        left = [
+            Paragraph("Invoice Details:", self.heading_style),
+            Paragraph(f"Invoice No: {_text(invoice.get('invoice_no'))}", body),
+            Paragraph(f"Invoice Date: {_text(invoice.get('invoice_date'))}", body),
+            Paragraph(f"Due Date: {_text(invoice.get('due_date'))}", body),
+            Paragraph(f"GSTIN: {_text(company['gst_no'])}", body),
+        ]
+        right = [
+            Paragraph("Customer Details:", self.heading_style),
+            Paragraph(f"Name: {_text(invoice.get('client_name'))}", body),
+            Paragraph(f"Email: {_text(invoice.get('client_email'))}", body),
+            Paragraph(f"Purchase-order: {_text(invoice.get('client_po'))}", body),
+            Paragraph(f"Phone: {_text(invoice.get('client_phone'))}", body),
+            Paragraph(f"Address: {_text(invoice.get('client_address'))}", body),
+        ]
+        table = Table([[left, right]], colWidths=self.details_widths)
+        table.setStyle(self.details_style)
+        return [table, Spacer(1, 24)]
+
+    def items(self, invoice):
+        rows = [["Item/Service", "Qty", "Unit Price", "Total"]]
+        for item in invoice.get("items") or []:
+            rows.append([
+                Paragraph(_text(item.get("item_name", "")), self.cell_style),
+                item.get("quantity", ""),
+                _money(item.get("unit_price")),
+                _money(item.get("total")),
+            ])
+        # repeatRows: the header row is drawn again on every continuation page
+        table = Table(rows, colWidths=self.item_widths, repeatRows=1)
+        table.setStyle(self.items_style)
+        return [table, Spacer(1, 20)]
+
+    def totals(self, invoice, company):
+        currency = self.currency
+        table = Table([
+            ["Subtotal:", f"{currency} {_money(invoice.get('subtotal'))}"],
+            ["GST:", f"{currency} {_money(invoice.get('gst_amount'))}"],
+            ["Final Total:", f"{currency} {_money(invoice.get('final_total'))}"],
+        ], colWidths=self.totals_widths, hAlign="RIGHT")
+        table.setStyle(self.totals_style)
+        return [KeepTogether([
+            table,
+            Spacer(1, 36),
+            Paragraph("Signature &amp; Stamp", self.signature_style),
+            Paragraph(_text(company["owner_name"]), self.signature_style),
+        ])]
+
+    def story(self, invoice, company, logo):
+        return (
+            self.header(company, logo)
+            + self.details(invoice, company)
+            + self.items(invoice)
+            + self.totals(invoice, company)
+        )
+
+
+DEFAULT_TEMPLATE = InvoiceTemplate()
+
+
+def render_invoice_pdf(invoice, company, logo, template=DEFAULT_TEMPLATE):
+    """
+    Render one invoice and return the PDF bytes.
+
+    ``company`` has the keys built by ``app.resolve_company`` and ``logo`` is
+    a ``logos.LogoAssets`` or None.
+    """
+    pdf_buffer = io.BytesIO()
+    doc = SimpleDocTemplate(
+        pdf_buffer,
+        pagesize=template.pagesize,
+        leftMargin=template.margin,
+        rightMargin=template.margin,
+        topMargin=template.margin,
+        bottomMargin=template.margin,
+        title=str(invoice.get("invoice_no") or ""),
+        author=company["company_name"],
+    )
+    doc.build(
+        template.story(invoice, company, logo),
+        onFirstPage=lambda canvas, d: template.draw_first_page(canvas, d, logo),
+        onLaterPages=lambda canvas, d: template.draw_page(canvas, d, logo),
+    )
+    return pdf_buffer.getvalue()
+
+
+# ------------------------
+# Worker entry point
+# ------------------------
+def render_batch(jobs, logo_hash=None, logo_variants=None):
+    """
+    Render ``[(tag, invoice, company), ...]`` for one tenant.
+
+    Runs in a worker process and returns ``[(tag, pdf_bytes), ...]``. The
+    tenant's logo variants travel once per batch, or are read from the blob
+    store by the worker when not sent, and are prepared through the
+    worker's own logo cache.
+    """
+    logo = None
+    if logo_hash:
+        logo = get_logo_assets(
+            logo_hash, lambda: logo_variants or load_pdf_variants(create_blob_store(), logo_hash)
+        )
+    return [(tag, render_invoice_pdf(invoice, company, logo)) for tag, invoice, company in jobs]
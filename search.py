@@ -0,0 +1,137 @@
+"""
+Searchable name fields stored on invoices.
+
+Firestore cannot do case-insensitive or substring matches, so every invoice
+write also stores the lowercased client name and three token arrays:
+
+    client_name_tokens  prefixes from each word start ("prefix" search)
+    client_name_grams   3-letter substrings ("contains" search)
+    client_name_fuzzy   each word and its one-letter deletions ("similar" search)
+
+``client_query`` turns a search term into one indexed ``array_contains``
+(or ``array_contains_any``) filter on one of these arrays. Prefix matches
+are exact; the other two return candidates that ``name_matches`` confirms.
+A term and a word are similar when they share a deletion variant, which
+covers one inserted, deleted, replaced or swapped letter.
+"""
+from collections import namedtuple
+
+# Longest token we store; longer search terms are cut to this length.
+MAX_TOKEN_LENGTH = 30
+
+# Length of the substrings indexed for "contains" search
+GRAM_LENGTH = 3
+
+# Words shorter than this are not typo-matched; longer ones are cut so their
+# deletion variants fit one array_contains_any (at most 30 values)
+MIN_FUZZY_LENGTH = 4
+MAX_FUZZY_LENGTH = 29
+
+MATCH_MODES = ("prefix", "contains", "similar")
+
+# field: invoice array to filter on; value: one token (array_contains) or a
+# list (array_contains_any); exact: results need no name_matches check
+ClientQuery = namedtuple("ClientQuery", ["field", "value", "exact"])
+
+
+def normalize_name(name):
+    """Lowercase and collapse whitespace."""
+    return " ".join((name or "").lower().split())
+
+
+def name_tokens(name):
+    """
+    Every prefix of the name starting at each word boundary.
+
+    "Acme Traders" → "a", "ac", ..., "acme t", ..., "acme traders",
+    "t", "tr", ..., "traders". Any search that starts at the beginning of a
+    word, including multi-word phrases, is one of these tokens.
+    """
+    normalized = normalize_name(name)
+    tokens = set()
+    start = 0
+    for word in normalized.split(" "):
+        if word:
+            tail = normalized[start:start + MAX_TOKEN_LENGTH].rstrip()
+            for end in range(1, len(tail) + 1):
+                if tail[end - 1] != " ":
+                    tokens.add(tail[:end])
+        start += len(word) + 1
+    return sorted(tokens)
+
+
+def name_grams(name):
+    """Every ``GRAM_LENGTH``-letter substring of the normalized name."""
+    normalized = normalize_name(name)
+    return sorted({normalized[i:i + GRAM_LENGTH] for i in range(len(normalized) - GRAM_LENGTH + 1)})
+
+
+def _deletes(word):
+    word = word[:MAX_FUZZY_LENGTH]
+    return {word} | {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def name_fuzzy_tokens(name):
+    """Deletion variants of each word long enough to be typo-matched."""
+    tokens = set()
+    for word in normalize_name(name).split(" "):
+        if len(word) >= MIN_FUZZY_LENGTH:
+            tokens |= _deletes(word)
+    return sorted(tokens)
+
+
+def _similar(word, term_word):
+    return bool(_deletes(word) & _deletes(term_word))
+
+
+def name_matches(name, term, mode="prefix"):
+    """
+    Whether ``name`` matches a normalized search ``term``.
+
+    prefix: the term starts at a word boundary; contains: the term is a
+    substring; similar: every word of the term is within one typo of a
+    word of the name (short words must match exactly).
+    """
+    normalized = normalize_name(name)
+    if mode == "contains":
+        return term in normalized
+    if mode == "similar":
+        words = normalized.split(" ")
+        return all(
+            any(w == t or (len(t) >= MIN_FUZZY_LENGTH and _similar(w, t)) for w in words)
+            for t in term.split(" ")
+        )
+    return term in name_tokens(name)
+
+
+def client_query(term, mode="prefix"):
+    """
+    Index filter for a normalized search term, or None when there is nothing to search.
+
+    Terms too short for the chosen index fall back to a prefix search.
+    """
+    if not term:
+        return None
+    if mode == "contains" and len(term) >= GRAM_LENGTH:
+        # Any one of the term's grams narrows the candidates enough
+        return ClientQuery("client_name_grams", term[:GRAM_LENGTH], len(term) == GRAM_LENGTH)
+    if mode == "similar":
+        longest = max(term.split(" "), key=len)
+        if len(longest) >= MIN_FUZZY_LENGTH:
+            return ClientQuery("client_name_fuzzy", sorted(_deletes(longest)), False)
+    return ClientQuery("client_name_tokens", term, True)
+
+
+def search_term(text):
+    """Normalize a user-entered search term to match ``name_tokens``."""
+    return normalize_name(text)[:MAX_TOKEN_LENGTH].rstrip()
+
+
+def client_search_fields(client_name):
+    """Fields to merge into an invoice document on every write."""
+    return {
+        "client_name_lower": normalize_name(client_name),
+        "client_name_tokens": name_tokens(client_name),
+        "client_name_grams": name_grams(client_name),
+        "client_name_fuzzy": name_fuzzy_tokens(client_name),
+    }
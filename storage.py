@@ -0,0 +1,1104 @@
+"""
+Datastore access for users, departments and invoices.
+
+Routes talk to a ``Store`` instead of the Firestore client directly so the
+app can run against Firestore in production and against a local SQLite
+database (in-memory by default) on a laptop, in CI or under load tests.
+
+Every method returns plain dicts. The document id is added under the key
+the templates already use: ``user_id`` for users, ``dep_id`` for
+departments and ``doc_id`` for invoices.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import secrets
+import sqlite3
+import string
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+from aggregates import FIELDS as STATS_FIELDS, apply_deltas, empty_stats, invoice_deltas, merge_deltas
+from lazy import ProcessLocal
+
+log = logging.getLogger(__name__)
+
+
+USERS = "users"
+DEPARTMENTS = "departments"
+INVOICES = "invoices"
+INVOICE_COUNTERS = "invoice_counters"
+USER_EMAILS = "user_emails"
+INVOICE_STATS = "invoice_stats"
+PAGE_VERSIONS = "page_versions"
+
+# Id of a tenant's whole-account aggregate; departments use counter_id(name)
+TENANT_STATS = "all"
+
+# Firestore caps the number of values in an "in" filter.
+MAX_IN_FILTER = 30
+
+# Firestore caps the number of writes in one batch or transaction.
+MAX_BATCH_WRITES = 500
+
+# Batches of a bulk invoice import committed at the same time
+IMPORT_COMMIT_WORKERS = int(os.getenv("IMPORT_COMMIT_WORKERS", "4"))
+
+# Fields of an invoice shown in list views (no line items, notes or addresses)
+INVOICE_SUMMARY_FIELDS = [
+    "invoice_no", "invoice_date", "due_date", "client_name", "final_total", "created_by"
+]
+
+
+def _with_id(data, key, doc_id):
+    data = dict(data or {})
+    data[key] = doc_id
+    return data
+
+
+def _with_field(fields, field):
+    return list(fields) if field in fields else [*fields, field]
+
+
+def _with_cursor_field(fields):
+    return _with_field(fields, "created_by")
+
+
+def counter_id(department):
+    """Document id for a department's aggregate or a number prefix's counter (both may contain '/')."""
+    return hashlib.sha1(department.encode("utf-8")).hexdigest()
+
+
+def stats_id(scope):
+    """Document id of the aggregate for a department, or the tenant when None."""
+    return TENANT_STATS if scope is None else counter_id(scope)
+
+
+def _stats(data):
+    """Aggregate document with every key present and empty months dropped."""
+    stats = empty_stats((data or {}).get("department_name"))
+    stats.update({k: v for k, v in (data or {}).items() if k != "months"})
+    stats["months"] = {m: v for m, v in sorted(((data or {}).get("months") or {}).items())
+                       if v.get("count")}
+    return stats
+
+
+def email_id(email):
+    """Document id of an address in the ``user_emails`` index (case-insensitive)."""
+    return hashlib.sha1(email.strip().lower().encode("utf-8")).hexdigest()
+
+
+def write_chunks(invoices, limit=MAX_BATCH_WRITES):
+    """
+    Split new invoices into groups that fit one batch of ``limit`` writes.
+
+    Yields ``(chunk, deltas)`` where ``chunk`` is a list of ``(position,
+    invoice)`` and ``deltas`` is ``{user_id: aggregate deltas}`` of the
+    whole chunk, so each aggregate document is written once per batch.
+    """
+    chunk, deltas, stats_docs = [], {}, 0
+    for position, data in enumerate(invoices):
+        user_id = data.get("created_by")
+        change = invoice_deltas(new=data) if user_id else {}
+        new_docs = len(change.keys() - deltas.get(user_id, {}).keys())
+        if chunk and len(chunk) + 1 + stats_docs + new_docs > limit:
+            yield chunk, deltas
+            chunk, deltas, stats_docs = [], {}, 0
+            new_docs = len(change)
+        chunk.append((position, data))
+        if change:
+            merge_deltas(deltas.setdefault(user_id, {}), change)
+        stats_docs += new_docs
+    if chunk:
+        yield chunk, deltas
+
+
+class EmailTaken(Exception):
+    """The email address already belongs to another user."""
+
+
+class Store(ABC):
+    """Repository interface shared by every backend."""
+
+    # ------------------------
+    # Users
+    # ------------------------
+    @abstractmethod
+    def get_user(self, user_id, fields=None):
+        """Return the user dict or None; ``fields`` limits which fields are read."""
+
+    @abstractmethod
+    def find_user_by_email(self, email, fields=None):
+        """
+        Return the user registered with ``email`` or None.
+
+        Two keyed reads: ``user_emails/<email_id>`` then the user. On an
+        index miss, users created before the index existed are looked up by
+        their ``email`` field and indexed on the way, so
+        ``flask backfill-email-index`` only saves those slower first logins.
+        """
+
+    @abstractmethod
+    def list_users(self, fields=None):
+        """Return every user; ``fields`` limits which fields are read."""
+
+    @abstractmethod
+    def get_users(self, user_ids, fields=None):
+        """Return ``{user_id: user}`` for the given ids that exist."""
+
+    @abstractmethod
+    def add_user(self, data):
+        """
+        Create a user and return its id.
+
+        The user and its ``user_emails`` entry are written in one
+        transaction; raises ``EmailTaken`` if the address is already indexed.
+        """
+
+    @abstractmethod
+    def update_user(self, user_id, data):
+        """
+        Merge ``data`` into an existing user.
+
+        A changed ``email`` moves the user's ``user_emails`` entry in the
+        same transaction and raises ``EmailTaken`` if another user owns it.
+        """
+
+    @abstractmethod
+    def index_user_email(self, user_id, email):
+        """
+        Point ``user_emails`` at ``user_id`` unless the address is indexed already.
+
+        Returns False if it belongs to a different user (backfill).
+        """
+
+    # ------------------------
+    # Departments
+    # ------------------------
+    @abstractmethod
+    def list_departments(self, user_id):
+        """Return the departments of one user."""
+
+    @abstractmethod
+    def add_department(self, user_id, data):
+        """Create a department under ``user_id`` and return its id."""
+
+    @abstractmethod
+    def delete_department(self, user_id, dep_id):
+        """Delete one department."""
+
+    # ------------------------
+    # Invoices
+    # ------------------------
+    @abstractmethod
+    def get_invoice(self, doc_id):
+        """Return the invoice dict or None."""
+
+    @abstractmethod
+    def list_invoices(self, created_by=None, from_date=None, to_date=None, client_search=None,
+                      department=None, fields=None, batch_size=None):
+        """
+        Yield invoices matching every given filter.
+
+        ``from_date`` / ``to_date`` bound ``invoice_date`` (``YYYY-MM-DD``,
+        inclusive). ``client_search`` is a ``(field, value)`` filter on one of
+        the client name token arrays (see ``search.client_query``): ``value``
+        must be in the array or, as a list, share an element with it.
+        ``department`` must be one of ``departments``. Firestore allows only
+        one of these two array filters per query. ``fields`` (e.g.
+        ``INVOICE_SUMMARY_FIELDS``) limits which fields are read.
+
+        With ``batch_size`` the invoices are read in pages of that many,
+        ordered by ``(invoice_date, doc_id)`` and resumed from a cursor, so
+        very long listings hold one page in memory and no single query
+        runs long. Invoices without an ``invoice_date`` are skipped then.
+        """
+
+    @abstractmethod
+    def page_invoices(self, limit, start_after=None, end_before=None, created_by_in=None,
+                      client_search=None, fields=None):
+        """
+        Return up to ``limit`` invoices ordered by ``(created_by, doc_id)``.
+
+        ``start_after`` / ``end_before`` are ``(created_by, doc_id)`` cursors
+        taken from a previous page. With ``end_before`` the *last* ``limit``
+        invoices before the cursor are returned, still in ascending order.
+        ``created_by_in`` restricts the page to at most ``MAX_IN_FILTER``
+        user ids and ``client_search`` is a filter as in ``list_invoices``
+        (Firestore cannot combine ``created_by_in`` with a list value). ``fields`` limits which fields are read; ``created_by`` is
+        always included so the results can be used as cursors.
+        """
+
+    @abstractmethod
+    def add_invoice(self, data):
+        """Create an invoice and return its id; updates the owner's aggregates."""
+
+    @abstractmethod
+    def add_invoices(self, invoices):
+        """
+        Create many invoices (bulk import); updates the owners' aggregates.
+
+        Invoices are written in batches of up to ``MAX_BATCH_WRITES``
+        documents, each batch atomically together with its aggregate
+        increments. Returns the new ids in input order, with None for the
+        invoices of a batch that failed to commit.
+        """
+
+    @abstractmethod
+    def update_invoice(self, doc_id, data):
+        """Merge ``data`` into an existing invoice; updates the owner's aggregates."""
+
+    @abstractmethod
+    def delete_invoice(self, doc_id):
+        """Delete one invoice; updates the owner's aggregates."""
+
+    # ------------------------
+    # Invoice aggregates (see aggregates.py)
+    # ------------------------
+    @abstractmethod
+    def get_invoice_stats(self, user_ids):
+        """Return ``{user_id: stats}`` of the whole-tenant aggregates, one keyed read each."""
+
+    @abstractmethod
+    def list_invoice_stats(self, user_id):
+        """Return ``{scope: stats}`` for a tenant (None) and each of its departments."""
+
+    @abstractmethod
+    def replace_invoice_stats(self, user_id, stats):
+        """Overwrite a tenant's aggregates with ``{scope: stats}`` (rebuild)."""
+
+    # ------------------------
+    # Invoice number counters
+    # ------------------------
+    # One counter per invoice number prefix ("ACM-SAL"), not per department:
+    # departments whose names start alike print the same prefix and must
+    # share one series.
+    @abstractmethod
+    def get_invoice_serial(self, user_id, prefix):
+        """Last serial allocated for (user, prefix), or None without a counter; one read."""
+
+    @abstractmethod
+    def allocate_invoice_serial(self, user_id, prefix, seed=None, count=1):
+        """
+        Atomically reserve the next ``count`` serials for (user, prefix)
+        and return the first; the block is ``first .. first + count - 1``.
+
+        One read and one write of ``users/<id>/invoice_counters/<prefix>``.
+        When the counter does not exist yet it starts from ``seed()`` (the
+        highest serial already used) or 0.
+        """
+
+    @abstractmethod
+    def raise_invoice_serial(self, user_id, prefix, serial):
+        """Move the counter up to ``serial`` if it is lower (backfill)."""
+
+    # ------------------------
+    # Page version stamps
+    # ------------------------
+    @abstractmethod
+    def get_versions(self, keys):
+        """
+        ``{key: (version, updated_at)}`` of the version stamps ``keys``, one
+        keyed read each; stamps never bumped are left out. ``updated_at``
+        is a Unix time.
+        """
+
+    @abstractmethod
+    def bump_versions(self, keys):
+        """Increment the version stamps ``keys`` (a new stamp starts at 1), one write each."""
+
+
+# ------------------------
+# Firestore backend
+# ------------------------
+def _where_tokens(query, field, value):
+    if isinstance(value, (list, tuple)):
+        return query.where(field, "array_contains_any", list(value))
+    return query.where(field, "array_contains", value)
+
+
+class FirestoreStore(Store):
+    def __init__(self, credentials_path="serviceAccountKey.json"):
+        # Credentials are read and the client built on first use, in each process
+        self.credentials_path = credentials_path
+        self._client = ProcessLocal(self._connect)
+
+    def _connect(self):
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+
+        cred = credentials.Certificate(self.credentials_path)
+        # One firebase app per process: a forked worker must not reuse the
+        # client (and its gRPC channels) that its parent created
+        app = firebase_admin.initialize_app(cred, name=f"smart-invoice-{os.getpid()}")
+        return firestore.client(app)
+
+    @property
+    def client(self):
+        return self._client.get()
+
+    def _departments(self, user_id):
+        return self.client.collection(USERS).document(user_id).collection(DEPARTMENTS)
+
+    def get_user(self, user_id, fields=None):
+        doc = self.client.collection(USERS).document(user_id).get(field_paths=fields)
+        return _with_id(doc.to_dict(), "user_id", doc.id) if doc.exists else None
+
+    def _email_index(self, email):
+        return self.client.collection(USER_EMAILS).document(email_id(email))
+
+    def find_user_by_email(self, email, fields=None):
+        index = self._email_index(email).get()
+        if index.exists:
+            return self.get_user(index.get("user_id"), fields=fields)
+
+        query = self.client.collection(USERS).where("email", "==", email).limit(1)
+        if fields is not None:
+            query = query.select(fields)
+        for doc in query.stream():
+            self.index_user_email(doc.id, email)
+            return _with_id(doc.to_dict(), "user_id", doc.id)
+        return None
+
+    def list_users(self, fields=None):
+        query = self.client.collection(USERS)
+        if fields is not None:
+            query = query.select(fields)
+        return [_with_id(doc.to_dict(), "user_id", doc.id) for doc in query.stream()]
+
+    def get_users(self, user_ids, fields=None):
+        refs = [self.client.collection(USERS).document(uid) for uid in set(user_ids)]
+        return {doc.id: _with_id(doc.to_dict(), "user_id", doc.id)
+                for doc in self.client.get_all(refs, field_paths=fields) if doc.exists}
+
+    def add_user(self, data):
+        from firebase_admin import firestore
+
+        ref = self.client.collection(USERS).document()
+        index = self._email_index(data["email"]) if data.get("email") else None
+
+        @firestore.transactional
+        def create(transaction):
+            if index is not None:
+                if index.get(transaction=transaction).exists:
+                    raise EmailTaken(data["email"])
+                transaction.create(index, {"email": data["email"], "user_id": ref.id})
+            transaction.set(ref, data)
+
+        create(self.client.transaction())
+        return ref.id
+
+    def update_user(self, user_id, data):
+        from firebase_admin import firestore
+
+        ref = self.client.collection(USERS).document(user_id)
+        if not data.get("email"):
+            ref.update(data)
+            return
+
+        new_index = self._email_index(data["email"])
+
+        @firestore.transactional
+        def update(transaction):
+            old_email = (ref.get(field_paths=["email"], transaction=transaction).to_dict() or {}).get("email")
+            taken = new_index.get(transaction=transaction)
+            if taken.exists and taken.get("user_id") != user_id:
+                raise EmailTaken(data["email"])
+            if old_email and email_id(old_email) != new_index.id:
+                transaction.delete(self._email_index(old_email))
+            transaction.set(new_index, {"email": data["email"], "user_id": user_id})
+            transaction.update(ref, data)
+
+        update(self.client.transaction())
+
+    def index_user_email(self, user_id, email):
+        from firebase_admin import firestore
+
+        index = self._email_index(email)
+
+        @firestore.transactional
+        def claim(transaction):
+            snap = index.get(transaction=transaction)
+            if snap.exists:
+                return snap.get("user_id") == user_id
+            transaction.create(index, {"email": email, "user_id": user_id})
+            return True
+
+        return claim(self.client.transaction())
+
+    def list_departments(self, user_id):
+        return [_with_id(doc.to_dict(), "dep_id", doc.id)
+                for doc in self._departments(user_id).stream()]
+
+    def add_department(self, user_id, data):
+        _, ref = self._departments(user_id).add(data)
+        return ref.id
+
+    def delete_department(self, user_id, dep_id):
+        self._departments(user_id).document(dep_id).delete()
+
+    def get_invoice(self, doc_id):
+        doc = self.client.collection(INVOICES).document(doc_id).get()
+        return _with_id(doc.to_dict(), "doc_id", doc.id) if doc.exists else None
+
+    def list_invoices(self, created_by=None, from_date=None, to_date=None, client_search=None,
+                      department=None, fields=None, batch_size=None):
+        query = self.client.collection(INVOICES)
+        if fields is not None:
+            query = query.select(_with_field(fields, "invoice_date") if batch_size else fields)
+        if created_by is not None:
+            query = query.where("created_by", "==", created_by)
+        if client_search:
+            query = _where_tokens(query, *client_search[:2])
+        if department:
+            query = query.where("departments", "array_contains", department)
+        if from_date:
+            query = query.where("invoice_date", ">=", from_date)
+        if to_date:
+            query = query.where("invoice_date", "<=", to_date)
+
+        if not batch_size:
+            for doc in query.stream():
+                yield _with_id(doc.to_dict(), "doc_id", doc.id)
+            return
+
+        query = query.order_by("invoice_date").order_by("__name__").limit(batch_size)
+        cursor = None
+        while True:
+            page = query if cursor is None else query.start_after(cursor)
+            docs = page.get()
+            for doc in docs:
+                yield _with_id(doc.to_dict(), "doc_id", doc.id)
+            if len(docs) < batch_size:
+                return
+            cursor = {"invoice_date": docs[-1].get("invoice_date"), "__name__": docs[-1].id}
+
+    def page_invoices(self, limit, start_after=None, end_before=None, created_by_in=None,
+                      client_search=None, fields=None):
+        query = self.client.collection(INVOICES)
+        if fields is not None:
+            query = query.select(_with_cursor_field(fields))
+        if created_by_in is not None:
+            query = query.where("created_by", "in", list(created_by_in))
+        if client_search:
+            query = _where_tokens(query, *client_search[:2])
+        query = query.order_by("created_by").order_by("__name__")
+
+        if end_before is not None:
+            created_by, doc_id = end_before
+            query = query.end_before({"created_by": created_by, "__name__": doc_id})
+            docs = query.limit_to_last(limit).get()
+        else:
+            if start_after is not None:
+                created_by, doc_id = start_after
+                query = query.start_after({"created_by": created_by, "__name__": doc_id})
+            docs = query.limit(limit).stream()
+
+        return [_with_id(doc.to_dict(), "doc_id", doc.id) for doc in docs]
+
+    def _invoice_stats(self, user_id):
+        return self.client.collection(USERS).document(user_id).collection(INVOICE_STATS)
+
+    def _write_stats(self, writer, user_id, deltas):
+        """Queue server-side increments of a tenant's aggregates on a batch or transaction."""
+        from firebase_admin import firestore
+
+        if not user_id:
+            return
+        for scope, buckets in deltas.items():
+            data = {"department_name": scope}
+            for bucket, delta in buckets.items():
+                target = data if bucket is None else data.setdefault("months", {}).setdefault(bucket, {})
+                for field in STATS_FIELDS:
+                    target[field] = firestore.Increment(delta[field])
+            writer.set(self._invoice_stats(user_id).document(stats_id(scope)), data, merge=True)
+
+    def add_invoice(self, data):
+        ref = self.client.collection(INVOICES).document()
+        batch = self.client.batch()
+        batch.set(ref, data)
+        self._write_stats(batch, data.get("created_by"), invoice_deltas(new=data))
+        batch.commit()
+        return ref.id
+
+    def _commit_chunk(self, chunk, deltas):
+        batch = self.client.batch()
+        refs = []
+        for _, data in chunk:
+            ref = self.client.collection(INVOICES).document()
+            batch.set(ref, data)
+            refs.append(ref)
+        for user_id, user_deltas in deltas.items():
+            self._write_stats(batch, user_id, user_deltas)
+        try:
+            batch.commit()
+        except Exception:
+            log.exception("Bulk invoice batch of %d failed", len(chunk))
+            return [None] * len(chunk)
+        return [ref.id for ref in refs]
+
+    def add_invoices(self, invoices):
+        ids = [None] * len(invoices)
+        # Aggregates are server-side increments, so batches commute and can
+        # be committed concurrently.
+        with ThreadPoolExecutor(max_workers=IMPORT_COMMIT_WORKERS) as pool:
+            chunks = list(write_chunks(invoices))
+            results = pool.map(lambda c: self._commit_chunk(*c), chunks)
+            for (chunk, _), chunk_ids in zip(chunks, results):
+                for (position, _), doc_id in zip(chunk, chunk_ids):
+                    ids[position] = doc_id
+        return ids
+
+    def update_invoice(self, doc_id, data):
+        from firebase_admin import firestore
+
+        ref = self.client.collection(INVOICES).document(doc_id)
+
+        @firestore.transactional
+        def update(transaction):
+            old = ref.get(transaction=transaction).to_dict()
+            if old is None:
+                raise KeyError(f"{INVOICES}/{doc_id} does not exist")
+            transaction.update(ref, data)
+            self._write_stats(transaction, old.get("created_by"), invoice_deltas(old, {**old, **data}))
+
+        update(self.client.transaction())
+
+    def delete_invoice(self, doc_id):
+        from firebase_admin import firestore
+
+        ref = self.client.collection(INVOICES).document(doc_id)
+
+        @firestore.transactional
+        def delete(transaction):
+            old = ref.get(transaction=transaction).to_dict()
+            if old is None:
+                return
+            transaction.delete(ref)
+            self._write_stats(transaction, old.get("created_by"), invoice_deltas(old=old))
+
+        delete(self.client.transaction())
+
+    def get_invoice_stats(self, user_ids):
+        refs = [self._invoice_stats(uid).document(TENANT_STATS) for uid in set(user_ids)]
+        return {doc.reference.parent.parent.id: _stats(doc.to_dict())
+                for doc in self.client.get_all(refs)}
+
+    def list_invoice_stats(self, user_id):
+        stats = {None: _stats(None)}
+        for doc in self._invoice_stats(user_id).stream():
+            data = _stats(doc.to_dict())
+            stats[None if doc.id == TENANT_STATS else data["department_name"]] = data
+        return stats
+
+    def replace_invoice_stats(self, user_id, stats):
+        batch = self.client.batch()
+        for doc in self._invoice_stats(user_id).stream():
+            batch.delete(doc.reference)
+        for scope, data in stats.items():
+            batch.set(self._invoice_stats(user_id).document(stats_id(scope)), data)
+        batch.commit()
+
+    def _counter(self, user_id, prefix):
+        return (self.client.collection(USERS).document(user_id)
+                .collection(INVOICE_COUNTERS).document(counter_id(prefix)))
+
+    def get_invoice_serial(self, user_id, prefix):
+        snap = self._counter(user_id, prefix).get()
+        return snap.get("last_serial") if snap.exists else None
+
+    def allocate_invoice_serial(self, user_id, prefix, seed=None, count=1):
+        from firebase_admin import firestore
+
+        ref = self._counter(user_id, prefix)
+
+        @firestore.transactional
+        def allocate(transaction):
+            snap = ref.get(transaction=transaction)
+            if snap.exists:
+                last = snap.get("last_serial")
+            else:
+                last = seed() if seed else 0
+            transaction.set(ref, {"prefix": prefix, "last_serial": last + count})
+            return last + 1
+
+        return allocate(self.client.transaction())
+
+    def raise_invoice_serial(self, user_id, prefix, serial):
+        from firebase_admin import firestore
+
+        ref = self._counter(user_id, prefix)
+
+        @firestore.transactional
+        def raise_to(transaction):
+            snap = ref.get(transaction=transaction)
+            if not snap.exists or snap.get("last_serial") < serial:
+                transaction.set(ref, {"prefix": prefix, "last_serial": serial})
+
+        raise_to(self.client.transaction())
+
+    def get_versions(self, keys):
+        refs = [self.client.collection(PAGE_VERSIONS).document(key) for key in dict.fromkeys(keys)]
+        return {doc.id: (doc.get("version"), doc.get("updated_at"))
+                for doc in self.client.get_all(refs) if doc.exists}
+
+    def bump_versions(self, keys):
+        from firebase_admin import firestore
+
+        batch = self.client.batch()
+        now = time.time()
+        for key in dict.fromkeys(keys):
+            batch.set(self.client.collection(PAGE_VERSIONS).document(key),
+                      {"version": firestore.Increment(1), "updated_at": now}, merge=True)
+        batch.commit()
+
+
+# ------------------------
+# SQLite backend
+# ------------------------
+_ID_ALPHABET = string.ascii_letters + string.digits
+
+
+def new_id():
+    """Random 20 character id, same shape as a Firestore auto id."""
+    return "".join(secrets.choice(_ID_ALPHABET) for _ in range(20))
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    raise TypeError(f"Cannot store {type(value).__name__}")
+
+
+def _decode(obj):
+    if "__datetime__" in obj and len(obj) == 1:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+_FIELD_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _select(fields):
+    """
+    SQL expression for the ``data`` column limited to ``fields``.
+
+    The projection happens inside SQLite so only the selected fields are
+    decoded in Python. ``json_patch`` onto ``{}`` drops missing fields
+    instead of returning them as null, like a Firestore projection. Only
+    ``json_extract`` is used (SQLite 3.9+, unlike ``->`` which needs 3.38);
+    it returns JSON booleans as 0/1, so those are rebuilt with ``json()``.
+    """
+    if fields is None:
+        return "data"
+    parts = []
+    for field in fields:
+        if not _FIELD_RE.match(field):
+            raise ValueError(f"Invalid field name: {field!r}")
+        path = f"'$.{field}'"
+        parts.append(f"'{field}', CASE json_type(data, {path}) WHEN 'true' THEN json('true') "
+                     f"WHEN 'false' THEN json('false') ELSE json_extract(data, {path}) END")
+    return f"json_patch('{{}}', json_object({', '.join(parts)}))"
+
+
+def _tokens_clause(field, value):
+    """SQL condition and params for a ``client_search`` filter."""
+    if not _FIELD_RE.match(field):
+        raise ValueError(f"Invalid field name: {field!r}")
+    values = list(value) if isinstance(value, (list, tuple)) else [value]
+    clause = (f"EXISTS (SELECT 1 FROM json_each(data, '$.{field}') "
+              f"WHERE value IN ({', '.join('?' * len(values))}))")
+    return clause, values
+
+
+def dumps(data):
+    return json.dumps(data, default=_encode)
+
+
+def loads(text):
+    return json.loads(text, object_hook=_decode)
+
+
+class SQLiteStore(Store):
+    """
+    Document store on top of SQLite.
+
+    Documents live in one table keyed by (collection, id) where
+    ``collection`` is a Firestore-style path such as ``users/<id>/departments``.
+    Queried fields get expression indexes so lookups stay indexed like they
+    would be on Firestore.
+    """
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conns = ProcessLocal(self._connect)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                collection TEXT NOT NULL,
+                id TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (collection, id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_documents_created_by
+                ON documents (collection, json_extract(data, '$.created_by'));
+            CREATE INDEX IF NOT EXISTS idx_documents_created_by_date
+                ON documents (collection, json_extract(data, '$.created_by'),
+                              json_extract(data, '$.invoice_date'));
+            CREATE INDEX IF NOT EXISTS idx_documents_email
+                ON documents (collection, json_extract(data, '$.email'));
+        """)
+        return conn
+
+    @property
+    def _conn(self):
+        return self._conns.get()
+
+    # ---------- low level ----------
+    @contextmanager
+    def _transaction(self):
+        """Serialize a read-modify-write against other threads and processes."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _get(self, collection, doc_id, fields=None):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_select(fields)} FROM documents WHERE collection = ? AND id = ?",
+                (collection, doc_id),
+            ).fetchone()
+        return loads(row[0]) if row else None
+
+    def _query(self, collection, where="", params=(), limit=None, fields=None):
+        sql = f"SELECT id, {_select(fields)} FROM documents WHERE collection = ?"
+        if where:
+            sql += " AND " + where
+        sql += " ORDER BY id"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._conn.execute(sql, (collection, *params)).fetchall()
+        return [(doc_id, loads(data)) for doc_id, data in rows]
+
+    def _set(self, collection, doc_id, data):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (collection, id, data) VALUES (?, ?, ?)",
+                (collection, doc_id, dumps(data)),
+            )
+
+    def _add(self, collection, data):
+        doc_id = new_id()
+        self._set(collection, doc_id, data)
+        return doc_id
+
+    def _update(self, collection, doc_id, data):
+        with self._lock:
+            current = self._get(collection, doc_id)
+            if current is None:
+                raise KeyError(f"{collection}/{doc_id} does not exist")
+            current.update(data)
+            self._set(collection, doc_id, current)
+
+    def _delete(self, collection, doc_id):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM documents WHERE collection = ? AND id = ?",
+                (collection, doc_id),
+            )
+
+    # ---------- users ----------
+    def get_user(self, user_id, fields=None):
+        data = self._get(USERS, user_id, fields=fields)
+        return _with_id(data, "user_id", user_id) if data is not None else None
+
+    def find_user_by_email(self, email, fields=None):
+        index = self._get(USER_EMAILS, email_id(email))
+        if index is not None:
+            return self.get_user(index["user_id"], fields=fields)
+
+        for doc_id, data in self._query(USERS, "json_extract(data, '$.email') = ?", (email,),
+                                        limit=1, fields=fields):
+            self.index_user_email(doc_id, email)
+            return _with_id(data, "user_id", doc_id)
+        return None
+
+    def list_users(self, fields=None):
+        return [_with_id(data, "user_id", doc_id) for doc_id, data in self._query(USERS, fields=fields)]
+
+    def get_users(self, user_ids, fields=None):
+        user_ids = list(set(user_ids))
+        if not user_ids:
+            return {}
+        marks = ", ".join("?" * len(user_ids))
+        rows = self._query(USERS, f"id IN ({marks})", user_ids, fields=fields)
+        return {doc_id: _with_id(data, "user_id", doc_id) for doc_id, data in rows}
+
+    def add_user(self, data):
+        with self._transaction():
+            if data.get("email"):
+                if self._get(USER_EMAILS, email_id(data["email"])) is not None:
+                    raise EmailTaken(data["email"])
+                user_id = self._add(USERS, data)
+                self._set(USER_EMAILS, email_id(data["email"]), {"email": data["email"], "user_id": user_id})
+            else:
+                user_id = self._add(USERS, data)
+        return user_id
+
+    def update_user(self, user_id, data):
+        if not data.get("email"):
+            self._update(USERS, user_id, data)
+            return
+
+        index_id = email_id(data["email"])
+        with self._transaction():
+            taken = self._get(USER_EMAILS, index_id)
+            if taken is not None and taken["user_id"] != user_id:
+                raise EmailTaken(data["email"])
+            old_email = (self._get(USERS, user_id) or {}).get("email")
+            if old_email and email_id(old_email) != index_id:
+                self._delete(USER_EMAILS, email_id(old_email))
+            self._set(USER_EMAILS, index_id, {"email": data["email"], "user_id": user_id})
+            self._update(USERS, user_id, data)
+
+    def index_user_email(self, user_id, email):
+        with self._transaction():
+            taken = self._get(USER_EMAILS, email_id(email))
+            if taken is not None:
+                return taken["user_id"] == user_id
+            self._set(USER_EMAILS, email_id(email), {"email": email, "user_id": user_id})
+            return True
+
+    # ---------- departments ----------
+    def list_departments(self, user_id):
+        path = f"{USERS}/{user_id}/{DEPARTMENTS}"
+        return [_with_id(data, "dep_id", doc_id) for doc_id, data in self._query(path)]
+
+    def add_department(self, user_id, data):
+        return self._add(f"{USERS}/{user_id}/{DEPARTMENTS}", data)
+
+    def delete_department(self, user_id, dep_id):
+        self._delete(f"{USERS}/{user_id}/{DEPARTMENTS}", dep_id)
+
+    # ---------- invoices ----------
+    def get_invoice(self, doc_id):
+        data = self._get(INVOICES, doc_id)
+        return _with_id(data, "doc_id", doc_id) if data is not None else None
+
+    def list_invoices(self, created_by=None, from_date=None, to_date=None, client_search=None,
+                      department=None, fields=None, batch_size=None):
+        where, params = [], []
+        if created_by is not None:
+            where.append("json_extract(data, '$.created_by') = ?")
+            params.append(created_by)
+        if client_search:
+            clause, values = _tokens_clause(*client_search[:2])
+            where.append(clause)
+            params += values
+        if department:
+            where.append("EXISTS (SELECT 1 FROM json_each(data, '$.departments') WHERE value = ?)")
+            params.append(department)
+        if from_date:
+            where.append("json_extract(data, '$.invoice_date') >= ?")
+            params.append(from_date)
+        if to_date:
+            where.append("json_extract(data, '$.invoice_date') <= ?")
+            params.append(to_date)
+
+        if not batch_size:
+            for doc_id, data in self._query(INVOICES, " AND ".join(where), params, fields=fields):
+                yield _with_id(data, "doc_id", doc_id)
+            return
+
+        date = "json_extract(data, '$.invoice_date')"
+        where.append(f"{date} IS NOT NULL")
+        sql = (f"SELECT id, {date}, {_select(fields)} FROM documents WHERE collection = ? AND "
+               + " AND ".join(where))
+        cursor = None
+        while True:
+            page_sql, page_params = sql, [INVOICES, *params]
+            if cursor is not None:
+                page_sql += f" AND ({date}, id) > (?, ?)"
+                page_params += cursor
+            page_sql += f" ORDER BY {date}, id LIMIT {int(batch_size)}"
+            with self._lock:
+                rows = self._conn.execute(page_sql, page_params).fetchall()
+            for doc_id, _, data in rows:
+                yield _with_id(loads(data), "doc_id", doc_id)
+            if len(rows) < batch_size:
+                return
+            cursor = [rows[-1][1], rows[-1][0]]
+
+    def page_invoices(self, limit, start_after=None, end_before=None, created_by_in=None,
+                      client_search=None, fields=None):
+        if fields is not None:
+            fields = _with_cursor_field(fields)
+        key = "(json_extract(data, '$.created_by'), id)"
+        sql = f"SELECT id, {_select(fields)} FROM documents WHERE collection = ?"
+        params = [INVOICES]
+
+        if created_by_in is not None:
+            created_by_in = list(created_by_in)
+            sql += " AND json_extract(data, '$.created_by') IN (%s)" % ", ".join("?" * len(created_by_in))
+            params += created_by_in
+        if client_search:
+            clause, values = _tokens_clause(*client_search[:2])
+            sql += " AND " + clause
+            params += values
+
+        if end_before is not None:
+            sql += f" AND {key} < (?, ?) ORDER BY json_extract(data, '$.created_by') DESC, id DESC"
+            params += list(end_before)
+        else:
+            if start_after is not None:
+                sql += f" AND {key} > (?, ?)"
+                params += list(start_after)
+            sql += " ORDER BY json_extract(data, '$.created_by'), id"
+        sql += f" LIMIT {int(limit)}"
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        if end_before is not None:
+            rows.reverse()
+        return [_with_id(loads(data), "doc_id", doc_id) for doc_id, data in rows]
+
+    def _apply_stats(self, user_id, deltas):
+        """Read-modify-write a tenant's aggregates; call inside ``_transaction``."""
+        if not user_id:
+            return
+        path = f"{USERS}/{user_id}/{INVOICE_STATS}"
+        for scope, buckets in deltas.items():
+            stats = _stats(self._get(path, stats_id(scope)) or empty_stats(scope))
+            self._set(path, stats_id(scope), apply_deltas(stats, buckets))
+
+    def add_invoice(self, data):
+        with self._transaction():
+            doc_id = self._add(INVOICES, data)
+            self._apply_stats(data.get("created_by"), invoice_deltas(new=data))
+        return doc_id
+
+    def add_invoices(self, invoices):
+        ids = [None] * len(invoices)
+        for chunk, deltas in write_chunks(invoices):
+            try:
+                with self._transaction():
+                    chunk_ids = [self._add(INVOICES, data) for _, data in chunk]
+                    for user_id, user_deltas in deltas.items():
+                        self._apply_stats(user_id, user_deltas)
+            except sqlite3.Error:
+                log.exception("Bulk invoice batch of %d failed", len(chunk))
+                continue
+            for (position, _), doc_id in zip(chunk, chunk_ids):
+                ids[position] = doc_id
+        return ids
+
+    def update_invoice(self, doc_id, data):
+        with self._transaction():
+            old = self._get(INVOICES, doc_id)
+            self._update(INVOICES, doc_id, data)
+            self._apply_stats(old.get("created_by"), invoice_deltas(old, {**old, **data}))
+
+    def delete_invoice(self, doc_id):
+        with self._transaction():
+            old = self._get(INVOICES, doc_id)
+            if old is None:
+                return
+            self._delete(INVOICES, doc_id)
+            self._apply_stats(old.get("created_by"), invoice_deltas(old=old))
+
+    def get_invoice_stats(self, user_ids):
+        return {uid: _stats(self._get(f"{USERS}/{uid}/{INVOICE_STATS}", TENANT_STATS))
+                for uid in set(user_ids)}
+
+    def list_invoice_stats(self, user_id):
+        stats = {None: _stats(None)}
+        for doc_id, data in self._query(f"{USERS}/{user_id}/{INVOICE_STATS}"):
+            data = _stats(data)
+            stats[None if doc_id == TENANT_STATS else data["department_name"]] = data
+        return stats
+
+    def replace_invoice_stats(self, user_id, stats):
+        path = f"{USERS}/{user_id}/{INVOICE_STATS}"
+        with self._transaction():
+            with self._lock:
+                self._conn.execute("DELETE FROM documents WHERE collection = ?", (path,))
+            for scope, data in stats.items():
+                self._set(path, stats_id(scope), data)
+
+    # ---------- invoice number counters ----------
+    def get_invoice_serial(self, user_id, prefix):
+        current = self._get(f"{USERS}/{user_id}/{INVOICE_COUNTERS}", counter_id(prefix))
+        return current["last_serial"] if current is not None else None
+
+    def allocate_invoice_serial(self, user_id, prefix, seed=None, count=1):
+        path = f"{USERS}/{user_id}/{INVOICE_COUNTERS}"
+        doc_id = counter_id(prefix)
+        with self._transaction():
+            current = self._get(path, doc_id)
+            if current is not None:
+                last = current["last_serial"]
+            else:
+                last = seed() if seed else 0
+            self._set(path, doc_id, {"prefix": prefix, "last_serial": last + count})
+        return last + 1
+
+    def raise_invoice_serial(self, user_id, prefix, serial):
+        path = f"{USERS}/{user_id}/{INVOICE_COUNTERS}"
+        doc_id = counter_id(prefix)
+        with self._transaction():
+            current = self._get(path, doc_id)
+            if current is None or current["last_serial"] < serial:
+                self._set(path, doc_id, {"prefix": prefix, "last_serial": serial})
+
+    def get_versions(self, keys):
+        versions = {}
+        for key in dict.fromkeys(keys):
+            data = self._get(PAGE_VERSIONS, key)
+            if data is not None:
+                versions[key] = (data["version"], data["updated_at"])
+        return versions
+
+    def bump_versions(self, keys):
+        now = time.time()
+        with self._transaction():
+            for key in dict.fromkeys(keys):
+                current = self._get(PAGE_VERSIONS, key)
+                self._set(PAGE_VERSIONS, key, {"version": (current or {}).get("version", 0) + 1,
+                                               "updated_at": now})
+
+
+# ------------------------
+# Backend selection
+# ------------------------
+def create_store(backend=None):
+    """
+    Build the store named by ``backend`` or the ``DATASTORE`` env var.
+
+    ``firestore`` (default) reads ``FIREBASE_CREDENTIALS``
+    (default ``serviceAccountKey.json``). ``sqlite`` reads ``SQLITE_PATH``
+    (default ``:memory:``) and never touches Firebase credentials.
+    """
+    backend = (backend or os.getenv("DATASTORE", "firestore")).lower()
+
+    if backend == "firestore":
+        return FirestoreStore(os.getenv("FIREBASE_CREDENTIALS", "serviceAccountKey.json"))
+    if backend == "sqlite":
+        return SQLiteStore(os.getenv("SQLITE_PATH", ":memory:"))
+
+    raise ValueError(f"Unknown DATASTORE backend: {backend!r}")
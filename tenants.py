@@ -0,0 +1,70 @@
+"""
+Per-tenant context shared by most user-facing routes.
+
+Creating, viewing, downloading and numbering invoices all need the owner's
+profile and their department → sub-company mapping. Both change rarely, so
+they are kept in a size-bounded TTL cache instead of being read from the
+datastore on every request. Routes that change them call
+``invalidate_tenant``; the TTL bounds how long other worker processes can
+serve a stale copy. Callers that must not see a copy older than the
+tenant's page version stamp (pages kept in the shared page cache) pass it
+as ``version``, and a copy loaded at another version is reloaded.
+"""
+import os
+from collections import namedtuple
+
+from cache import TTLCache
+from fanout import gather
+
+TENANT_CACHE_SIZE = int(os.getenv("TENANT_CACHE_SIZE", "512"))
+TENANT_CACHE_TTL = float(os.getenv("TENANT_CACHE_TTL", "60"))
+
+# Profile fields kept in the context; the logo blob and password hash are not
+PROFILE_FIELDS = [
+    "company_name", "company_address", "email", "phone_no",
+    "owner_name", "company_gst", "logo_hash"
+]
+
+# profile: user dict limited to PROFILE_FIELDS (plus "user_id")
+# departments: department dicts as stored, each carrying "dep_id"
+# sub_companies: department name → sub-company name, first department wins
+TenantContext = namedtuple("TenantContext", ["profile", "departments", "sub_companies"])
+
+_cache = TTLCache(TENANT_CACHE_SIZE, TENANT_CACHE_TTL)
+
+
+def load_tenant_context(store, user_id):
+    """Read a tenant's context from ``store``, or None if the user does not exist."""
+    profile, departments = gather(
+        lambda: store.get_user(user_id, fields=PROFILE_FIELDS),
+        lambda: store.list_departments(user_id),
+    )
+    if profile is None:
+        return None
+
+    sub_companies = {}
+    for dep in departments:
+        sub_companies.setdefault(dep.get("department_name"), dep.get("sub_company_name"))
+    return TenantContext(profile, departments, sub_companies)
+
+
+def get_tenant_context(store, user_id, version=None):
+    """
+    Cached ``TenantContext`` for ``user_id``, or None if the user does not exist.
+
+    With ``version`` (the ``tenant:`` page stamp), a copy cached at another
+    version, or without one, is read again. The returned objects are shared
+    between requests and must not be modified.
+    """
+    cached = _cache.get(user_id)
+    if cached is not None and (version is None or cached[0] == version):
+        return cached[1]
+    context = load_tenant_context(store, user_id)
+    if context is not None:
+        _cache.set(user_id, (version, context))
+    return context
+
+
+def invalidate_tenant(user_id):
+    """Drop the cached context after the user's profile or departments change."""
+    _cache.pop(user_id)
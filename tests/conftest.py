@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+os.environ["DATASTORE"] = "sqlite"
+os.environ["SQLITE_PATH"] = ":memory:"
+os.environ.setdefault("BLOB_STORE_DIR", tempfile.mkdtemp(prefix="test-blobs-"))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("ADMIN_EMAIL", "admin@test.local")
+os.environ.setdefault("ADMIN_PASSWORD", "admin-password")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+from instrumentation import InstrumentedStore  # noqa: E402
+from page_cache import PageCache  # noqa: E402
+from storage import SQLiteStore  # noqa: E402
+
+
+@pytest.fixture
+def store():
+    """A fresh in-memory SQLite store."""
+    return SQLiteStore(":memory:")
+
+
+@pytest.fixture
+def db(monkeypatch, store):
+    """The app wired to a fresh store, as the routes see it."""
+    db = InstrumentedStore(store)
+    monkeypatch.setattr(app_module, "db", db)
+    monkeypatch.setattr(app_module, "page_cache", PageCache(db))
+    return db
+
+
+@pytest.fixture
+def tenant(db):
+    """Id of a user with "Sales" and "Salary" departments."""
+    user_id = db.add_user({"company_name": "Acme", "email": "owner@acme.test", "owner_name": "Owner"})
+    db.add_department(user_id, {"department_name": "Sales", "sub_company_name": "Acme Sales"})
+    db.add_department(user_id, {"department_name": "Salary", "sub_company_name": "Acme Payroll"})
+    return user_id
+
+
+@pytest.fixture
+def client(tenant):
+    """Test client logged in as ``tenant``."""
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session["role"] = "user"
+        session["user_id"] = tenant
+    return client
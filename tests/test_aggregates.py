@@ -0,0 +1,51 @@
+from aggregates import summarize
+
+
+def invoice(department, total, date="2025-04-02"):
+    return {"created_by": "u1", "departments": [department], "invoice_date": date,
+            "final_total": total, "gst_amount": round(total * 18 / 118, 2)}
+
+
+def totals(store, scope):
+    stats = store.list_invoice_stats("u1").get(scope)
+    if stats is None:
+        return None
+    return stats["count"], stats["final_total"], {m: b["count"] for m, b in stats["months"].items()}
+
+
+def test_create_counts_tenant_and_department(store):
+    store.add_invoice(invoice("Sales", 118.0))
+    store.add_invoice(invoice("Sales", 236.0, date="2025-05-10"))
+
+    assert totals(store, None) == (2, 354.0, {"2025-04": 1, "2025-05": 1})
+    assert totals(store, "Sales") == (2, 354.0, {"2025-04": 1, "2025-05": 1})
+    assert store.get_invoice_stats(["u1"])["u1"]["count"] == 2
+
+
+def test_bulk_create_matches_one_by_one(store):
+    invoices = [invoice("Sales" if n % 2 else "Salary", 10.1 * n) for n in range(1, 8)]
+    store.add_invoices(invoices)
+
+    assert store.list_invoice_stats("u1") == summarize(invoices)
+
+
+def test_edit_moves_totals_between_departments_and_months(store):
+    doc_id = store.add_invoice(invoice("Sales", 118.0))
+
+    store.update_invoice(doc_id, {"departments": ["Salary"], "final_total": 59.0, "invoice_date": "2025-06-01"})
+
+    assert totals(store, None) == (1, 59.0, {"2025-06": 1})
+    assert totals(store, "Sales") == (0, 0, {})
+    assert totals(store, "Salary") == (1, 59.0, {"2025-06": 1})
+
+
+def test_delete_removes_totals(store):
+    kept = invoice("Sales", 118.0)
+    store.add_invoice(kept)
+    doc_id = store.add_invoice(invoice("Sales", 0.3, date="2025-05-01"))
+
+    store.delete_invoice(doc_id)
+    store.delete_invoice(doc_id)
+
+    assert totals(store, None) == (1, 118.0, {"2025-04": 1})
+    assert store.list_invoice_stats("u1") == summarize([kept])
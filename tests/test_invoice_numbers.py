@@ -0,0 +1,49 @@
+def invoice_form(department):
+    return {
+        "invoice_date": "2025-04-01",
+        "client_name": "Globex",
+        "departments": department,
+        "taxes": ["cgst", "sgst"],
+        "item_name[]": ["Consulting"],
+        "quantity[]": ["1"],
+        "unit_price[]": ["100"],
+    }
+
+
+def invoice_numbers(db, user_id):
+    return sorted(inv["invoice_no"] for inv in db.list_invoices(created_by=user_id, fields=["invoice_no"]))
+
+
+def test_departments_sharing_a_prefix_share_one_series(client, db, tenant):
+    client.post("/create_invoice", data=invoice_form("Sales"))
+    client.post("/create_invoice", data=invoice_form("Salary"))
+    client.post("/create_invoice", data=invoice_form("Sales"))
+
+    assert invoice_numbers(db, tenant) == ["ACM-SAL-001", "ACM-SAL-002", "ACM-SAL-003"]
+
+
+def test_preview_reserves_nothing(client, db, tenant):
+    db.add_invoice({"created_by": tenant, "invoice_no": "ACM-SAL-004", "departments": ["Salary"]})
+
+    for department in ("Sales", "Salary", "Sales"):
+        response = client.post("/generate_invoice_no", json={"department": department})
+        assert response.json["invoice_no"] == "ACM-SAL-005"
+
+    client.post("/create_invoice", data=invoice_form("Sales"))
+    assert invoice_numbers(db, tenant) == ["ACM-SAL-004", "ACM-SAL-005"]
+
+
+def test_import_numbers_after_explicit_and_stored_numbers(client, db, tenant):
+    db.add_invoice({"created_by": tenant, "invoice_no": "ACM-SAL-005", "departments": ["Sales"]})
+    row = {"client_name": "Globex", "invoice_date": "2025-04-01",
+           "items": [{"item_name": "Consulting", "quantity": 1, "unit_price": 100}]}
+
+    response = client.post("/invoices/import", json=[
+        {**row, "departments": "Sales", "invoice_no": "ACM-SAL-007"},
+        {**row, "departments": "Sales"},
+        {**row, "departments": "Salary"},
+    ])
+
+    assert [inv["invoice_no"] for inv in response.json["invoices"]] == ["ACM-SAL-007", "ACM-SAL-008", "ACM-SAL-009"]
+    client.post("/create_invoice", data=invoice_form("Salary"))
+    assert invoice_numbers(db, tenant)[-1] == "ACM-SAL-010"
@@ -0,0 +1,41 @@
+import jobs
+from jobs import JobQueue
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_job_that_keeps_killing_its_worker_fails(tmp_path):
+    clock = FakeClock()
+    queue = JobQueue(str(tmp_path / "jobs.db"), clock=clock)
+    job_id = queue.enqueue("render_pdf", {"doc_id": "x"}, max_attempts=2)
+
+    # Each worker claims the job and dies without completing or failing it
+    assert queue.claim()["attempts"] == 1
+    assert queue.claim() is None
+    clock.now += jobs.JOB_TIMEOUT
+    assert queue.claim()["attempts"] == 2
+
+    clock.now += jobs.JOB_TIMEOUT
+    assert queue.claim() is None
+    job = queue.get(job_id)
+    assert job["status"] == "failed"
+    assert job["attempts"] == 2
+    assert "did not finish" in job["error"]
+
+
+def test_reclaim_skips_exhausted_jobs_to_the_next_runnable_one(tmp_path):
+    clock = FakeClock()
+    queue = JobQueue(str(tmp_path / "jobs.db"), clock=clock)
+    stuck = queue.enqueue("render_pdf", {}, max_attempts=1)
+    queue.claim()
+    clock.now += jobs.JOB_TIMEOUT
+    waiting = queue.enqueue("send_invoice_email", {})
+
+    assert queue.claim()["id"] == waiting
+    assert queue.get(stuck)["status"] == "failed"
@@ -0,0 +1,42 @@
+from page_cache import PageCache
+
+import app as app_module
+
+
+def add_legacy_invoice(db, user_id):
+    """An invoice without a company snapshot, printed from the owner's current profile."""
+    return db.add_invoice({"created_by": user_id, "invoice_no": "ACM-SAL-001", "invoice_date": "2025-04-01",
+                           "client_name": "Globex", "departments": ["Sales"], "taxes": [], "items": [],
+                           "subtotal": 0, "gst_amount": 0, "final_total": 0})
+
+
+def other_worker_writes(db, *scopes):
+    """Bump ``scopes`` the way another process would: no local cache is invalidated."""
+    PageCache(db).bump(*scopes)
+
+
+def test_other_workers_writes_stale_cached_pages(client, db, tenant):
+    legacy = add_legacy_invoice(db, tenant)
+    assert b"Globex" in client.get(f"/invoice/{legacy}").data
+
+    db.update_invoice(legacy, {"client_name": "Initech"})
+    assert b"Globex" in client.get(f"/invoice/{legacy}").data
+    other_worker_writes(db, app_module.invoice_scope(legacy))
+    assert b"Initech" in client.get(f"/invoice/{legacy}").data
+
+
+def test_pages_are_not_rebuilt_from_a_stale_tenant_context(client, db, tenant):
+    legacy = add_legacy_invoice(db, tenant)
+    assert b"Acme Sales" in client.get(f"/invoice/{legacy}").data
+    assert b"Support" not in client.get("/user/dashboard").data
+
+    # Another worker renames a sub-company and adds a department; this
+    # process still holds the tenant context it loaded above
+    dep_id = next(d["dep_id"] for d in db.list_departments(tenant) if d["department_name"] == "Sales")
+    db.delete_department(tenant, dep_id)
+    db.add_department(tenant, {"department_name": "Sales", "sub_company_name": "Acme Retail"})
+    db.add_department(tenant, {"department_name": "Support", "sub_company_name": "Acme Care"})
+    other_worker_writes(db, app_module.tenant_scope(tenant))
+
+    assert b"Acme Retail" in client.get(f"/invoice/{legacy}").data
+    assert b"Support" in client.get("/user/dashboard").data
@@ -0,0 +1,58 @@
+import pytest
+
+from search import client_query, client_search_fields, name_matches, search_term
+
+CLIENTS = ["Acme Traders", "Globex Corporation", "Initech", "Umbrella Pharma"]
+
+
+@pytest.fixture
+def invoices(store):
+    for name in CLIENTS:
+        store.add_invoice({"created_by": "u1", "client_name": name, **client_search_fields(name)})
+    return store
+
+
+def search(store, text, mode):
+    term = search_term(text)
+    query = client_query(term, mode)
+    return sorted(inv["client_name"] for inv in store.list_invoices(created_by="u1", client_search=query)
+                  if query.exact or name_matches(inv["client_name"], term, mode))
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("acm", ["Acme Traders"]),
+    ("TRAD", ["Acme Traders"]),
+    ("acme tr", ["Acme Traders"]),
+    ("corp", ["Globex Corporation"]),
+    ("rade", []),
+])
+def test_prefix(invoices, text, expected):
+    assert search(invoices, text, "prefix") == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("rade", ["Acme Traders"]),
+    ("ech", ["Initech"]),
+    ("x co", ["Globex Corporation"]),
+    ("ma", []),  # shorter than a gram: searched as a prefix
+    ("ph", ["Umbrella Pharma"]),
+    ("pharmacy", []),
+])
+def test_contains(invoices, text, expected):
+    assert search(invoices, text, "contains") == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("globx", ["Globex Corporation"]),
+    ("umbrela", ["Umbrella Pharma"]),
+    ("initehc", ["Initech"]),
+    ("acme tradres", ["Acme Traders"]),
+    ("glbx", []),
+])
+def test_similar(invoices, text, expected):
+    assert search(invoices, text, "similar") == expected
+
+
+def test_pages_apply_the_same_filter(invoices):
+    page = invoices.page_invoices(10, client_search=client_query("glob"))
+    assert [inv["client_name"] for inv in page] == ["Globex Corporation"]
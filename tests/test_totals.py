@@ -0,0 +1,55 @@
+import pytest
+
+from invoice_totals import compute_totals, money, total_mismatches
+
+
+def items(*lines):
+    return [{"item_name": f"Item {n}", "quantity": qty, "unit_price": price}
+            for n, (qty, price) in enumerate(lines)]
+
+
+def test_taxes_round_half_up_to_the_paisa():
+    totals = compute_totals(items((1, 0.5)), ["cgst", "sgst"])
+
+    assert totals["tax_breakdown"] == {"cgst": 0.05, "sgst": 0.05}
+    assert (totals["subtotal"], totals["gst_amount"], totals["final_total"]) == (0.5, 0.1, 0.6)
+
+
+def test_line_totals_do_not_drift_like_floats():
+    totals = compute_totals(items((3, 0.1), (1, 0.2)), [])
+
+    assert [item["total"] for item in totals["items"]] == [0.3, 0.2]
+    assert totals["subtotal"] == totals["final_total"] == 0.5
+
+
+def test_unit_prices_are_rounded_before_multiplying():
+    totals = compute_totals(items((3, "33.335")), ["cgst"])
+
+    assert totals["subtotal"] == 100.02
+    assert totals["tax_breakdown"] == {"cgst": 9.0}
+    assert totals["final_total"] == 109.02
+
+
+@pytest.mark.parametrize("value", ["abc", "nan", "inf", None])
+def test_money_rejects_non_amounts(value):
+    with pytest.raises(ValueError):
+        money(value)
+
+
+def test_created_invoice_stores_exact_totals(client, db, tenant):
+    client.post("/create_invoice", data={
+        "invoice_date": "2025-04-01",
+        "client_name": "Globex",
+        "departments": "Sales",
+        "taxes": ["cgst", "sgst"],
+        "item_name[]": ["Pens", "Paper"],
+        "quantity[]": ["3", "1"],
+        "unit_price[]": ["0.10", "0.205"],
+        "final_total": "999",
+    })
+
+    [invoice] = db.list_invoices(created_by=tenant)
+    assert invoice["subtotal"] == 0.51
+    assert invoice["tax_breakdown"] == {"cgst": 0.05, "sgst": 0.05}
+    assert invoice["final_total"] == 0.61
+    assert total_mismatches(invoice) == []
@@ -0,0 +1,62 @@
+import io
+import os
+
+from blobstore import create_blob_store
+from logos import variant_key
+from passwords import hash_password
+from storage import USER_EMAILS, USERS, email_id
+
+import app as app_module
+
+LOGO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static", "company_logo.jpg")
+
+
+def add_unindexed_user(store, email, password):
+    """A user written before the ``user_emails`` index existed."""
+    return store._add(USERS, {"email": email, "owner_name": "Legacy", "password": hash_password(password)})
+
+
+def test_find_user_by_email_indexes_users_missing_from_the_index(store):
+    user_id = add_unindexed_user(store, "legacy@acme.test", "secret")
+
+    user = store.find_user_by_email("legacy@acme.test", fields=["owner_name"])
+
+    assert user == {"owner_name": "Legacy", "user_id": user_id}
+    assert store._get(USER_EMAILS, email_id("legacy@acme.test"))["user_id"] == user_id
+    assert store.find_user_by_email("nobody@acme.test") is None
+
+
+def test_users_missing_from_the_index_can_log_in(db, store):
+    user_id = add_unindexed_user(store, "legacy@acme.test", "secret")
+    client = app_module.app.test_client()
+
+    response = client.post("/login", data={"email": "legacy@acme.test", "password": "secret"})
+
+    assert response.headers["Location"].endswith("/user/dashboard")
+    with client.session_transaction() as session:
+        assert session["user_id"] == user_id
+
+
+def registration(email, logo):
+    return {
+        "owner_name": "Owner", "email": email, "company_name": "Acme", "company_address": "1 Road",
+        "phone_no": "9999999999", "company_gst": "27AAPFU0939F1ZV", "password": "secret",
+        "logo": (io.BytesIO(logo), "logo.png"),
+    }
+
+
+def test_rejected_registration_stores_no_logo(db, monkeypatch, tmp_path):
+    blobs = create_blob_store(str(tmp_path / "blobs"))
+    monkeypatch.setattr(app_module, "blobs", blobs)
+    with open(LOGO_PATH, "rb") as f:
+        logo = f.read()
+    client = app_module.app.test_client()
+    db.add_user({"email": "taken@acme.test", "owner_name": "First"})
+
+    response = client.post("/register", data=registration("taken@acme.test", logo))
+    assert response.headers["Location"].endswith("/register")
+    assert not os.path.exists(blobs.root)
+
+    client.post("/register", data=registration("new@acme.test", logo))
+    user = db.find_user_by_email("new@acme.test", fields=["logo_hash"])
+    assert blobs.get(variant_key(user["logo_hash"], "header")) is not None